@@ -6,29 +6,9 @@
 #============================================================
 
 import os
-import subprocess
-
-#============================================================
-# generate_ncl_plots - call a nclPlotFile via subprocess call
-#============================================================
-def generate_ncl_plots(nclPlotFile):
-   """generate_plots_call - call a nclPlotFile via subprocess call
-   
-   Arguments:
-   nclPlotFile (string) - full path to ncl plotting file name
-   """
-   # check if the nclPlotFile exists - 
-   # don't exit if it does not exists just print a warning.
-   try:
-      pipe = subprocess.Popen(['ncl {0}'.format(nclPlotFile)], shell=True, stdout=subprocess.PIPE)
-      output = pipe.communicate()[0]
-      print('NCL routine {0} \n {1}'.format(nclPlotFile,output))            
-      while pipe.poll() is None:
-         time.sleep(0.5)
-   except OSError as e:
-      print('WARNING',e.errno,e.strerror)
-
-   return 0
+import sys
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+from stage_graph import StageGraph
 
 print "Entered "+__file__
 filename1 = os.environ["DATADIR"]+"/mon/"+os.environ["CASENAME"]+"."+os.environ["zg_var"]+".mon.nc"
@@ -48,14 +28,17 @@ if os.path.isfile( filename1 ) & os.path.isfile( filename2 ):
 #============================================================
 # Call NCL code here
 #============================================================
-      print("COMPUTING ANOMALIES")
-      generate_ncl_plots(os.environ["POD_HOME"]+"/compute_anomalies.ncl")
-
-      print(" N ATLANTIC EOF PLOT")
-      generate_ncl_plots(os.environ["POD_HOME"]+"/eof_natlantic.ncl")
-
-      print(" N PACIFIC EOF PLOT")
-      generate_ncl_plots(os.environ["POD_HOME"]+"/eof_npacific.ncl")
+      anom_file = os.environ["WK_DIR"]+"/model/netCDF/"+os.environ["CASENAME"]+".Z500.ANOMS.nc"
+      stages = StageGraph()
+      # COMPUTING ANOMALIES
+      stages.add_ncl_stage(os.environ["POD_HOME"]+"/compute_anomalies.ncl",
+         inputs = [filename1, filename2], outputs = [anom_file])
+      # N ATLANTIC and N PACIFIC EOF PLOTS, run concurrently
+      stages.add_ncl_stage(os.environ["POD_HOME"]+"/eof_natlantic.ncl", inputs = [anom_file])
+      stages.add_ncl_stage(os.environ["POD_HOME"]+"/eof_npacific.ncl", inputs = [anom_file])
+      failed = stages.run()
+      if failed:
+         print("WARNING: the following steps failed or were not run: "+", ".join(failed))
 
 
 else:
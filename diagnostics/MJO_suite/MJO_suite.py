@@ -6,56 +6,52 @@
 #============================================================
 
 import os
-import subprocess
-
-#============================================================
-# generate_ncl_plots - call a nclPlotFile via subprocess call
-#============================================================
-def generate_ncl_plots(nclPlotFile):
-   """generate_plots_call - call a nclPlotFile via subprocess call
-   
-   Arguments:
-   nclPlotFile (string) - full path to ncl plotting file name
-   """
-   # check if the nclPlotFile exists - 
-   # don't exit if it does not exists just print a warning.
-   try:
-      pipe = subprocess.Popen(['ncl {0}'.format(nclPlotFile)], shell=True, stdout=subprocess.PIPE)
-      output = pipe.communicate()[0]
-      print('NCL routine {0} \n {1}'.format(nclPlotFile,output))            
-      while pipe.poll() is None:
-         time.sleep(0.5)
-   except OSError as e:
-      print('WARNING',e.errno,e.strerror)
-
-   return 0
+import sys
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+from stage_graph import StageGraph
 
 #============================================================
 # Call NCL code here
 #============================================================
-print("OBTAINING DAILY OUTPUT")
-generate_ncl_plots(os.environ["POD_HOME"]+"/daily_netcdf.ncl")
-
-print("COMPUTING DAILY ANOMALIES")
-generate_ncl_plots(os.environ["POD_HOME"]+"/daily_anom.ncl")
-
-print("COMPUTING MJO EOF")
-generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_EOF.ncl")
-
-print("MJO lag plots")
-generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_lag_lat_lon.ncl")
-
-print("MJO spectra")
-generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_spectra.ncl")
-
-if os.path.isfile( os.environ["WK_DIR"]+"/model/netCDF/MJO_PC_INDEX.nc"):
-   print("WARNING: MJO_PC_INDEX.nc already exists!")
-else:
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_EOF_cal.ncl")
-   
-print("MJO life cycle composite")
-generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_life_cycle.ncl")
-generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_life_cycle_v2.ncl")
-
-generate_ncl_plots(os.environ["POD_HOME"]+"/mjo.ncl")
-
+# Steps are run concurrently where their inputs allow, and skipped if their
+# output files are newer than their inputs.
+pod_home = os.environ["POD_HOME"]
+casename = os.environ["CASENAME"]
+in_dir = os.path.join(os.environ["DATADIR"], "day")
+nc_dir = os.path.join(os.environ["WK_DIR"], "model", "netCDF")
+fields = ["pr", "rlut", "u200", "u850", "v200", "v850"]
+
+def daily_file(var, suffix):
+   return os.path.join(nc_dir, casename+"."+var+suffix)
+
+model_files = [os.path.join(in_dir, casename+"."+os.environ[v+"_var"]+".day.nc") \
+   for v in fields]
+daily = dict((v, daily_file(v, ".day.nc")) for v in fields)
+anom = dict((v, daily_file(v, ".day.anom.nc")) for v in fields)
+pc_index = os.path.join(nc_dir, "MJO_PC_INDEX.nc")
+
+stages = StageGraph()
+# OBTAINING DAILY OUTPUT
+stages.add_ncl_stage(pod_home+"/daily_netcdf.ncl", 
+   inputs = model_files, outputs = list(daily.values()))
+# COMPUTING DAILY ANOMALIES
+stages.add_ncl_stage(pod_home+"/daily_anom.ncl",
+   inputs = list(daily.values()), outputs = list(anom.values()))
+# COMPUTING MJO EOF
+stages.add_ncl_stage(pod_home+"/mjo_EOF.ncl", inputs = list(anom.values()))
+# MJO lag plots
+stages.add_ncl_stage(pod_home+"/mjo_lag_lat_lon.ncl", 
+   inputs = [anom["pr"], anom["u850"]])
+# MJO spectra
+stages.add_ncl_stage(pod_home+"/mjo_spectra.ncl", inputs = list(anom.values()))
+stages.add_ncl_stage(pod_home+"/mjo_EOF_cal.ncl", 
+   inputs = [anom["rlut"], anom["u850"], anom["u200"]], outputs = [pc_index])
+# MJO life cycle composite
+for script in ["mjo_life_cycle.ncl", "mjo_life_cycle_v2.ncl"]:
+   stages.add_ncl_stage(pod_home+"/"+script, 
+      inputs = [anom["rlut"], anom["u850"], anom["v850"], pc_index])
+stages.add_ncl_stage(pod_home+"/mjo.ncl", inputs = [daily["u200"]])
+
+failed = stages.run()
+if failed:
+   print("WARNING: the following steps failed or were not run: "+", ".join(failed))
@@ -60,31 +60,10 @@
 #============================================================
 
 import os
-import subprocess
+import sys
 import commands
-
-#============================================================
-# generate_ncl_plots - call a nclPlotFile via subprocess call
-#============================================================
-def generate_ncl_plots(nclPlotFile):
-   """generate_plots_call - call a nclPlotFile via subprocess call
-   
-   Arguments:
-   nclPlotFile (string) - full path to ncl plotting file name
-   """
-   # check if the nclPlotFile exists - 
-   # don't exit if it does not exists just print a warning.
-   try:
-      print("Calling ",nclPlotFile)
-      pipe = subprocess.Popen(['ncl {0}'.format(nclPlotFile)], shell=True, stdout=subprocess.PIPE)
-      output = pipe.communicate()[0]
-      print('NCL routine {0} \n {1}'.format(nclPlotFile,output))            
-      while pipe.poll() is None:
-         time.sleep(0.5)
-   except OSError as e:
-      print('WARNING',e.errno,e.strerror)
-
-   return 0
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+from stage_graph import StageGraph
 
 
 print("=======================================================================")
@@ -121,14 +100,45 @@ if os.path.isfile( os.environ["DATADIR"]+"/day/"+os.environ["prec_file"]) & os.p
 
    os.chdir(os.environ["DATADIR"])
 
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_RMM_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_geop_hgt_comp_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_prec_comp_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_U250_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_daig_Corr_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_EWR_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_fig1_MDTF.ncl")
-   generate_ncl_plots(os.environ["POD_HOME"]+"/mjo_diag_fig2_MDTF.ncl")
+   pod_home = os.environ["POD_HOME"]
+   in_dir = os.path.join(os.environ["DATADIR"], "day")
+   nc_dir = os.path.join(os.environ["WK_DIR"], "model", "netCDF")
+   model = os.environ["CASENAME"]
+   model_file = dict((v, os.path.join(in_dir, os.environ[v+"_file"])) \
+      for v in ["prec", "olr", "u850", "u250", "z250"])
+   rmm_file = os.path.join(nc_dir, model+"_RMMs.txt")
+   geop_files = [os.path.join(nc_dir, f+"_hgt250_"+model+".nc") \
+      for f in ["geop_compositesP", "tstatP"]]
+   prec_file = os.path.join(nc_dir, "PR_composites_"+model+".nc")
+   u250_files = [os.path.join(nc_dir, f) \
+      for f in ["U250_RMS_jetext_updated", "U250_RMS_updated"]]
+   corr_file = os.path.join(nc_dir, "ccr_Z250comp_CMIP5_updated")
+   ewr_file = os.path.join(nc_dir, "EWratio_wf_CMIP5_updated")
+
+   # Steps are run concurrently where their inputs allow (eg. the composites
+   # only need the RMM index), and skipped if their outputs are up to date.
+   stages = StageGraph()
+   stages.add_ncl_stage(pod_home+"/mjo_diag_RMM_MDTF.ncl", 
+      inputs = [model_file["olr"], model_file["u850"], model_file["u250"]], 
+      outputs = [rmm_file])
+   stages.add_ncl_stage(pod_home+"/mjo_diag_geop_hgt_comp_MDTF.ncl",
+      inputs = [model_file["z250"], rmm_file], outputs = geop_files)
+   stages.add_ncl_stage(pod_home+"/mjo_diag_prec_comp_MDTF.ncl",
+      inputs = [model_file["prec"], rmm_file], outputs = [prec_file])
+   stages.add_ncl_stage(pod_home+"/mjo_diag_U250_MDTF.ncl",
+      inputs = [model_file["u250"]], outputs = u250_files)
+   stages.add_ncl_stage(pod_home+"/mjo_daig_Corr_MDTF.ncl",
+      inputs = geop_files[:1], outputs = [corr_file])
+   stages.add_ncl_stage(pod_home+"/mjo_diag_EWR_MDTF.ncl",
+      inputs = [model_file["prec"]], outputs = [ewr_file])
+   stages.add_ncl_stage(pod_home+"/mjo_diag_fig1_MDTF.ncl",
+      inputs = geop_files + [prec_file])
+   stages.add_ncl_stage(pod_home+"/mjo_diag_fig2_MDTF.ncl",
+      inputs = [corr_file, ewr_file] + u250_files)
+   failed = stages.run()
+   if failed:
+      print("WARNING: the following steps failed or were not run: "+", ".join(failed))
+
 #============================================================
 # copy additional html files
 #============================================================
@@ -56,73 +56,79 @@
 #  (and change obs_data/convective_transition_diag/region_0.25x0.25_costal2.5degExcluded.mat)
 # ======================================================================
 # Import standard Python packages
-import glob
 import os
-import json
 
 # Import Python functions specific to Convective Transition Basic Statistics
 from convecTransBasic_util import generate_region_mask
 from convecTransBasic_util import convecTransBasic_calc_model
 from convecTransBasic_util import convecTransBasic_loadAnalyzedData
 from convecTransBasic_util import convecTransBasic_plot
-print("**************************************************")
-print("Excuting Convective Transition Basic Statistics (convecTransBasic.py)......")
-print("**************************************************")
 
 # ======================================================================
-# Load user-specified parameters (usp) for BINNING and PLOTTING
-# This is in the /diagnostics/convective_transition_diag folder under
-#  convecTransBasic_usp_calc.py
-#  & convecTransBasic_usp_plot.py
+# convecTransBasic_run
+#  Bins (or loads previously binned) model data, plots, and returns the binned
+#  output, so convective_transition_diag_v1r3.py can pass it on to
+#  convecTransCriticalCollapse.py in the same Python process
+def convecTransBasic_run():
+    print("**************************************************")
+    print("Excuting Convective Transition Basic Statistics (convecTransBasic.py)......")
+    print("**************************************************")
 
-print("Load user-specified binning parameters..."),
+    # ======================================================================
+    # Load user-specified parameters (usp) for BINNING and PLOTTING
+    # This is in the /diagnostics/convective_transition_diag folder under
+    #  convecTransBasic_usp_calc.py
+    #  & convecTransBasic_usp_plot.py
+    # Both are imported (not run as separate scripts), so no json files are
+    #  written or read
 
-# Create and read user-specified parameters
-os.system("python "+os.environ["POD_HOME"]+"/"+"convecTransBasic_usp_calc.py")
-with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_calc_parameters.json") as outfile:
-    bin_data=json.load(outfile)
-print("...Loaded!")
+    print("Load user-specified binning parameters..."),
+    from convecTransBasic_usp_calc import data as bin_data
+    print("...Loaded!")
 
-print("Load user-specified plotting parameters..."),
-os.system("python "+os.environ["POD_HOME"]+"/"+"convecTransBasic_usp_plot.py")
-with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_plot_parameters.json") as outfile:
-    plot_data=json.load(outfile)
-print("...Loaded!")
+    print("Load user-specified plotting parameters..."),
+    from convecTransBasic_usp_plot import data as plot_data
+    print("...Loaded!")
 
-# ======================================================================
-# Binned data, i.e., convective transition statistics binned in specified intervals of 
-#  CWV and tropospheric temperature (in terms of tave or qsat_int), are saved to avoid 
-#  redoing binning computation every time
-# Check if binned data file exists in wkdir/MDTF_casename/ from a previous computation
-#  if so, skip binning; otherwise, bin data using model output
-#  (see convecTransBasic_usp_calc.py for where the model output locate)
+    # ======================================================================
+    # Binned data, i.e., convective transition statistics binned in specified intervals of 
+    #  CWV and tropospheric temperature (in terms of tave or qsat_int), are saved to avoid 
+    #  redoing binning computation every time
+    # Check if binned data file exists in wkdir/MDTF_casename/ from a previous computation
+    #  if so, skip binning; otherwise, bin data using model output
+    #  (see convecTransBasic_usp_calc.py for where the model output locate)
 
-if (len(bin_data["bin_output_list"])==0 or bin_data["BIN_ANYWAY"]):
+    if (len(bin_data["bin_output_list"])==0 or bin_data["BIN_ANYWAY"]):
 
-    print("Starting binning procedure...")
+        print("Starting binning procedure...")
 
-    if bin_data["PREPROCESS_TA"]==1:
-        print("   Atmospheric temperature pre-processing required")
-    if bin_data["SAVE_TAVE_QSAT_INT"]==1:
-        print("      Pre-processed temperature fields ("\
-            +os.environ["tave_var"]+" & "+os.environ["qsat_int_var"]\
-            +") will be saved to "+bin_data["PREPROCESSING_OUTPUT_DIR"]+"/")
+        if bin_data["PREPROCESS_TA"]==1:
+            print("   Atmospheric temperature pre-processing required")
+        if bin_data["SAVE_TAVE_QSAT_INT"]==1:
+            print("      Pre-processed temperature fields ("\
+                +os.environ["tave_var"]+" & "+os.environ["qsat_int_var"]\
+                +") will be saved to "+bin_data["PREPROCESSING_OUTPUT_DIR"]+"/")
 
-    # Load & pre-process region mask
-    REGION=generate_region_mask(bin_data["REGION_MASK_DIR"]+"/"+bin_data["REGION_MASK_FILENAME"], bin_data["pr_list"][0],bin_data["LAT_VAR"],bin_data["LON_VAR"])
+        # Load & pre-process region mask
+        REGION=generate_region_mask(bin_data["REGION_MASK_DIR"]+"/"+bin_data["REGION_MASK_FILENAME"], bin_data["pr_list"][0],bin_data["LAT_VAR"],bin_data["LON_VAR"],bin_data["REGION_MASK_CACHE_DIR"])
 
-    # Pre-process temperature (if necessary) & bin & save binned results
-    binned_output=convecTransBasic_calc_model(REGION,bin_data["args1"])
+        # Pre-process temperature (if necessary) & bin & save binned results
+        binned_output=convecTransBasic_calc_model(REGION,bin_data["args1"])
 
-else: # Binned data file exists & BIN_ANYWAY=False
-    print("Binned output detected..."),
-    binned_output=convecTransBasic_loadAnalyzedData(bin_data["args2"])
-    print("...Loaded!")
+    else: # Binned data file exists & BIN_ANYWAY=False
+        print("Binned output detected..."),
+        binned_output=convecTransBasic_loadAnalyzedData(bin_data["args2"])
+        print("...Loaded!")
 
-# ======================================================================
-# Plot binning results & save the figure in wkdir/MDTF_casename/.../
-convecTransBasic_plot(binned_output,plot_data["plot_params"],plot_data["args3"],plot_data["args4"])
+    # ======================================================================
+    # Plot binning results & save the figure in wkdir/MDTF_casename/.../
+    convecTransBasic_plot(binned_output,plot_data["plot_params"],plot_data["args3"],plot_data["args4"])
+
+    print("**************************************************")
+    print("Convective Transition Basic Statistics (convecTransBasic.py) Executed!")
+    print("**************************************************")
+
+    return binned_output
 
-print("**************************************************")
-print("Convective Transition Basic Statistics (convecTransBasic.py) Executed!")
-print("**************************************************")
+if __name__=="__main__":
+    convecTransBasic_run()
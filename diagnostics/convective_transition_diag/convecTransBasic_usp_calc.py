@@ -11,7 +11,10 @@
 #
 import json
 import os
+import sys
 import glob
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+from data_catalog import DataCatalog
 
 # ======================================================================
 # START USER SPECIFIED SECTION
@@ -33,6 +36,9 @@ LON_VAR=os.environ["lon_coord"]
 # Region mask directory & filename
 REGION_MASK_DIR=os.environ["OBS_DATA"]
 REGION_MASK_FILENAME="region_0.25x0.25_costal2.5degExcluded.mat"
+# Directory for saving region masks regridded to model grids, which are reused
+#  by later runs on the same grid ("" to disable)
+REGION_MASK_CACHE_DIR=os.path.join(os.environ["WORKING_DIR"],"region_mask_cache")
 # Number of regions
 #  Use grids with 1<=region<=NUMBER_OF_REGIONS in the mask
 NUMBER_OF_REGIONS=4 # default: 4
@@ -50,7 +56,8 @@ REGION_STR=["WPac","EPac","Atl","Ind"]
 PREPROCESSING_OUTPUT_DIR=os.environ["DATADIR"] 
 TAVE_VAR=os.environ["tave_var"]
 QSAT_INT_VAR=os.environ["qsat_int_var"]
-# Number of time-steps in Temperature-preprocessing
+# Number of time-steps in Temperature-preprocessing, and read at a time
+#  when binning
 #  Default: 1000 (use smaller numbers for limited memory)
 time_idx_delta=1000
 # Use 1:tave, or 2:qsat_int as Bulk Tropospheric Temperature Measure 
@@ -65,6 +72,9 @@ BIN_OUTPUT_FILENAME=os.environ["CASENAME"]+".convecTransBasic"
 # ======================================================================
 # Re-do binning even if binned data file detected (default: True)
 BIN_ANYWAY=True
+# Directory for saving binned results for each input file, which are reused
+#  (when re-doing binning) for files that haven't changed ("" to disable)
+BIN_PARTIAL_DIR=os.path.join(os.environ["WORKING_DIR"],"convecTransBasic_partial")
 
 # ======================================================================
 # Column Water Vapor (CWV in mm) range & bin-width
@@ -115,6 +125,7 @@ data["PREPROCESSING_OUTPUT_DIR"]=PREPROCESSING_OUTPUT_DIR
 
 data["REGION_MASK_DIR"]=REGION_MASK_DIR
 data["REGION_MASK_FILENAME"]=REGION_MASK_FILENAME
+data["REGION_MASK_CACHE_DIR"]=REGION_MASK_CACHE_DIR
 
 data["NUMBER_OF_REGIONS"]=NUMBER_OF_REGIONS
 data["REGION_STR"]=REGION_STR
@@ -139,6 +150,7 @@ elif BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==2:
     data["TEMP_VAR"]=QSAT_INT_VAR
 
 data["BIN_ANYWAY"]=BIN_ANYWAY
+data["BIN_PARTIAL_DIR"]=BIN_PARTIAL_DIR
     
 data["CWV_BIN_WIDTH"]=CWV_BIN_WIDTH 
 data["CWV_RANGE_MAX"]=CWV_RANGE_MAX
@@ -163,17 +175,19 @@ data["bin_output_list"]=sorted(glob.glob(data["BIN_OUTPUT_DIR"]+"/"+data["BIN_OU
 # List available netCDF files
 # Assumes that the corresponding files in each list
 #  have the same spatial/temporal coverage/resolution
-pr_list=sorted(glob.glob(MODEL_OUTPUT_DIR+"/"+os.environ["pr_file"]))
-prw_list=sorted(glob.glob(MODEL_OUTPUT_DIR+"/"+os.environ["prw_file"]))
-ta_list=sorted(glob.glob(MODEL_OUTPUT_DIR+"/"+os.environ["ta_file"]))
+catalog = DataCatalog(os.environ["DATADIR"], \
+    os.path.join(os.environ["WORKING_DIR"], "data_catalog"))
+pr_list=catalog.glob(MODEL_OUTPUT_DIR+"/"+os.environ["pr_file"])
+prw_list=catalog.glob(MODEL_OUTPUT_DIR+"/"+os.environ["prw_file"])
+ta_list=catalog.glob(MODEL_OUTPUT_DIR+"/"+os.environ["ta_file"])
 
 data["pr_list"] = pr_list
 data["prw_list"] = prw_list
 data["ta_list"] = ta_list
 
 # Check for pre-processed tave & qsat_int data
-data["tave_list"]=sorted(glob.glob(MODEL_OUTPUT_DIR+"/"+os.environ["tave_file"]))
-data["qsat_int_list"]=sorted(glob.glob(MODEL_OUTPUT_DIR+"/"+os.environ["qsat_int_file"]))
+data["tave_list"]=catalog.glob(MODEL_OUTPUT_DIR+"/"+os.environ["tave_file"])
+data["qsat_int_list"]=catalog.glob(MODEL_OUTPUT_DIR+"/"+os.environ["qsat_int_file"])
 
 if (len(data["tave_list"])==0 or len(data["qsat_int_list"])==0):
     data["PREPROCESS_TA"]=1
@@ -219,7 +233,8 @@ data["BIN_OUTPUT_DIR"], \
 data["BIN_OUTPUT_FILENAME"], \
 TIME_VAR, \
 LAT_VAR, \
-LON_VAR ]
+LON_VAR, \
+BIN_PARTIAL_DIR ]
 
 data["args2"]=[ \
 data["bin_output_list"],\
@@ -227,5 +242,8 @@ TAVE_VAR,\
 QSAT_INT_VAR,\
 BULK_TROPOSPHERIC_TEMPERATURE_MEASURE ]
 
-with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_calc_parameters.json", "w") as outfile:
-    json.dump(data, outfile)
+# When imported by convecTransBasic.py, parameters are read from "data" directly;
+#  the json file is only written when this script is run on its own
+if __name__=="__main__":
+    with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_calc_parameters.json", "w") as outfile:
+        json.dump(data, outfile)
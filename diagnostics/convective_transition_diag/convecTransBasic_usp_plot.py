@@ -13,8 +13,11 @@ import json
 import os
 import glob
 
-with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_calc_parameters.json") as outfile:
-    bin_data=json.load(outfile)
+if __name__=="__main__":
+    with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_calc_parameters.json") as outfile:
+        bin_data=json.load(outfile)
+else: # imported by convecTransBasic.py, after convecTransBasic_usp_calc
+    from convecTransBasic_usp_calc import data as bin_data
     
 # ======================================================================
 # START USER SPECIFIED SECTION
@@ -189,5 +192,6 @@ for i in ['f1','f2','f3','f4']:
                 
 data["plot_params"]=fig_params
 
-with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_plot_parameters.json", "w") as outfile:
-    json.dump(data, outfile)
+if __name__=="__main__":
+    with open(os.environ["WK_DIR"]+"/"+"convecTransBasic_plot_parameters.json", "w") as outfile:
+        json.dump(data, outfile)
@@ -9,71 +9,223 @@
 #    and the MDTF code package. See LICENSE.txt for the license.
 #
 #   Including:
-#    (1) convecTransBasic_binTave
-#    (2) convecTransBasic_binQsatInt
-#    (3) generate_region_mask
-#    (4) convecTransBasic_calcTaveQsatInt
-#    (5) convecTransBasic_calc_model
-#    (6) convecTransBasic_loadAnalyzedData
-#    (7) convecTransBasic_plot
+#    (1) convecTransBasic_binTiles
+#    (2) convecTransBasic_binNumba
+#    (3) convecTransBasic_binNumpy
+#    (4) convecTransBasic_compactBinIndex
+#    (5) convecTransBasic_longestRun
+#    (6) tropical_lat_slice
+#    (7) generate_region_mask
+#    (8) convecTransBasic_calcTaveQsatInt
+#    (9) convecTransBasic_calcTaveQsatIntStar
+#    (10) convecTransBasic_isPreprocessed
+#    (11) convecTransBasic_createTaveQsatIntOutput
+#    (12) convecTransBasic_binFingerprint
+#    (13) convecTransBasic_saveBinned
+#    (14) convecTransBasic_loadBinned
+#    (15) convecTransBasic_mergeBinned
+#    (16) convecTransBasic_calc_model
+#    (17) convecTransBasic_loadAnalyzedData
+#    (18) convecTransBasic_plot
 #    
 # ======================================================================
 # Import standard Python packages
 import numpy
-import numba
 import glob
 import os
-from numba import jit,autojit
+import hashlib
+import tempfile
+import multiprocessing
+try:
+    import numba
+    from numba import jit,autojit,prange
+except ImportError:
+    # numba is only needed for BINNING_BACKEND="numba"
+    numba=None
+    def jit(*args,**kwargs):
+        return lambda f: f
+    prange=range
 import scipy.io
-from scipy.interpolate import NearestNDInterpolator
+from scipy.spatial import cKDTree
 from netCDF4 import Dataset
 import matplotlib.pyplot as mp
 import matplotlib.cm as cm
-import networkx
+import sys
+# Figures are saved through the framework's figure_sink, which writes the
+#  bitmap for the webpage directly instead of leaving PS -> bitmap conversion
+#  to the framework
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+import figure_sink
 
 # ======================================================================
-# convecTransBasic_binTave
-#  takes arguments and bins by CWV & tave bins
-
-@jit(nopython=True)
-def convecTransBasic_binTave(lon_idx, CWV_BIN_WIDTH, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, REGION, CWV, RAIN, temp, QSAT_INT, p0, p1, p2, pe, q0, q1):
-    for lat_idx in numpy.arange(CWV.shape[1]):
-        reg=REGION[lon_idx,lat_idx]
-        if (reg>0 and reg<=NUMBER_OF_REGIONS):
-            cwv_idx=CWV[:,lat_idx,lon_idx]
-            rain=RAIN[:,lat_idx,lon_idx]
-            temp_idx=temp[:,lat_idx,lon_idx]
-            qsat_int=QSAT_INT[:,lat_idx,lon_idx]
-            for time_idx in numpy.arange(CWV.shape[0]):
-                if (temp_idx[time_idx]<NUMBER_TEMP_BIN and temp_idx[time_idx]>=0 and cwv_idx[time_idx]<NUMBER_CWV_BIN):
-                    p0[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=1
-                    p1[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=rain[time_idx]
-                    p2[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=rain[time_idx]**2
-                    if (rain[time_idx]>PRECIP_THRESHOLD):
-                        pe[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=1
-                    if (cwv_idx[time_idx]+1>(0.6/CWV_BIN_WIDTH)*qsat_int[time_idx]):
-                        q0[reg-1,temp_idx[time_idx]]+=1
-                        q1[reg-1,temp_idx[time_idx]]+=qsat_int[time_idx]
+# convecTransBasic_binTiles
+#  takes arguments and bins by CWV & tave (BIN_Q_SAT_INT=True) or qsat_int
+#  (BIN_Q_SAT_INT=False) bins, in parallel over tiles of longitudes
+# Each tile accumulates into its own slice of the partial histograms
+#  (leading dimension of p0, etc.), which are summed by the caller
+# Counts (p0, pe, q0) are integers, and sums (p1, p2, q1) use compensated
+#  summation with the running compensation in c1, c2, cq1, to avoid the
+#  round-off issue that arises when the total number of events reaches about 1e+8
+
+@jit(nopython=True,parallel=True)
+def convecTransBasic_binTiles(lon_tiles, BIN_Q_SAT_INT, CWV_BIN_WIDTH, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, REGION, CWV, RAIN, temp, QSAT_INT, p0, p1, p2, pe, q0, q1, c1, c2, cq1):
+    for tile in prange(lon_tiles.size-1):
+        for lon_idx in range(lon_tiles[tile],lon_tiles[tile+1]):
+            for lat_idx in range(CWV.shape[1]):
+                reg=REGION[lon_idx,lat_idx]
+                if (reg>0 and reg<=NUMBER_OF_REGIONS):
+                    r=reg-1
+                    for time_idx in range(CWV.shape[0]):
+                        c=CWV[time_idx,lat_idx,lon_idx]
+                        t=temp[time_idx,lat_idx,lon_idx]
+                        if (t<NUMBER_TEMP_BIN and t>=0 and c<NUMBER_CWV_BIN and c>=0):
+                            rain=RAIN[time_idx,lat_idx,lon_idx]
+                            p0[tile,r,c,t]+=1
+                            y=rain-c1[tile,r,c,t]
+                            acc=p1[tile,r,c,t]+y
+                            c1[tile,r,c,t]=(acc-p1[tile,r,c,t])-y
+                            p1[tile,r,c,t]=acc
+                            y=rain**2-c2[tile,r,c,t]
+                            acc=p2[tile,r,c,t]+y
+                            c2[tile,r,c,t]=(acc-p2[tile,r,c,t])-y
+                            p2[tile,r,c,t]=acc
+                            if (rain>PRECIP_THRESHOLD):
+                                pe[tile,r,c,t]+=1
+                            if BIN_Q_SAT_INT:
+                                qsat_int=QSAT_INT[time_idx,lat_idx,lon_idx]
+                                if (c+1>(0.6/CWV_BIN_WIDTH)*qsat_int):
+                                    q0[tile,r,t]+=1
+                                    y=qsat_int-cq1[tile,r,t]
+                                    acc=q1[tile,r,t]+y
+                                    cq1[tile,r,t]=(acc-q1[tile,r,t])-y
+                                    q1[tile,r,t]=acc
 
 # ======================================================================
-# convecTransBasic_binQsatInt
-#  takes arguments and bins by CWV & qsat_int bins
-
-@jit(nopython=True)
-def convecTransBasic_binQsatInt(lon_idx, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, REGION, CWV, RAIN, temp, p0, p1, p2, pe):
-    for lat_idx in numpy.arange(CWV.shape[1]):
-        reg=REGION[lon_idx,lat_idx]
-        if (reg>0 and reg<=NUMBER_OF_REGIONS):
-            cwv_idx=CWV[:,lat_idx,lon_idx]
-            rain=RAIN[:,lat_idx,lon_idx]
-            temp_idx=temp[:,lat_idx,lon_idx]
-            for time_idx in numpy.arange(CWV.shape[0]):
-                if (temp_idx[time_idx]<NUMBER_TEMP_BIN and temp_idx[time_idx]>=0 and cwv_idx[time_idx]<NUMBER_CWV_BIN):
-                    p0[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=1
-                    p1[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=rain[time_idx]
-                    p2[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=rain[time_idx]**2
-                    if (rain[time_idx]>PRECIP_THRESHOLD):
-                        pe[reg-1,cwv_idx[time_idx],temp_idx[time_idx]]+=1
+# convecTransBasic_binNumba
+#  bins one chunk of data with convecTransBasic_binTiles and returns the
+#  histograms p0, p1, p2, pe, q0, q1 for the chunk (q0 & q1 only if BIN_Q_SAT_INT)
+
+def convecTransBasic_binNumba(BIN_Q_SAT_INT, CWV_BIN_WIDTH, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, REGION, CWV, RAIN, temp, QSAT_INT):
+    # Each tile of longitudes is binned by a separate thread into its own
+    #  partial histograms, which are then summed
+    NUMBER_OF_TILES=min(CWV.shape[2],4*numba.config.NUMBA_NUM_THREADS)
+    lon_tiles=numpy.linspace(0,CWV.shape[2],NUMBER_OF_TILES+1).astype(numpy.int64)
+    p0=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN),dtype=numpy.int64)
+    pe=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN),dtype=numpy.int64)
+    p1=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
+    p2=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
+    c1=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
+    c2=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
+    q0=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_TEMP_BIN),dtype=numpy.int64)
+    q1=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
+    cq1=numpy.zeros((NUMBER_OF_TILES,NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
+    convecTransBasic_binTiles(lon_tiles, BIN_Q_SAT_INT, \
+                CWV_BIN_WIDTH, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, \
+                REGION, CWV, RAIN, temp, QSAT_INT, \
+                p0, p1, p2, pe, q0, q1, c1, c2, cq1)
+    return p0.sum(axis=0), (p1-c1).sum(axis=0), (p2-c2).sum(axis=0), pe.sum(axis=0), \
+        q0.sum(axis=0), (q1-cq1).sum(axis=0)
+
+# ======================================================================
+# convecTransBasic_binNumpy
+#  pure-NumPy equivalent of convecTransBasic_binNumba, for when numba isn't
+#  available or its compile time isn't worth it (e.g., short test runs)
+# Computes the flat (region, cwv bin, temp bin) index of every valid data point
+#  in the chunk and accumulates with numpy.bincount
+
+def convecTransBasic_binNumpy(BIN_Q_SAT_INT, CWV_BIN_WIDTH, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, REGION, CWV, RAIN, temp, QSAT_INT):
+    # REGION[lon,lat] --> reg[1,lat,lon] to broadcast against CWV[time,lat,lon]
+    reg=numpy.expand_dims(REGION.T,0)
+    valid=(reg>0)&(reg<=NUMBER_OF_REGIONS)&(temp<NUMBER_TEMP_BIN)&(temp>=0)\
+        &(CWV<NUMBER_CWV_BIN)&(CWV>=0)
+    reg_idx=numpy.broadcast_to(reg,CWV.shape)[valid]-1
+    cwv_idx=CWV[valid]
+    temp_idx=temp[valid]
+    rain=RAIN[valid]
+    hist_shape=(NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN)
+    flat_idx=(reg_idx*NUMBER_CWV_BIN+cwv_idx)*NUMBER_TEMP_BIN+temp_idx
+    nbins=NUMBER_OF_REGIONS*NUMBER_CWV_BIN*NUMBER_TEMP_BIN
+    p0=numpy.bincount(flat_idx,minlength=nbins).reshape(hist_shape)
+    p1=numpy.bincount(flat_idx,weights=rain,minlength=nbins).reshape(hist_shape)
+    p2=numpy.bincount(flat_idx,weights=rain**2,minlength=nbins).reshape(hist_shape)
+    pe=numpy.bincount(flat_idx[rain>PRECIP_THRESHOLD],minlength=nbins).reshape(hist_shape)
+    q0=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN),dtype=numpy.int64)
+    q1=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
+    if BIN_Q_SAT_INT:
+        qsat_int=QSAT_INT[valid]
+        q_mask=(cwv_idx+1>(0.6/CWV_BIN_WIDTH)*qsat_int)
+        q_idx=reg_idx[q_mask]*NUMBER_TEMP_BIN+temp_idx[q_mask]
+        q0=numpy.bincount(q_idx,minlength=NUMBER_OF_REGIONS*NUMBER_TEMP_BIN)\
+            .reshape(q0.shape)
+        q1=numpy.bincount(q_idx,weights=qsat_int[q_mask],minlength=NUMBER_OF_REGIONS*NUMBER_TEMP_BIN)\
+            .reshape(q1.shape)
+    return p0, p1, p2, pe, q0, q1
+
+# ======================================================================
+# convecTransBasic_compactBinIndex
+#  converts field (already shifted & scaled in place to fractional bin
+#  numbers) to int16 bin indices, for COMPACT_DTYPE mode
+# Values are clipped to [-1,nbins] first (outside the valid range 0 to nbins-1
+#  either way) so they fit in int16, and NaNs are set to -1
+
+def convecTransBasic_compactBinIndex(field,nbins):
+    numpy.clip(field,-1,nbins,out=field)
+    field[numpy.isnan(field)]=-1
+    return field.astype(numpy.int16)
+
+# ======================================================================
+# convecTransBasic_longestRun
+#  finds, for every (region, temperature) pair at once, the longest run of
+#  consecutive CWV bins with pdf_gt_th>0 (the biggest connected component)
+# Only runs of at least 2 bins count; of runs with equal length, the one at
+#  lowest CWV is taken
+# Returns the length of the run (0 if there isn't one) as an array of shape
+#  (region, temperature), and a mask with the same shape as pdf_gt_th that is
+#  1 on the run & 0 elsewhere
+
+def convecTransBasic_longestRun(pdf_gt_th):
+    NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN=pdf_gt_th.shape
+    # Pad with 0 on both ends of the CWV axis, so every run has a start (+1)
+    #  & an end (-1) in the differences
+    above=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN,NUMBER_CWV_BIN+2),dtype=numpy.int8)
+    above[:,:,1:-1]=(pdf_gt_th>0).transpose(0,2,1)
+    edges=numpy.diff(above,axis=2)
+    run_reg,run_temp,run_start=numpy.nonzero(edges==1)
+    run_end=numpy.nonzero(edges==-1)[2]
+    run_length=run_end-run_start
+    keep=(run_length>=2)
+    row=(run_reg*NUMBER_TEMP_BIN+run_temp)[keep]
+    run_start=run_start[keep]
+    run_length=run_length[keep]
+    # Longest run first for each row, ties broken by lowest start
+    order=numpy.lexsort((run_start,-run_length,row))
+    row=row[order]
+    run_start=run_start[order]
+    run_length=run_length[order]
+    first=numpy.ones(row.size,dtype=bool)
+    first[1:]=(row[1:]!=row[:-1])
+    row=row[first]
+    run_start=run_start[first]
+    run_length=run_length[first]
+    longest=numpy.zeros(NUMBER_OF_REGIONS*NUMBER_TEMP_BIN,dtype=numpy.int64)
+    longest[row]=run_length
+    bounds=numpy.zeros((NUMBER_OF_REGIONS*NUMBER_TEMP_BIN,NUMBER_CWV_BIN+1),dtype=numpy.int8)
+    bounds[row,run_start]=1
+    bounds[row,run_start+run_length]=-1
+    run_mask=numpy.cumsum(bounds,axis=1)[:,:NUMBER_CWV_BIN]
+    return longest.reshape(NUMBER_OF_REGIONS,NUMBER_TEMP_BIN), \
+        run_mask.reshape(NUMBER_OF_REGIONS,NUMBER_TEMP_BIN,NUMBER_CWV_BIN).transpose(0,2,1)
+
+# ======================================================================
+# tropical_lat_slice
+#  returns the slice of latitude indices within 20S-20N, so that only the
+#  tropical slab of a field needs to be read from its netCDF file
+
+def tropical_lat_slice(lat):
+    lat_idx=numpy.where(numpy.logical_and(numpy.asarray(lat)>=-20.0,numpy.asarray(lat)<=20.0))[0]
+    if lat_idx.size==0:
+        return slice(0,0)
+    return slice(lat_idx[0],lat_idx[-1]+1)
 
 # ======================================================================
 # generate_region_mask
@@ -84,11 +236,34 @@ def convecTransBasic_binQsatInt(lon_idx, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUM
 #  in the Western Pacific (WPac), Eastern Pacific (EPac),
 #  Atlantic (Atl), and Indian (Ind) Ocean basins
 # Coastal regions (within 2.5 degree with respect to sup-norm) are excluded
+# If cache_dir is given, the regridded mask is saved there & reused for
+#  model grids with the same tropical latitudes & longitudes
 
-def generate_region_mask(region_mask_filename, model_netcdf_filename, lat_var, lon_var):
+def generate_region_mask(region_mask_filename, model_netcdf_filename, lat_var, lon_var, cache_dir=""):
     
     print("   Generating region mask..."),
 
+    # Model Grid (tropics only)
+    pr_netcdf=Dataset(model_netcdf_filename,"r")
+    lon=numpy.asarray(pr_netcdf.variables[lon_var][:],dtype="float")
+    lat=numpy.asarray(pr_netcdf.variables[lat_var][:],dtype="float")
+    pr_netcdf.close()
+    lon[lon<0.0]+=360.0
+    lat=lat[numpy.logical_and(lat>=-20.0,lat<=20.0)]
+
+    # Masks are cached in cache_dir (if given), keyed by the model grid & region mask file,
+    #  so that later runs on the same grid don't need to regrid
+    if cache_dir:
+        key=hashlib.sha1()
+        key.update(lat.tobytes())
+        key.update(lon.tobytes())
+        with open(region_mask_filename,"rb") as f:
+            key.update(f.read())
+        cache_filename=os.path.join(cache_dir,"region_mask_"+key.hexdigest()+".npy")
+        if os.path.isfile(cache_filename):
+            print("...Loaded from "+cache_filename+"!")
+            return numpy.load(cache_filename)
+
     # Load & Pre-process Region Mask
     matfile=scipy.io.loadmat(region_mask_filename)
     lat_m=matfile["lat"]
@@ -100,33 +275,22 @@ def generate_region_mask(region_mask_filename, model_netcdf_filename, lat_var, l
     region=numpy.append(numpy.reshape(region[-2,:],(-1,lat_m.size)),region,0)
 
     LAT,LON=numpy.meshgrid(lat_m,lon_m,sparse=False,indexing="xy")
-    LAT=numpy.reshape(LAT,(-1,1))
-    LON=numpy.reshape(LON,(-1,1))
-    REGION=numpy.reshape(region,(-1,1))
-
-    LATLON=numpy.squeeze(numpy.array((LAT,LON)))
-    LATLON=LATLON.transpose()
-
-    regMaskInterpolator=NearestNDInterpolator(LATLON,REGION)
-
-    # Interpolate Region Mask onto Model Grid using Nearest Grid Value
-    pr_netcdf=Dataset(model_netcdf_filename,"r")
-    lon=numpy.asarray(pr_netcdf.variables[lon_var][:],dtype="float")
-    lat=numpy.asarray(pr_netcdf.variables[lat_var][:],dtype="float")
-    pr_netcdf.close()
-    if lon[lon<0.0].size>0:
-        lon[lon[lon<0.0]]+=360.0
-    lat=lat[numpy.logical_and(lat>=-20.0,lat<=20.0)]
+    regMaskTree=cKDTree(numpy.column_stack((LAT.ravel(),LON.ravel())))
 
+    # Interpolate Region Mask onto Model Grid using Nearest Grid Value,
+    #  with one query for all model grid points
     LAT,LON=numpy.meshgrid(lat,lon,sparse=False,indexing="xy")
-    LAT=numpy.reshape(LAT,(-1,1))
-    LON=numpy.reshape(LON,(-1,1))
-    LATLON=numpy.squeeze(numpy.array((LAT,LON)))
-    LATLON=LATLON.transpose()
-    REGION=numpy.zeros(LAT.size)
-    for latlon_idx in numpy.arange(REGION.shape[0]):
-        REGION[latlon_idx]=regMaskInterpolator(LATLON[latlon_idx,:])
-    REGION=numpy.reshape(REGION.astype(int),(-1,lat.size))
+    _,nearest_idx=regMaskTree.query(numpy.column_stack((LAT.ravel(),LON.ravel())))
+    REGION=numpy.reshape(region.ravel()[nearest_idx].astype(int),(-1,lat.size))
+
+    if cache_dir:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file & rename, so concurrent runs never read a partial mask
+        fd,tmp_filename=tempfile.mkstemp(dir=cache_dir,suffix=".npy")
+        with os.fdopen(fd,"wb") as f:
+            numpy.save(f,REGION)
+        os.rename(tmp_filename,cache_filename)
     
     print("...Generated!")
 
@@ -142,6 +306,13 @@ def generate_region_mask(region_mask_filename, model_netcdf_filename, lat_var, l
 #  takes in 3D tropospheric temperature fields and calculates tave & qsat_int
 # Calculations will be broken up into chunks of time-period corresponding
 #  to time_idx_delta with a default of 1000 time steps
+# The pressure levels & trapezoid weights of the column are computed once;
+#  tave is integrated with a single tensordot per chunk, and qsat_int by
+#  accumulating one level at a time, so the 4D saturation vapor pressure
+#  array is never formed
+# If SAVE_TAVE_QSAT_INT==1, each chunk is written straight to the output
+#  netCDF files (whose names are returned); otherwise tave & qsat_int are
+#  returned as arrays
 # Definition of column can be changed through p_lev_bottom & p_lev_top,
 #  but the default filenames for tave & qsat_int do not contain column info
 
@@ -166,182 +337,239 @@ def convecTransBasic_calcTaveQsatInt(ta_netcdf_filename,TA_VAR,PRES_VAR,MODEL,\
     #  Column: 1000-200mb (+/- dp mb)
     ta_netcdf=Dataset(ta_netcdf_filename,"r")
     lat=numpy.asarray(ta_netcdf.variables[LAT_VAR][:],dtype="float")
+    lon=numpy.asarray(ta_netcdf.variables[LON_VAR][:],dtype="float")
+    lat_slice=tropical_lat_slice(lat)
     pfull=numpy.asarray(ta_netcdf.variables[PRES_VAR][:],dtype="float")
     if (max(pfull)>2000): # If units: Pa
         pfull*=0.01
     FLIP_PRES=(pfull[1]-pfull[0]<0)
     if FLIP_PRES:
         pfull=numpy.flipud(pfull)
-    tave=numpy.array([])
-    qsat_int=numpy.array([])
 
-    time_idx_start=0
+    # Pressure levels in the column (the same for all time steps)
+    p_min=numpy.sum(pfull<=p_lev_top)-1
+    if (pfull[p_min+1]<p_lev_top+dp):
+        p_min=p_min+1
+    p_max=numpy.sum(pfull<=p_lev_bottom)-1
+    if (p_max+1<pfull.size and pfull[p_max]<p_lev_bottom-dp):
+        p_max=p_max+1
+    plev=numpy.copy(pfull[p_min:p_max+1])
+    if FLIP_PRES:
+        ta_lev=slice(pfull.size-(p_max+1),pfull.size-p_min)
+    else:
+        ta_lev=slice(p_min,p_max+1)
+    NUMBER_OF_LEVELS=plev.size
+
+    # Update plev(top) <-- p_lev_top
+    #  AND ta(top) <-- ta(p_lev_top) by interpolation
+    INTERP_TOP=(plev[0]<p_lev_top-dp)
+    if INTERP_TOP:
+        top_frac=(p_lev_top-plev[0])/(plev[1]-plev[0])
+        plev[0]=p_lev_top
+    # Update plev(bottom) <-- p_lev_bottom
+    #  AND ta(bottom) <-- ta(p_lev_bottom) by interpolation
+    INTERP_BOTTOM=(plev[-1]>p_lev_bottom+dp)
+    if INTERP_BOTTOM:
+        bottom_frac=(p_lev_bottom-plev[-1])/(plev[-2]-plev[-1])
+        plev[-1]=p_lev_bottom
+    # Add plev(bottom+1) <-- p_lev_bottom
+    #  AND ta(bottom+1) <-- ta(p_lev_bottom) by extrapolation
+    EXTRAP_BOTTOM=(plev[-1]<p_lev_bottom-dp)
+    if EXTRAP_BOTTOM:
+        bottom_frac=(p_lev_bottom-plev[-1])/(plev[-1]-plev[-2])
+        plev=numpy.append(plev,p_lev_bottom)
+
+    # Trapezoid weights for integrating between the top & bottom levels
+    dplev=numpy.empty(plev.size)
+    dplev[0]=plev[1]-plev[0]
+    dplev[1:-1]=plev[2:]-plev[:-2]
+    dplev[-1]=plev[-1]-plev[-2]
+    tave_weights=dplev/2/(plev[-1]-plev[0])
+    qsat_int_weights=(epsilon/2/g)*dplev/plev
+
+    def saturation_vapor_pressure(ta_lev):
+        return Es0*(ta_lev/Tk0)**((cpv-cl)/Rv)*numpy.exp((Lv0+(cl-cpv)*Tk0)/Rv*(1/Tk0-1/ta_lev))
+
+    time_idx_total=ta_netcdf.variables[TA_VAR].shape[0]
+    output_shape=(time_idx_total,lat[lat_slice].size,lon.size)
+    if SAVE_TAVE_QSAT_INT==1:
+        tave_output_filename,tave=convecTransBasic_createTaveQsatIntOutput(ta_netcdf,\
+            ta_netcdf_filename,TA_VAR,TAVE_VAR,"K",\
+            "Mass-Weighted Column Average Temperature",MODEL,p_lev_bottom,p_lev_top,\
+            PREPROCESSING_OUTPUT_DIR,TIME_VAR,LAT_VAR,LON_VAR,lat_slice)
+        qsat_int_output_filename,qsat_int=convecTransBasic_createTaveQsatIntOutput(ta_netcdf,\
+            ta_netcdf_filename,TA_VAR,QSAT_INT_VAR,"mm",\
+            "Column-integrated Saturation Specific Humidity",MODEL,p_lev_bottom,p_lev_top,\
+            PREPROCESSING_OUTPUT_DIR,TIME_VAR,LAT_VAR,LON_VAR,lat_slice)
+    else:
+        tave=numpy.empty(output_shape)
+        qsat_int=numpy.empty(output_shape)
 
     print("      Pre-processing "+ta_netcdf_filename)
 
-    while (time_idx_start<ta_netcdf.variables[TA_VAR].shape[0]):
-        if (time_idx_start+time_idx_delta<=ta_netcdf.variables[TA_VAR].shape[0]):
-            time_idx_end=time_idx_start+time_idx_delta
-        else:
-            time_idx_end=ta_netcdf.variables[TA_VAR].shape[0]
+    time_idx_start=0
+    while (time_idx_start<time_idx_total):
+        time_idx_end=min(time_idx_start+time_idx_delta,time_idx_total)
 
         print("         Integrate temperature field over "\
             +str(p_lev_bottom)+"-"+str(p_lev_top)+" hPa "\
             +"for time steps "\
             +str(time_idx_start)+"-"+str(time_idx_end))
 
-        p_min=numpy.sum(pfull<=p_lev_top)-1
-        if (pfull[p_min+1]<p_lev_top+dp):
-            p_min=p_min+1
-        p_max=numpy.sum(pfull<=p_lev_bottom)-1
-        if (p_max+1<pfull.size and pfull[p_max]<p_lev_bottom-dp):
-            p_max=p_max+1
-        plev=numpy.copy(pfull[p_min:p_max+1])
         # ta[time,p,lat,lon]
+        ta=numpy.asarray(ta_netcdf.variables[TA_VAR][time_idx_start:time_idx_end,ta_lev,lat_slice,:],dtype="float")
         if FLIP_PRES:
-            ta=numpy.asarray(ta_netcdf.variables[TA_VAR][time_idx_start:time_idx_end,pfull.size-(p_max+1):pfull.size-p_min,numpy.logical_and(lat>=-20.0,lat<=20.0),:],dtype="float")
             ta=numpy.fliplr(ta)
-        else:
-            ta=numpy.asarray(ta_netcdf.variables[TA_VAR][time_idx_start:time_idx_end,p_min:p_max+1,numpy.logical_and(lat>=-20.0,lat<=20.0),:],dtype="float")
+        if INTERP_TOP:
+            ta[:,0,:,:]+=top_frac*(ta[:,1,:,:]-ta[:,0,:,:])
+        if INTERP_BOTTOM:
+            ta[:,-1,:,:]+=bottom_frac*(ta[:,-2,:,:]-ta[:,-1,:,:])
+        if EXTRAP_BOTTOM:
+            ta_bottom=ta[:,-1,:,:]+bottom_frac*(ta[:,-1,:,:]-ta[:,-2,:,:])
+
+        # Integrate between top & bottom levels
+        tave_interim=numpy.tensordot(ta,tave_weights[:NUMBER_OF_LEVELS],axes=([1],[0]))
+        qsat_interim=numpy.zeros(tave_interim.shape)
+        for pidx in range(NUMBER_OF_LEVELS):
+            qsat_interim+=qsat_int_weights[pidx]*saturation_vapor_pressure(ta[:,pidx,:,:])
+        if EXTRAP_BOTTOM:
+            tave_interim+=tave_weights[-1]*ta_bottom
+            qsat_interim+=qsat_int_weights[-1]*saturation_vapor_pressure(ta_bottom)
+
+        tave[time_idx_start:time_idx_end,:,:]=tave_interim
+        qsat_int[time_idx_start:time_idx_end,:,:]=qsat_interim
         time_idx_start=time_idx_end
-        p_max=p_max-p_min
-        p_min=0
-
-        if (plev[p_min]<p_lev_top-dp):
-            # Update plev(p_min) <-- p_lev_top
-            #  AND ta(p_min) <-- ta(p_lev_top) by interpolation
-            ta[:,p_min,:,:]=ta[:,p_min,:,:] \
-                            +(p_lev_top-plev[p_min]) \
-                            /(plev[p_min+1]-plev[p_min]) \
-                            *(ta[:,p_min+1,:,:]-ta[:,p_min,:,:])
-            plev[p_min]=p_lev_top
-
-        if (plev[p_max]>p_lev_bottom+dp):
-            # Update plev(p_max) <-- p_lev_bottom
-            #  AND Update ta(p_max) <-- ta(p_lev_bottom) by interpolation
-            ta[:,p_max,:,:]=ta[:,p_max,:,:] \
-                            +(p_lev_bottom-plev[p_max]) \
-                            /(plev[p_max-1]-plev[p_max]) \
-                            *(ta[:,p_max-1,:,:]-ta[:,p_max,:,:])
-            plev[p_max]=p_lev_bottom
-
-        if (plev[p_max]<p_lev_bottom-dp):
-            # Update plev(p_max+1) <-- p_lev_bottom
-            #  AND ta(p_max+1) <-- ta(p_lev_bottom) by extrapolation
-            ta=numpy.append(ta,numpy.expand_dims(ta[:,p_max,:,:] \
-                            +(p_lev_bottom-plev[p_max]) \
-                            /(plev[p_max]-plev[p_max-1]) \
-                            *(ta[:,p_max,:,:]-ta[:,p_max-1,:,:]),1), \
-                            axis=1)
-            plev=numpy.append(plev,p_lev_bottom)
-            p_max=p_max+1
-
-        # Integrate between level p_min and p_max
-        tave_interim=ta[:,p_min,:,:]*(plev[p_min+1]-plev[p_min])
-        for pidx in range(p_min+1,p_max-1+1):
-            tave_interim=tave_interim+ta[:,pidx,:,:]*(plev[pidx+1]-plev[pidx-1])
-        tave_interim=tave_interim+ta[:,p_max,:,:]*(plev[p_max]-plev[p_max-1])
-        tave_interim=numpy.squeeze(tave_interim)/2/(plev[p_max]-plev[p_min])
-        if (tave.size==0):
-            tave=tave_interim
-        else:
-            tave=numpy.append(tave,tave_interim,axis=0)
-
-        # Integrate Saturation Specific Humidity between level p_min and p_max 
-        Es=Es0*(ta/Tk0)**((cpv-cl)/Rv)*numpy.exp((Lv0+(cl-cpv)*Tk0)/Rv*(1/Tk0-1/ta))
-        qsat_interim=Es[:,p_min,:,:]*(plev[p_min+1]-plev[p_min])/plev[p_min]
-        for pidx in range(p_min+1,p_max-1+1):
-            qsat_interim=qsat_interim+Es[:,pidx,:,:]*(plev[pidx+1]-plev[pidx-1])/plev[pidx]
-        qsat_interim=qsat_interim+Es[:,p_max,:,:]*(plev[p_max]-plev[p_max-1])/plev[p_max]
-        qsat_interim=(epsilon/2/g)*qsat_interim
-        if (qsat_int.size==0):
-            qsat_int=qsat_interim
-        else:
-            qsat_int=numpy.append(qsat_int,qsat_interim,axis=0)
+    # End-while time_idx_start
 
     ta_netcdf.close()
-    # End-while time_idx_start
 
     print('      '+ta_netcdf_filename+" pre-processed!")
 
-    # Save Pre-Processed tave & qsat_int Fields
     if SAVE_TAVE_QSAT_INT==1:
-        # Create PREPROCESSING_OUTPUT_DIR
-        os.system("mkdir -p "+PREPROCESSING_OUTPUT_DIR)
-
-        # Get necessary coordinates/variables for netCDF files
-        ta_netcdf=Dataset(ta_netcdf_filename,"r")
-        time=ta_netcdf.variables[TIME_VAR]
-        longitude=numpy.asarray(ta_netcdf.variables[LON_VAR][:],dtype="float")
-        latitude=numpy.asarray(ta_netcdf.variables[LAT_VAR][:],dtype="float")
-        latitude=latitude[numpy.logical_and(latitude>=-20.0,latitude<=20.0)]
-
-        # Save 1000-200mb Column Average Temperature as tave
-        tave_output_filename=PREPROCESSING_OUTPUT_DIR+"/"+ta_netcdf_filename.split('/')[-1].replace("."+TA_VAR+".","."+TAVE_VAR+".")
-        tave_output_netcdf=Dataset(tave_output_filename,"w",format="NETCDF4")
-        tave_output_netcdf.description=str(p_lev_bottom)+"-"+str(p_lev_top)+" hPa "\
-                                    +"Mass-Weighted Column Average Temperature for "+MODEL
-        tave_output_netcdf.source="Convective Onset Statistics Diagnostic Package \
-        - as part of the NOAA Model Diagnostic Task Force (MDTF) effort"
-
-        lon_dim=tave_output_netcdf.createDimension(LON_VAR,len(longitude))
-        lon_val=tave_output_netcdf.createVariable(LON_VAR,numpy.float64,(LON_VAR,))
-        lon_val.units="degree"
-        lon_val[:]=longitude
-
-        lat_dim=tave_output_netcdf.createDimension(LAT_VAR,len(latitude))
-        lat_val=tave_output_netcdf.createVariable(LAT_VAR,numpy.float64,(LAT_VAR,))
-        lat_val.units="degree_north"
-        lat_val[:]=latitude
-
-        time_dim=tave_output_netcdf.createDimension(TIME_VAR,None)
-        time_val=tave_output_netcdf.createVariable(TIME_VAR,numpy.float64,(TIME_VAR,))
-        time_val.units=time.units
-        time_val[:]=time[:]
-
-        tave_val=tave_output_netcdf.createVariable(TAVE_VAR,numpy.float64,(TIME_VAR,LAT_VAR,LON_VAR))
-        tave_val.units="K"
-        tave_val[:,:,:]=tave
-
-        tave_output_netcdf.close()
-
+        tave.group().close()
         print('      '+tave_output_filename+" saved!")
+        qsat_int.group().close()
+        print('      '+qsat_int_output_filename+" saved!")
+        return tave_output_filename, qsat_int_output_filename
+
+    return tave, qsat_int
+
+# ======================================================================
+# convecTransBasic_calcTaveQsatIntStar
+#  calls convecTransBasic_calcTaveQsatInt with a tuple of arguments (for use
+#  with multiprocessing.Pool) and returns the name of the pre-processed file
 
-        # Save 1000-200mb Column-integrated Saturation Specific Humidity as qsat_int
-        qsat_int_output_filename=PREPROCESSING_OUTPUT_DIR+"/"+ta_netcdf_filename.split('/')[-1].replace("."+TA_VAR+".","."+QSAT_INT_VAR+".")
-        qsat_int_output_netcdf=Dataset(qsat_int_output_filename,"w",format="NETCDF4")
-        qsat_int_output_netcdf.description=str(p_lev_bottom)+"-"+str(p_lev_top)+" hPa "\
-                                    +"Column-integrated Saturation Specific Humidity for "+MODEL
-        qsat_int_output_netcdf.source="Convective Onset Statistics Diagnostic Package \
-        - as part of the NOAA Model Diagnostic Task Force (MDTF) effort"
+def convecTransBasic_calcTaveQsatIntStar(args):
+    convecTransBasic_calcTaveQsatInt(*args)
+    return args[0]
 
-        lon_dim=qsat_int_output_netcdf.createDimension(LON_VAR,len(longitude))
-        lon_val=qsat_int_output_netcdf.createVariable(LON_VAR,numpy.float64,(LON_VAR,))
-        lon_val.units="degree"
-        lon_val[:]=longitude
+# ======================================================================
+# convecTransBasic_isPreprocessed
+#  True if tave & qsat_int saved by convecTransBasic_calcTaveQsatInt for
+#  ta_netcdf_filename exist and are newer than it
+
+def convecTransBasic_isPreprocessed(ta_netcdf_filename,TA_VAR,TAVE_VAR,QSAT_INT_VAR,PREPROCESSING_OUTPUT_DIR):
+    ta_mtime=os.path.getmtime(ta_netcdf_filename)
+    for OUTPUT_VAR in [TAVE_VAR,QSAT_INT_VAR]:
+        output_filename=PREPROCESSING_OUTPUT_DIR+"/"+ta_netcdf_filename.split('/')[-1].replace("."+TA_VAR+".","."+OUTPUT_VAR+".")
+        if not os.path.isfile(output_filename) or os.path.getmtime(output_filename)<ta_mtime:
+            return False
+    return True
 
-        lat_dim=qsat_int_output_netcdf.createDimension(LAT_VAR,len(latitude))
-        lat_val=qsat_int_output_netcdf.createVariable(LAT_VAR,numpy.float64,(LAT_VAR,))
-        lat_val.units="degree_north"
-        lat_val[:]=latitude
+# ======================================================================
+# convecTransBasic_createTaveQsatIntOutput
+#  creates the netCDF file that convecTransBasic_calcTaveQsatInt saves
+#  tave or qsat_int to, with the tropical coordinates of ta_netcdf, and
+#  returns its filename & the (empty) output variable
+
+def convecTransBasic_createTaveQsatIntOutput(ta_netcdf,ta_netcdf_filename,TA_VAR,OUTPUT_VAR,units,\
+                        description,MODEL,p_lev_bottom,p_lev_top,\
+                        PREPROCESSING_OUTPUT_DIR,TIME_VAR,LAT_VAR,LON_VAR,lat_slice):
+    # Files are pre-processed in parallel, so another process may create the
+    #  directory between the check & makedirs
+    try:
+        os.makedirs(PREPROCESSING_OUTPUT_DIR)
+    except OSError:
+        if not os.path.isdir(PREPROCESSING_OUTPUT_DIR):
+            raise
+
+    time=ta_netcdf.variables[TIME_VAR]
+    longitude=numpy.asarray(ta_netcdf.variables[LON_VAR][:],dtype="float")
+    latitude=numpy.asarray(ta_netcdf.variables[LAT_VAR][lat_slice],dtype="float")
+
+    output_filename=PREPROCESSING_OUTPUT_DIR+"/"+ta_netcdf_filename.split('/')[-1].replace("."+TA_VAR+".","."+OUTPUT_VAR+".")
+    output_netcdf=Dataset(output_filename,"w",format="NETCDF4")
+    output_netcdf.description=str(p_lev_bottom)+"-"+str(p_lev_top)+" hPa "\
+                                +description+" for "+MODEL
+    output_netcdf.source="Convective Onset Statistics Diagnostic Package \
+    - as part of the NOAA Model Diagnostic Task Force (MDTF) effort"
 
-        time_dim=qsat_int_output_netcdf.createDimension(TIME_VAR,None)
-        time_val=qsat_int_output_netcdf.createVariable(TIME_VAR,numpy.float64,(TIME_VAR,))
-        time_val.units=time.units
-        time_val[:]=time[:]
+    lon_dim=output_netcdf.createDimension(LON_VAR,len(longitude))
+    lon_val=output_netcdf.createVariable(LON_VAR,numpy.float64,(LON_VAR,))
+    lon_val.units="degree"
+    lon_val[:]=longitude
 
-        qsat_int_val=qsat_int_output_netcdf.createVariable(QSAT_INT_VAR,numpy.float64,(TIME_VAR,LAT_VAR,LON_VAR))
-        qsat_int_val.units="mm"
-        qsat_int_val[:,:,:]=qsat_int
+    lat_dim=output_netcdf.createDimension(LAT_VAR,len(latitude))
+    lat_val=output_netcdf.createVariable(LAT_VAR,numpy.float64,(LAT_VAR,))
+    lat_val.units="degree_north"
+    lat_val[:]=latitude
 
-        qsat_int_output_netcdf.close()
+    time_dim=output_netcdf.createDimension(TIME_VAR,None)
+    time_val=output_netcdf.createVariable(TIME_VAR,numpy.float64,(TIME_VAR,))
+    time_val.units=time.units
+    time_val[:]=time[:]
 
-        print('      '+qsat_int_output_filename+" saved!")
+    output_val=output_netcdf.createVariable(OUTPUT_VAR,numpy.float64,(TIME_VAR,LAT_VAR,LON_VAR))
+    output_val.units=units
 
-        ta_netcdf.close()
-    # End-if SAVE_TAVE_QSAT_INT==1
+    return output_filename, output_val
 
-    return tave, qsat_int
+# ======================================================================
+# convecTransBasic_binFingerprint
+#  returns a hash identifying the binned results for a set of input files:
+#  their paths, sizes & modification times, and the binning parameters
+
+def convecTransBasic_binFingerprint(input_files,binning_params):
+    key=hashlib.sha1()
+    key.update(repr(binning_params).encode("utf-8"))
+    for filename in input_files:
+        st=os.stat(filename)
+        key.update(repr((os.path.realpath(filename),st.st_size,st.st_mtime)).encode("utf-8"))
+    return key.hexdigest()
+
+# ======================================================================
+# convecTransBasic_saveBinned, convecTransBasic_loadBinned
+#  save & load the partial histograms (P0, P1, P2, PE, Q0, Q1 & bin centers)
+#  for one set of input files
+
+def convecTransBasic_saveBinned(filename,binned):
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    # Write to a temporary file & rename, so a partial write is never reused
+    fd,tmp_filename=tempfile.mkstemp(dir=os.path.dirname(filename),suffix=".npz")
+    with os.fdopen(fd,"wb") as f:
+        numpy.savez(f,**binned)
+    os.rename(tmp_filename,filename)
+
+def convecTransBasic_loadBinned(filename):
+    with numpy.load(filename) as npz:
+        return dict((k,npz[k]) for k in npz.files)
+
+# ======================================================================
+# convecTransBasic_mergeBinned
+#  sums partial histograms, e.g., of different input files, or from runs on
+#  different nodes (loaded with convecTransBasic_loadBinned)
+# All partial histograms must use the same bins
+
+def convecTransBasic_mergeBinned(binned_list):
+    merged=dict((k,numpy.copy(v)) for k,v in binned_list[0].items())
+    for binned in binned_list[1:]:
+        for k in ["cwv_bin_center","temp_bin_center"]:
+            if not numpy.array_equal(merged[k],binned[k]):
+                raise ValueError("Can't merge binned results with different "+k)
+        for k in ["P0","P1","P2","PE","Q0","Q1"]:
+            merged[k]+=binned[k]
+    return merged
 
 # ======================================================================
 # convecTransBasic_calc_model
@@ -387,16 +615,45 @@ def convecTransBasic_calc_model(REGION,*argsv):
     BIN_OUTPUT_FILENAME, \
     TIME_VAR, \
     LAT_VAR, \
-    LON_VAR = argsv[0]
+    LON_VAR, \
+    BIN_PARTIAL_DIR = argsv[0]
 
     # Pre-process temperature field if necessary
     if PREPROCESS_TA==1:
         print("   Start pre-processing atmospheric temperature fields...")
-        for li in numpy.arange(len(pr_list)):
-            convecTransBasic_calcTaveQsatInt(ta_list[li],TA_VAR,PRES_VAR,MODEL,\
-                                p_lev_bottom,p_lev_top,dp,time_idx_delta,\
-                                SAVE_TAVE_QSAT_INT,PREPROCESSING_OUTPUT_DIR,\
-                                TAVE_VAR,QSAT_INT_VAR,TIME_VAR,LAT_VAR,LON_VAR)
+        # Files are independent, so pre-process them in parallel, using the
+        #  cores the framework reserved for this POD
+        preprocess_args=[(ta_list[li],TA_VAR,PRES_VAR,MODEL,\
+                            p_lev_bottom,p_lev_top,dp,time_idx_delta,\
+                            SAVE_TAVE_QSAT_INT,PREPROCESSING_OUTPUT_DIR,\
+                            TAVE_VAR,QSAT_INT_VAR,TIME_VAR,LAT_VAR,LON_VAR) \
+                            for li in numpy.arange(len(pr_list))]
+        if SAVE_TAVE_QSAT_INT==1:
+            # Skip files whose saved tave & qsat_int are newer than ta, so that
+            #  their binned results can be reused (see BIN_PARTIAL_DIR)
+            preprocess_args=[args for args in preprocess_args \
+                if not convecTransBasic_isPreprocessed(args[0],TA_VAR,TAVE_VAR,QSAT_INT_VAR,PREPROCESSING_OUTPUT_DIR)]
+        number_of_processes=min(len(preprocess_args),\
+            int(os.environ.get("POD_CORES",multiprocessing.cpu_count())))
+        if number_of_processes>1:
+            pool=multiprocessing.Pool(number_of_processes)
+            results=pool.imap_unordered(convecTransBasic_calcTaveQsatIntStar,preprocess_args)
+        else:
+            pool=None
+            results=(convecTransBasic_calcTaveQsatIntStar(args) for args in preprocess_args)
+        try:
+            for li,ta_netcdf_filename in enumerate(results):
+                print("   Pre-processed "+str(li+1)+" of "+str(len(preprocess_args))\
+                    +" temperature files ("+ta_netcdf_filename+")")
+        except:
+            # Don't leave workers running in the driver process if a file fails
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
         # Re-load file lists for tave & qsat_int
         tave_list=sorted(glob.glob(PREPROCESSING_OUTPUT_DIR+"/"+os.environ["tave_file"]))
         qsat_int_list=sorted(glob.glob(PREPROCESSING_OUTPUT_DIR+"/"+os.environ["qsat_int_file"]))
@@ -420,99 +677,158 @@ def convecTransBasic_calc_model(REGION,*argsv):
     NUMBER_TEMP_BIN=temp_bin_center.size
     temp_offset=temp_bin_center[0]-0.5*temp_bin_width
 
-    # Allocate Memory for Arrays
-    P0=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-    P1=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-    P2=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-    PE=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-    if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
-        Q0=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
-        Q1=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
-
-    # Binning by calling convecTransBasic_binTave or convecTransBasic_binQsatInt
+    # Compact mode (COMPACT_DTYPE="1" in settings.yml) reads the input fields
+    #  as float32 and computes int16 bin indices in place, cutting the memory
+    #  used per chunk by roughly 3-4x; results differ from the default float64
+    #  mode only by round-off for values at bin edges
+    COMPACT_DTYPE=(os.environ.get("COMPACT_DTYPE","0")=="1")
+    if COMPACT_DTYPE:
+        input_dtype=numpy.float32
+    else:
+        input_dtype=numpy.float64
+
+    # Everything other than the input data that the binned results depend on
+    #  (including this file, in case the binning code changes)
+    with open(os.path.abspath(__file__).replace(".pyc",".py"),"rb") as f:
+        code_hash=hashlib.sha1(f.read()).hexdigest()
+    binning_params=(BULK_TROPOSPHERIC_TEMPERATURE_MEASURE, \
+        cwv_bin_center.tolist(), temp_bin_center.tolist(), NUMBER_OF_REGIONS, \
+        PRECIP_THRESHOLD, os.environ["pr_conversion_factor"], \
+        PR_VAR, PRW_VAR, QSAT_INT_VAR, TAVE_VAR, LAT_VAR, \
+        hashlib.sha1(numpy.ascontiguousarray(REGION).tobytes()).hexdigest(), code_hash, \
+        COMPACT_DTYPE)
+
+    # Binning by calling convecTransBasic_binNumba (default) or convecTransBasic_binNumpy,
+    #  selected by BINNING_BACKEND in settings.yml
+    BINNING_BACKEND=os.environ.get("BINNING_BACKEND","numba")
+    if BINNING_BACKEND=="numba" and numba is None:
+        print("   numba not available; binning with NumPy instead")
+        BINNING_BACKEND="numpy"
+    if BINNING_BACKEND=="numpy":
+        bin_function=convecTransBasic_binNumpy
+    else:
+        bin_function=convecTransBasic_binNumba
 
     print("   Start binning...")
 
+    binned_list=[]
     for li in numpy.arange(len(pr_list)):
 
+        # Partial histograms are saved per set of input files; reuse them if
+        #  the files haven't changed since they were binned
+        input_files=[pr_list[li],prw_list[li],qsat_int_list[li]]
+        if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
+            input_files.append(tave_list[li])
+        if BIN_PARTIAL_DIR:
+            partial_filename=BIN_PARTIAL_DIR+"/"\
+                +convecTransBasic_binFingerprint(input_files,binning_params)+".npz"
+            if os.path.isfile(partial_filename):
+                print("      Binned results for "+", ".join(input_files)\
+                    +" unchanged; loaded from "+partial_filename)
+                binned_list.append(convecTransBasic_loadBinned(partial_filename))
+                continue
+
+        binned={
+            "P0":numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN)),
+            "P1":numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN)),
+            "P2":numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN)),
+            "PE":numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN)),
+            "Q0":numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN)),
+            "Q1":numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN)),
+            "cwv_bin_center":cwv_bin_center,
+            "temp_bin_center":temp_bin_center
+        }
+
+        # Only the tropical (20S-20N) slab is read, time_idx_delta time steps
+        #  at a time, so memory use is set by the chunk size, not the record length
         pr_netcdf=Dataset(pr_list[li],"r")
-        lat=numpy.asarray(pr_netcdf.variables[LAT_VAR][:],dtype="float")
-        pr=numpy.squeeze(numpy.asarray(pr_netcdf.variables[PR_VAR][:,:,:],dtype="float"))
-        pr_netcdf.close()
-        # Units: mm/s --> mm/hr
-        pr=pr[:,numpy.logical_and(lat>=-20.0,lat<=20.0),:]*3.6e3*float(os.environ["pr_conversion_factor"])
-        print("      "+pr_list[li]+" Loaded!")
-
+        pr_lat=tropical_lat_slice(pr_netcdf.variables[LAT_VAR][:])
         prw_netcdf=Dataset(prw_list[li],"r")
-        lat=numpy.asarray(prw_netcdf.variables[LAT_VAR][:],dtype="float")
-        prw=numpy.squeeze(numpy.asarray(prw_netcdf.variables[PRW_VAR][:,:,:],dtype="float"))
-        prw_netcdf.close()
-        prw=prw[:,numpy.logical_and(lat>=-20.0,lat<=20.0),:]
-        print("      "+prw_list[li]+" Loaded!")
-        
+        prw_lat=tropical_lat_slice(prw_netcdf.variables[LAT_VAR][:])
         qsat_int_netcdf=Dataset(qsat_int_list[li],"r")
-        lat=numpy.asarray(qsat_int_netcdf.variables[LAT_VAR][:],dtype="float")
-        qsat_int=numpy.squeeze(numpy.asarray(qsat_int_netcdf.variables[QSAT_INT_VAR][:,:,:],dtype="float"))
-        qsat_int_netcdf.close()
-        qsat_int=qsat_int[:,numpy.logical_and(lat>=-20.0,lat<=20.0),:]
-            
-        print("      "+qsat_int_list[li]+" Loaded!")
-            
+        qsat_int_lat=tropical_lat_slice(qsat_int_netcdf.variables[LAT_VAR][:])
         if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
             tave_netcdf=Dataset(tave_list[li],"r")
-            lat=numpy.asarray(tave_netcdf.variables[LAT_VAR][:],dtype="float")
-            tave=numpy.squeeze(numpy.asarray(tave_netcdf.variables[TAVE_VAR][:,:,:],dtype="float"))
-            tave_netcdf.close()
-            tave=tave[:,numpy.logical_and(lat>=-20.0,lat<=20.0),:]
-            
-            print("      "+tave_list[li]+" Loaded!")
-           
-        print("      Binning..."),
-        
-        ### Start binning
-        CWV=prw/CWV_BIN_WIDTH-0.5
-        CWV=CWV.astype(int)
-        RAIN=pr
+            tave_lat=tropical_lat_slice(tave_netcdf.variables[LAT_VAR][:])
         
-        RAIN[RAIN<0]=0 # Sometimes models produce negative rain rates
-        QSAT_INT=qsat_int
-        if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
-            TAVE=tave
-            temp=(TAVE-temp_offset)/temp_bin_width
-        elif BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==2:
-            temp=(QSAT_INT-temp_offset)/temp_bin_width
-        temp=temp.astype(int)
-
-        # Binning is structured in the following way to avoid potential round-off issue
-        #  (an issue arise when the total number of events reaches about 1e+8)
-        for lon_idx in numpy.arange(CWV.shape[2]):
-            p0=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-            p1=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-            p2=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-            pe=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_CWV_BIN,NUMBER_TEMP_BIN))
-            if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
-                q0=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
-                q1=numpy.zeros((NUMBER_OF_REGIONS,NUMBER_TEMP_BIN))
-                convecTransBasic_binTave(lon_idx, CWV_BIN_WIDTH, \
-                            NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, \
-                            REGION, CWV, RAIN, temp, QSAT_INT, \
-                            p0, p1, p2, pe, q0, q1)
-            elif BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==2:
-                convecTransBasic_binQsatInt(lon_idx, \
-                            NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, \
-                            REGION, CWV, RAIN, temp, \
-                            p0, p1, p2, pe)
-            P0+=p0
-            P1+=p1
-            P2+=p2
-            PE+=pe
+        print("      Binning "+pr_list[li]+", "+prw_list[li]+", "+qsat_int_list[li]\
+            +(", "+tave_list[li] if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1 else "")+"...")
+
+        time_idx_total=pr_netcdf.variables[PR_VAR].shape[0]
+        time_idx_start=0
+        while (time_idx_start<time_idx_total):
+            time_idx_end=min(time_idx_start+time_idx_delta,time_idx_total)
+
+            print("         Binning time steps "+str(time_idx_start)+"-"+str(time_idx_end)),
+
+            # Units: mm/s --> mm/hr
+            pr=numpy.asarray(pr_netcdf.variables[PR_VAR][time_idx_start:time_idx_end,pr_lat,:],dtype=input_dtype)
+            pr*=3.6e3
+            pr*=float(os.environ["pr_conversion_factor"])
+            prw=numpy.asarray(prw_netcdf.variables[PRW_VAR][time_idx_start:time_idx_end,prw_lat,:],dtype=input_dtype)
+            qsat_int=numpy.asarray(qsat_int_netcdf.variables[QSAT_INT_VAR][time_idx_start:time_idx_end,qsat_int_lat,:],dtype=input_dtype)
             if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
-                Q0+=q0
-                Q1+=q1
-        # end-for lon_idx
+                tave=numpy.asarray(tave_netcdf.variables[TAVE_VAR][time_idx_start:time_idx_end,tave_lat,:],dtype=input_dtype)
+            time_idx_start=time_idx_end
+
+            ### Start binning
+            numpy.maximum(pr,0,out=pr) # Sometimes models produce negative rain rates
+            if COMPACT_DTYPE:
+                # prw & tave (or qsat_int if it's the temperature measure, in
+                #  which case it isn't needed afterwards) are overwritten
+                prw/=CWV_BIN_WIDTH
+                prw-=0.5
+                CWV=convecTransBasic_compactBinIndex(prw,NUMBER_CWV_BIN)
+                if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
+                    temp=tave
+                elif BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==2:
+                    temp=qsat_int
+                temp-=temp_offset
+                temp/=temp_bin_width
+                temp=convecTransBasic_compactBinIndex(temp,NUMBER_TEMP_BIN)
+            else:
+                CWV=prw/CWV_BIN_WIDTH-0.5
+                CWV=CWV.astype(int)
+                if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
+                    temp=(tave-temp_offset)/temp_bin_width
+                elif BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==2:
+                    temp=(qsat_int-temp_offset)/temp_bin_width
+                temp=temp.astype(int)
+
+            p0,p1,p2,pe,q0,q1=bin_function(BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1, \
+                        CWV_BIN_WIDTH, NUMBER_OF_REGIONS, NUMBER_TEMP_BIN, NUMBER_CWV_BIN, PRECIP_THRESHOLD, \
+                        REGION, CWV, pr, temp, qsat_int)
+            binned["P0"]+=p0
+            binned["P1"]+=p1
+            binned["P2"]+=p2
+            binned["PE"]+=pe
+            binned["Q0"]+=q0
+            binned["Q1"]+=q1
+
+            print("...Complete!")
+        # End-while time_idx_start
 
-        print("...Complete for current files!")
+        pr_netcdf.close()
+        prw_netcdf.close()
+        qsat_int_netcdf.close()
+        if BULK_TROPOSPHERIC_TEMPERATURE_MEASURE==1:
+            tave_netcdf.close()
+
+        if BIN_PARTIAL_DIR:
+            convecTransBasic_saveBinned(partial_filename,binned)
+        binned_list.append(binned)
+
+        print("      ...Complete for current files!")
         
+    # Merge partial histograms of all input files
+    binned=convecTransBasic_mergeBinned(binned_list)
+    P0=binned["P0"]
+    P1=binned["P1"]
+    P2=binned["P2"]
+    PE=binned["PE"]
+    Q0=binned["Q0"]
+    Q1=binned["Q1"]
+
     print("   Total binning complete!")
 
     # Save Binning Results
@@ -752,22 +1068,9 @@ def convecTransBasic_plot(ret,argsv1,argsv2,*argsv3):
         #  But when models behave "funny" one may miss by turning on this section
         # For fitting procedure (finding critical CWV at which the precip picks up)
         #  Default: on
-        for reg in numpy.arange(P0_obs.shape[0]):
-            for Tidx in numpy.arange(P0_obs.shape[2]):
-                if t_reg_I_obs[reg,Tidx]:
-                    G=networkx.DiGraph()
-                    for cwv_idx in numpy.arange(pdf_gt_th_obs.shape[1]-1):
-                        if (pdf_gt_th_obs[reg,cwv_idx,Tidx]>0 and pdf_gt_th_obs[reg,cwv_idx+1,Tidx]>0):
-                            G.add_path([cwv_idx,cwv_idx+1])
-                    largest = max(networkx.weakly_connected_component_subgraphs(G),key=len)
-                    bcc=largest.nodes() # Biggest Connected Component
-                    if (sum(pdf_gt_th_obs[reg,bcc,Tidx])*CWV_BIN_WIDTH_obs>CWV_RANGE_THRESHOLD):
-                        t_reg_I_obs[reg,Tidx]=True
-                        #pdf_gt_th_obs[reg,:,Tidx]=0
-                        #pdf_gt_th_obs[reg,bcc,Tidx]=1
-                    else:
-                        t_reg_I_obs[reg,Tidx]=False
-                        #pdf_gt_th_obs[reg,:,Tidx]=0
+        bcc_length,bcc_mask=convecTransBasic_longestRun(pdf_gt_th_obs) # Biggest Connected Component
+        t_reg_I_obs=t_reg_I_obs&(bcc_length*CWV_BIN_WIDTH_obs>CWV_RANGE_THRESHOLD)
+        #pdf_gt_th_obs=numpy.where(t_reg_I_obs[:,None,:],bcc_mask,0)
         ### End of Connected Component Section    
 
         # Copy P1, CP into p1, cp for (temp,reg) with "wide CWV range" & "large PDF"
@@ -972,7 +1275,7 @@ def convecTransBasic_plot(ret,argsv1,argsv2,*argsv3):
 
         # set layout to tight (so that space between figures is minimized)
         fig_obs.tight_layout()
-        fig_obs.savefig(FIG_OBS_DIR+"/"+FIG_OBS_FILENAME, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
+        figure_sink.savefig(fig_obs,FIG_OBS_DIR+"/"+FIG_OBS_FILENAME, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
         
         print("...Completed!")
         print("      OBS Figure saved as "+FIG_OBS_DIR+"/"+FIG_OBS_FILENAME+"!")
@@ -1269,7 +1572,7 @@ def convecTransBasic_plot(ret,argsv1,argsv2,*argsv3):
 
     # set layout to tight (so that space between figures is minimized)
     fig.tight_layout()
-    fig.savefig(FIG_OUTPUT_DIR+"/"+FIG_OUTPUT_FILENAME, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
+    figure_sink.savefig(fig,FIG_OUTPUT_DIR+"/"+FIG_OUTPUT_FILENAME, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
     
     print("...Completed!")
     print("      Figure saved as "+FIG_OUTPUT_DIR+"/"+FIG_OUTPUT_FILENAME+"!")
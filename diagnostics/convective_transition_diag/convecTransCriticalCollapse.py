@@ -76,60 +76,64 @@
 # 
 # OPEN SOURCE COPYRIGHT Agreement TBA
 # ======================================================================
-# Import standard Python packages
-import glob
-import os
-import json
-
 # Import Python functions specific to Convective Transition Thermodynamic Critical
 from convecTransCriticalCollapse_util import convecTransCriticalCollapse_loadAnalyzedData
 from convecTransCriticalCollapse_util import convecTransCriticalCollapse_fitCritical
 from convecTransCriticalCollapse_util import convecTransCriticalCollapse_plot
-print("**************************************************")
-print("Excuting Convective Transition Critical Collapse (convecTransCriticalCollapse.py)......")
-print("**************************************************")
 
 # ======================================================================
-# Load user-specified parameters (usp) for FITTING and PLOTTING
-# This is in the diagnostics/convective_transition_diag folder under
-#  convecTransCriticalCollapse_usp.py
-print("Load user-specified binning parameters..."),
+# convecTransCriticalCollapse_run
+#  Fits & plots critical CWV; binned_model is the binned output returned by
+#  convecTransBasic_run (convecTransBasic.py) when both run in the same Python
+#  process; if it's None, binned MODEL data is read from the file saved by
+#  convecTransBasic.py
+def convecTransCriticalCollapse_run(binned_model=None):
+    print("**************************************************")
+    print("Excuting Convective Transition Critical Collapse (convecTransCriticalCollapse.py)......")
+    print("**************************************************")
 
-# Create and read user-specified parameters
-os.system("python "+os.environ["POD_HOME"]+"/convecTransCriticalCollapse_usp.py")
-with open(os.environ["WK_DIR"]+"/convecTransCriticalCollapse_parameters.json") as outfile:
-    params_data=json.load(outfile)
-print("...Loaded!")
+    # ======================================================================
+    # Load user-specified parameters (usp) for FITTING and PLOTTING
+    # This is in the diagnostics/convective_transition_diag folder under
+    #  convecTransCriticalCollapse_usp.py
+    #  (imported, not run as a separate script, so no json file is written or read)
+    print("Load user-specified binning parameters..."),
+    from convecTransCriticalCollapse_usp import data as params_data
+    print("...Loaded!")
 
-# ======================================================================
-# Check if binned MODEL data from convecTransBasic.py 
-#  exists in wkdir/casename/ from a previous computation
-if (len(params_data["bin_output_list"])!=0): # binned MODEL data exists
+    # ======================================================================
+    # Check if binned MODEL data from convecTransBasic.py 
+    #  was passed in, or exists in wkdir/casename/ from a previous computation
+    if binned_model is not None or len(params_data["bin_output_list"])!=0: # binned MODEL data exists
 
-    print("Binned output detected...")
-    binned_model=convecTransCriticalCollapse_loadAnalyzedData(params_data["args1"])
-    binned_obs=convecTransCriticalCollapse_loadAnalyzedData(params_data["args2"])
-    print("Binned output Loaded!")
+        if binned_model is None:
+            print("Binned output detected...")
+            binned_model=convecTransCriticalCollapse_loadAnalyzedData(params_data["args1"])
+        binned_obs=convecTransCriticalCollapse_loadAnalyzedData(params_data["args2"])
+        print("Binned output Loaded!")
 
-    print("Starting fitting procedure..."),  
-    plot_model=convecTransCriticalCollapse_fitCritical(binned_model,params_data["fit_model_params"])
-    plot_obs=convecTransCriticalCollapse_fitCritical(binned_obs,params_data["fit_obs_params"])
-    print("...Fitted!")
+        print("Starting fitting procedure..."),  
+        plot_model=convecTransCriticalCollapse_fitCritical(binned_model,params_data["fit_model_params"])
+        plot_obs=convecTransCriticalCollapse_fitCritical(binned_obs,params_data["fit_obs_params"])
+        print("...Fitted!")
 
-    # ======================================================================
-    # Plot binning results & save the figure in wkdir/casename/.../   
-    convecTransCriticalCollapse_plot(binned_model,plot_model,\
-                                 binned_obs,plot_obs,\
-                                 params_data["args3"],params_data["plot_params"])
-    print("Plotting Complete!") 
+        # ======================================================================
+        # Plot binning results & save the figure in wkdir/casename/.../   
+        convecTransCriticalCollapse_plot(binned_model,plot_model,\
+                                     binned_obs,plot_obs,\
+                                     params_data["args3"],params_data["plot_params"])
+        print("Plotting Complete!") 
+
+    else: 
+        print("Binned output from convecTransBasic.py does not exists!")
+        print("   If you are certain that binned output exists, "\
+              +"please double-check convecTransCriticalCollapse_usp.py, "\
+              +"making sure that it is consistent with "\
+              +"convecTransBasic_usp_calc.py & convecTransBasic_usp_plot.py!")
 
-else: 
-    print("Binned output from convecTransBasic.py does not exists!")
-    print("   If you are certain that binned output exists, "\
-          +"please double-check convecTransCriticalCollapse_usp.py, "\
-          +"making sure that it is consistent with "\
-          +"convecTransBasic_usp_calc.py & convecTransBasic_usp_plot.py!")
+    print("**************************************************")
+    print("Convective Transition Thermodynamic Critical Collapse (convecTransCriticalCollapse.py) Executed!")
+    print("**************************************************")
 
-print("**************************************************")
-print("Convective Transition Thermodynamic Critical Collapse (convecTransCriticalCollapse.py) Executed!")
-print("**************************************************")
+if __name__=="__main__":
+    convecTransCriticalCollapse_run()
@@ -326,5 +326,8 @@ for i in ['f1','f2','f3','f4','f5','f6']:
 
 data["plot_params"]=fig_params
 
-with open(os.environ["WK_DIR"]+"/convecTransCriticalCollapse_parameters.json", "w") as outfile:
-    json.dump(data, outfile)
+# When imported by convecTransCriticalCollapse.py, parameters are read from
+#  "data" directly; the json file is only written when this script is run on its own
+if __name__=="__main__":
+    with open(os.environ["WK_DIR"]+"/convecTransCriticalCollapse_parameters.json", "w") as outfile:
+        json.dump(data, outfile)
@@ -10,19 +10,27 @@
 #
 #   Including:
 #    (1) convecTransCriticalCollapse_loadAnalyzedData
-#    (2) convecTransCriticalCollapse_fitCritical
-#    (3) convecTransCriticalCollapse_plot
+#    (2) convecTransCriticalCollapse_interp
+#    (3) convecTransCriticalCollapse_fitCritical
+#    (4) convecTransCriticalCollapse_plot
 #    
 # ======================================================================
 # Import standard Python packages
 import numpy
 import glob
-from scipy.interpolate import interp1d
+import scipy.io
 from netCDF4 import Dataset
 import matplotlib.pyplot as mp
 import matplotlib.cm as cm
-import networkx
+import os
+import sys
+# Figures are saved through the framework's figure_sink, which writes the
+#  bitmap for the webpage directly instead of leaving PS -> bitmap conversion
+#  to the framework
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+import figure_sink
 import warnings
+from convecTransBasic_util import convecTransBasic_longestRun
 
 # ======================================================================
 # convecTransCriticalCollapse_loadAnalyzedData
@@ -92,6 +100,29 @@ def convecTransCriticalCollapse_loadAnalyzedData(*argsv):
     else: # If the binned model/obs data does not exist
         return [],[],[],[],[],[],[],[],[],[]
 
+# ======================================================================
+# convecTransCriticalCollapse_interp
+#  linear interpolation of y(x) at x_new, for many curves at once: x & y have
+#  the CWV bins along their last axis, and the result has x_new along its last
+#  axis; NaN outside the range of x
+# Same arithmetic as scipy.interpolate.interp1d (kind="linear",
+#  bounds_error=False), which would need a separate call per curve
+
+def convecTransCriticalCollapse_interp(x,y,x_new):
+    with numpy.errstate(invalid="ignore"):
+        hi=numpy.sum(x[...,:,None]<x_new,axis=-2)
+        out_of_bounds=(x_new<x[...,:1])|(x_new>x[...,-1:])
+    hi=numpy.clip(hi,1,x.shape[-1]-1)
+    lo=hi-1
+    x_lo=numpy.take_along_axis(x,lo,axis=-1)
+    x_hi=numpy.take_along_axis(x,hi,axis=-1)
+    y_lo=numpy.take_along_axis(y,lo,axis=-1)
+    y_hi=numpy.take_along_axis(y,hi,axis=-1)
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        y_new=(y_hi-y_lo)/(x_hi-x_lo)*(x_new-x_lo)+y_lo
+    y_new[out_of_bounds]=numpy.nan
+    return y_new
+
 # ======================================================================
 # convecTransCriticalCollapse_fitCritical
 #  fits the binned output to determine the critical CWV
@@ -127,9 +158,7 @@ def convecTransCriticalCollapse_fitCritical(argsv1,*argsv2):
         P0[P0==0.0]=numpy.nan
         P=P1/P0
         CP=PE/P0
-        PDF=numpy.zeros(P0.shape)
-        for reg in numpy.arange(P0.shape[0]):
-            PDF[reg,:,:]=P0[reg,:,:]/numpy.nansum(P0[reg,:,:])/CWV_BIN_WIDTH
+        PDF=P0/numpy.nansum(P0,axis=(1,2))[:,None,None]/CWV_BIN_WIDTH
         # Bins with PDF>PDF_THRESHOLD
         pdf_gt_th=numpy.zeros(PDF.shape)
         with numpy.errstate(invalid="ignore"):
@@ -142,7 +171,7 @@ def convecTransCriticalCollapse_fitCritical(argsv1,*argsv2):
         # Indicator of (temp,reg) with wide CWV range
         #  & other criteria specified below
         #  i.e., t_reg_I will be further modified below
-        t_reg_I=(numpy.squeeze(numpy.sum(pdf_gt_th,axis=1))*CWV_BIN_WIDTH>CWV_RANGE_THRESHOLD)
+        t_reg_I=(numpy.sum(pdf_gt_th,axis=1)*CWV_BIN_WIDTH>CWV_RANGE_THRESHOLD)
 
         ### Connected Component Section
         # The CWV_RANGE_THRESHOLD-Criterion must be satisfied by a connected component
@@ -151,59 +180,37 @@ def convecTransCriticalCollapse_fitCritical(argsv1,*argsv2):
         #  But when models behave "funny" one may miss by turning on this section
         # For fitting procedure (finding critical CWV at which the precip picks up)
         #  Default: on
-        for reg in numpy.arange(P0.shape[0]):
-            for Tidx in numpy.arange(P0.shape[2]):
-                if t_reg_I[reg,Tidx]:
-                    G=networkx.DiGraph()
-                    for cwv_idx in numpy.arange(pdf_gt_th.shape[1]-1):
-                        if (pdf_gt_th[reg,cwv_idx,Tidx]>0 and pdf_gt_th[reg,cwv_idx+1,Tidx]>0):
-                            G.add_path([cwv_idx,cwv_idx+1])
-                    largest = max(networkx.weakly_connected_component_subgraphs(G),key=len)
-                    bcc=largest.nodes() # Biggest Connected Component
-                    if (sum(pdf_gt_th[reg,bcc,Tidx])*CWV_BIN_WIDTH>CWV_RANGE_THRESHOLD):
-                        t_reg_I[reg,Tidx]=True
-                        pdf_gt_th[reg,:,Tidx]=0
-                        pdf_gt_th[reg,bcc,Tidx]=1
-                    else:
-                        t_reg_I[reg,Tidx]=False
-                        pdf_gt_th[reg,:,Tidx]=0
+        # Connected components are runs of consecutive CWV bins, found for all
+        #  (temp,reg) at once by convecTransBasic_longestRun
+        bcc_length,bcc_mask=convecTransBasic_longestRun(pdf_gt_th) # Biggest Connected Component
+        bcc_wide=(bcc_length*CWV_BIN_WIDTH>CWV_RANGE_THRESHOLD)
+        pdf_gt_th=numpy.where(t_reg_I[:,None,:],bcc_mask*bcc_wide[:,None,:],pdf_gt_th)
+        t_reg_I=t_reg_I&bcc_wide
         ### End of Connected Component Section
 
         # Copy P, CP into p, cp for (temp,reg) with "wide CWV range" & "large PDF"
-        p=numpy.zeros(P.shape)
-        cp=numpy.zeros(P.shape)
-        for reg in numpy.arange(P.shape[0]):
-            for Tidx in numpy.arange(P.shape[2]):
-                if t_reg_I[reg,Tidx]:
-                    p[reg,:,Tidx]=numpy.copy(P[reg,:,Tidx])
-                    cp[reg,:,Tidx]=numpy.copy(CP[reg,:,Tidx])
+        p=numpy.where(t_reg_I[:,None,:],P,0.0)
+        cp=numpy.where(t_reg_I[:,None,:],CP,0.0)
         p[pdf_gt_th==0]=numpy.nan
         cp[pdf_gt_th==0]=numpy.nan
 
         # Disgard (temp,reg) if conditional probability < CP_THRESHOLD
-        for reg in numpy.arange(P.shape[0]):
-            for Tidx in numpy.arange(P.shape[2]):
-                if (t_reg_I[reg,Tidx] and cp[reg,:,Tidx][cp[reg,:,Tidx]>=0.0].size>0):
-                    if (numpy.max(cp[reg,:,Tidx][cp[reg,:,Tidx]>=0])<CP_THRESHOLD):
-                        t_reg_I[reg,Tidx]=False
-                else:
-                    t_reg_I[reg,Tidx]=False
+        with numpy.errstate(invalid="ignore"):
+            cp_valid=(cp>=0.0)
+        cp_max=numpy.max(numpy.where(cp_valid,cp,-numpy.inf),axis=1)
+        t_reg_I=t_reg_I&numpy.any(cp_valid,axis=1)&(cp_max>=CP_THRESHOLD)
 
         # Find reference CWV (wr) at which P (or p1) equals PRECIP_REF
-        wr=numpy.zeros(t_reg_I.shape)
-        for reg in numpy.arange(t_reg_I.shape[0]):
-            for Tidx in numpy.arange(t_reg_I.shape[1]):
-                if t_reg_I[reg,Tidx]:
-                    p_gt_pref=p[reg,:,Tidx]>PRECIP_REF
-                    if numpy.nonzero(p_gt_pref)[0].size>0: # p_gt_pref non-empty
-                        wr_idx=numpy.nonzero(p_gt_pref)[0][0]
-                        wr_idx-=(p[reg,wr_idx,Tidx]-PRECIP_REF)/(p[reg,wr_idx,Tidx]-p[reg,wr_idx-1,Tidx])
-                        wr[reg,Tidx]=(wr_idx+1)*CWV_BIN_WIDTH
-                    else: # p1<PRECIP_REF, wr doesn't exist/noting to fit
-                        wr[reg,Tidx]=numpy.nan
-                        t_reg_I[reg,Tidx]=False
-                else:
-                    wr[reg,Tidx]=numpy.nan
+        #  by linear interpolation below the first bin with p>PRECIP_REF
+        with numpy.errstate(invalid="ignore"):
+            p_gt_pref=(p>PRECIP_REF)
+        t_reg_I=t_reg_I&numpy.any(p_gt_pref,axis=1) # otherwise wr doesn't exist/noting to fit
+        wr_idx=numpy.argmax(p_gt_pref,axis=1)
+        reg_idx,temp_idx=numpy.ogrid[:t_reg_I.shape[0],:t_reg_I.shape[1]]
+        p_wr=p[reg_idx,wr_idx,temp_idx]
+        p_wr_below=p[reg_idx,wr_idx-1,temp_idx]
+        with numpy.errstate(divide="ignore",invalid="ignore"):
+            wr=(wr_idx-(p_wr-PRECIP_REF)/(p_wr-p_wr_below)+1)*CWV_BIN_WIDTH
         wr[~t_reg_I]=numpy.nan
 
         # Temperature range for Fitting & Plotting
@@ -217,28 +224,26 @@ def convecTransCriticalCollapse_fitCritical(argsv1,*argsv2):
         al=numpy.zeros(t_reg_I.shape[0]) # al:alpha, slope of pickup asymptote
         cwvRange=numpy.linspace(CWV_FIT_RANGE_MIN,\
                                 CWV_FIT_RANGE_MAX,\
-                                (CWV_FIT_RANGE_MAX-CWV_FIT_RANGE_MIN)/CWV_BIN_WIDTH+1)
+                                int((CWV_FIT_RANGE_MAX-CWV_FIT_RANGE_MIN)/CWV_BIN_WIDTH+1))
 
         # Use the 3 most probable Temperature bins only
         #  These should best capture the pickup over tropical oceans
         #  assuming the model behaves
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            mpdf=numpy.nansum(PDF,axis=1) # marginal PDF
+        mp3t=numpy.argsort(mpdf,axis=1,kind="mergesort")[:,-3:]
+        reg_idx=numpy.arange(t_reg_I.shape[0])[:,None]
+        # Shift the pickup curves for all regions by wr & interpolate at once
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            p_mp3t=numpy.nanmean(convecTransCriticalCollapse_interp(\
+                cwv_bin_center[None,None,:]-wr[reg_idx,mp3t][:,:,None],\
+                p.transpose(0,2,1)[reg_idx,mp3t],cwvRange),axis=1)
+            fitRange=((p_mp3t>PRECIP_FIT_MIN)*(p_mp3t<PRECIP_FIT_MAX))
         for reg in numpy.arange(t_reg_I.shape[0]):
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                mpdf=numpy.nansum(PDF[reg,:,:],axis=0) # marginal PDF
-            mp3t=sorted(range(len(mpdf)), key=lambda k: mpdf[k])[-3:]
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                p_mp3t=numpy.nanmean(numpy.array([\
-                    interp1d(cwv_bin_center-wr[reg,mp3t[0]],p[reg,:,mp3t[0]],'linear', 0, True, False) (cwvRange),
-                    interp1d(cwv_bin_center-wr[reg,mp3t[1]],p[reg,:,mp3t[1]],'linear', 0, True, False) (cwvRange),
-                    interp1d(cwv_bin_center-wr[reg,mp3t[2]],p[reg,:,mp3t[2]],'linear', 0, True, False) (cwvRange)
-                                                 ]),axis=0)
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                fitRange=((p_mp3t>PRECIP_FIT_MIN)*(p_mp3t<PRECIP_FIT_MAX))
-            if (numpy.nonzero(fitRange)[0].size>1): # Fitting requires at least 2 points
-                fitResult=numpy.polyfit(cwvRange[fitRange],p_mp3t[fitRange],1)
+            if (numpy.nonzero(fitRange[reg])[0].size>1): # Fitting requires at least 2 points
+                fitResult=numpy.polyfit(cwvRange[fitRange[reg]],p_mp3t[reg,fitRange[reg]],1)
                 wc[reg,:]=wr[reg,:]-fitResult[1]/fitResult[0] # wc=wr-(wr-wc)
                 al[reg]=fitResult[0]
             else: # Can't fit
@@ -507,7 +512,7 @@ def convecTransCriticalCollapse_plot(argsv1,argsv2,argsv3,argsv4,argsv5,argsv6):
 
         # set layout to tight (so that space between figures is minimized)
         fig_obs_cts.tight_layout()
-        fig_obs_cts.savefig(FIG_OBS_DIR+"/"+FIG_OBS_FILENAME_CTS, bbox_inches="tight", bbox_extra_artists=(leg,leg2,title_text,footnote,))
+        figure_sink.savefig(fig_obs_cts,FIG_OBS_DIR+"/"+FIG_OBS_FILENAME_CTS, bbox_inches="tight", bbox_extra_artists=(leg,leg2,title_text,footnote,))
 
         ##### Figure Critical CWV (WC) #####
         fig_obs_wc = mp.figure(figsize=(figsize1/1.5,figsize2/2.6))
@@ -591,7 +596,7 @@ def convecTransCriticalCollapse_plot(argsv1,argsv2,argsv3,argsv4,argsv5,argsv6):
 
         # set layout to tight (so that space between figures is minimized)
         fig_obs_wc.tight_layout()
-        fig_obs_wc.savefig(FIG_OBS_DIR+"/"+FIG_OBS_FILENAME_WC, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
+        figure_sink.savefig(fig_obs_wc,FIG_OBS_DIR+"/"+FIG_OBS_FILENAME_WC, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
 
         print("...Completed!")
         print("      OBS Figure saved as "+FIG_OBS_DIR+"/"+FIG_OBS_FILENAME_CTS+"!")
@@ -790,7 +795,7 @@ def convecTransCriticalCollapse_plot(argsv1,argsv2,argsv3,argsv4,argsv5,argsv6):
     leg2.legendHandles[0].set_color('black')
     # set layout to tight (so that space between figures is minimized)
     fig_cts.tight_layout()
-    fig_cts.savefig(FIG_OUTPUT_DIR+"/"+FIG_FILENAME_CTS, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
+    figure_sink.savefig(fig_cts,FIG_OUTPUT_DIR+"/"+FIG_FILENAME_CTS, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
 
     ##### Figure Critical CWV (WC) #####
     fig_wc = mp.figure(figsize=(figsize1/1.5,figsize2/2.6))
@@ -899,7 +904,7 @@ def convecTransCriticalCollapse_plot(argsv1,argsv2,argsv3,argsv4,argsv5,argsv6):
 
     # set layout to tight (so that space between figures is minimized)
     fig_wc.tight_layout()
-    fig_wc.savefig(FIG_OUTPUT_DIR+"/"+FIG_FILENAME_WC, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
+    figure_sink.savefig(fig_wc,FIG_OUTPUT_DIR+"/"+FIG_FILENAME_WC, bbox_inches="tight", bbox_extra_artists=(leg,title_text,footnote,))
     
     print("...Completed!")
     print("      MODEL Figure saved as "+FIG_OUTPUT_DIR+"/"+FIG_FILENAME_CTS+"!")
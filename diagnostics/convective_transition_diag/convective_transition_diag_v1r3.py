@@ -37,7 +37,7 @@
 #   (**$ver depends on the actual version of the MDTF code package)
 #
 #   This package is written in Python 2, and requires the following Python packages:
-#    os,glob,json,Dataset,numpy,scipy,matplotlib, networkx,warnings,numba, netcdf4
+#    os,glob,json,Dataset,numpy,scipy,matplotlib,warnings,numba, netcdf4
 #   The plotting functions in this package depend on an older version of matplotlib, 
 #    thus an older version of the Anaconda 2 installer (ver. 5.0.1) is recommended
 #
@@ -61,8 +61,15 @@
 # ======================================================================
 # Import standard Python packages
 import os
-import glob
+import sys
+import traceback
+sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+from data_catalog import DataCatalog
 
+# Binning runs in parallel with numba; use the cores the framework reserved
+#  for this POD (cores in settings.yml) unless set explicitly
+if "POD_CORES" in os.environ and "NUMBA_NUM_THREADS" not in os.environ:
+    os.environ["NUMBA_NUM_THREADS"]=os.environ["POD_CORES"]
 
 os.environ["pr_file"] = "*."+os.environ["pr_var"]+".1hr.nc"
 os.environ["prw_file"] = "*."+os.environ["prw_var"]+".1hr.nc"
@@ -78,19 +85,23 @@ os.environ["MODEL_OUTPUT_DIR"]=os.environ["DATADIR"]+"/1hr"
 #os.environ["tave_file"] = "*."+os.environ["tave_var"]+".1hr.nc"
 #os.environ["qsat_int_file"] = "*."+os.environ["qsat_int_var"]+".1hr.nc"
 
+# Look files up in the framework's index of the model data directory
+catalog = DataCatalog(os.environ["DATADIR"], \
+    os.path.join(os.environ["WORKING_DIR"], "data_catalog"))
+
 missing_file=0
-if len(glob.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["pr_file"]))==0:
+if len(catalog.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["pr_file"]))==0:
     print("Required Precipitation data missing!")
     missing_file=1
-if len(glob.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["prw_file"]))==0:
+if len(catalog.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["prw_file"]))==0:
     print("Required Precipitable Water Vapor (CWV) data missing!")
     missing_file=1
-if len(glob.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["ta_file"]))==0:
+if len(catalog.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["ta_file"]))==0:
     if (os.environ["BULK_TROPOSPHERIC_TEMPERATURE_MEASURE"]=="2" and \
-       len(glob.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["qsat_int_file"]))==0) \
+       len(catalog.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["qsat_int_file"]))==0) \
     or (os.environ["BULK_TROPOSPHERIC_TEMPERATURE_MEASURE"]=="1" and \
-       (len(glob.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["qsat_int_file"]))==0 or \
-        len(glob.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["tave_file"]))==0)):
+       (len(catalog.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["qsat_int_file"]))==0 or \
+        len(catalog.glob(os.environ["MODEL_OUTPUT_DIR"]+"/"+os.environ["tave_file"]))==0)):
         print("Required Temperature data missing!")
         missing_file=1
 
@@ -102,10 +113,16 @@ else:
     # ======================================================================
     # Convective Transition Basic Statistics
     #  See convecTransBasic.py for detailed info
+    # Both functionalities run in this Python process (see convecTransBasic.py
+    #  & convecTransCriticalCollapse.py), so the binned output is passed on in memory
+    from convecTransBasic import convecTransBasic_run
+    from convecTransCriticalCollapse import convecTransCriticalCollapse_run
+    binned_output=None
     try:
-        os.system("python "+os.environ["POD_HOME"]+"/"+"convecTransBasic.py")
-    except OSError as e:
-        print('WARNING',e.errno,e.strerror)
+        binned_output=convecTransBasic_run()
+    except Exception as e:
+        traceback.print_exc()
+        print('WARNING',e)
         print("**************************************************")
         print("Convective Transition Basic Statistics (convecTransBasic.py) is NOT Executed as Expected!")		
         print("**************************************************")
@@ -115,9 +132,10 @@ else:
     ##  Requires output from convecTransBasic.py
     ##  See convecTransCriticalCollapse.py for detailed info
     try:
-        os.system("python "+os.environ["POD_HOME"]+"/"+"convecTransCriticalCollapse.py")
-    except OSError as e:
-        print('WARNING',e.errno,e.strerror)
+        convecTransCriticalCollapse_run(binned_output)
+    except Exception as e:
+        traceback.print_exc()
+        print('WARNING',e)
         print("**************************************************")
         print("Convective Transition Thermodynamic Critical Collapse (convecTransCriticalCollapse.py) is NOT Executed as Expected!")		
         print("**************************************************")
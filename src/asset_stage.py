@@ -0,0 +1,149 @@
+"""Copy a POD's static files (documentation PDFs and premade obs figures) to
+its output directory, without duplicating data that's already there.
+
+Each file is staged by :func:`stage`:
+
+1. If the destination already has the same contents as the source, it's left
+   alone. Files are compared by size and modification time, and by SHA-1 hash
+   if only the modification times differ.
+2. Otherwise, if the source and destination are on the same filesystem, the
+   destination is made a reflink (copy-on-write clone, on filesystems that
+   support it) or, if hardlinks are allowed, a hardlink of the source.
+3. Otherwise the source is copied.
+
+The destination is replaced by renaming a temporary file, so a file that's
+hardlinked to a source from a previous run is never written through.
+:func:`stage_files` stages a list of files concurrently.
+"""
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request to clone a file's extents (Linux btrfs/XFS/etc.)
+_FICLONE = 0x40049409
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def same_contents(src, dest):
+    """True if `dest` is a file with the same contents as `src`: same file, or
+    same size and modification time, or same size and SHA-1 hash.
+    """
+    try:
+        src_st = os.stat(src)
+        dest_st = os.stat(dest)
+    except OSError:
+        return False
+    if (src_st.st_dev, src_st.st_ino) == (dest_st.st_dev, dest_st.st_ino):
+        return True
+    if src_st.st_size != dest_st.st_size:
+        return False
+    if int(src_st.st_mtime) == int(dest_st.st_mtime):
+        return True
+    if _file_hash(src) != _file_hash(dest):
+        return False
+    # record the match, so the hash doesn't need to be recomputed next time
+    os.utime(dest, (src_st.st_atime, src_st.st_mtime))
+    return True
+
+def _reflink(src, dest):
+    """Private function: make `dest` a copy-on-write clone of `src`."""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflinks not supported", src)
+    with open(src, 'rb') as src_f:
+        with open(dest, 'wb') as dest_f:
+            fcntl.ioctl(dest_f.fileno(), _FICLONE, src_f.fileno())
+    shutil.copystat(src, dest)
+
+def stage(src, dest, hardlink=True):
+    """Make `dest` a copy of `src` as described in the module docstring.
+
+    Args:
+        src (:obj:`str`): Path to the file to stage.
+        dest (:obj:`str`): Path to stage it to (not a directory).
+        hardlink (:obj:`bool`, optional): Whether to hardlink `dest` to `src`
+            if they're on the same filesystem and reflinks aren't supported.
+            Default True.
+
+    Returns:
+        :obj:`str`: How the file was staged: 'unchanged', 'reflinked',
+        'linked' or 'copied'.
+    """
+    if same_contents(src, dest):
+        return 'unchanged'
+    dest_dir = os.path.dirname(dest)
+    if not os.path.isdir(dest_dir):
+        try:
+            os.makedirs(dest_dir)
+        except OSError:
+            if not os.path.isdir(dest_dir):
+                raise
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        method = None
+        if os.stat(src).st_dev == os.stat(dest_dir).st_dev:
+            try:
+                _reflink(src, tmp_path)
+                method = 'reflinked'
+            except (IOError, OSError):
+                if hardlink:
+                    os.remove(tmp_path)
+                    try:
+                        os.link(src, tmp_path)
+                        method = 'linked'
+                    except OSError:
+                        pass
+        if method is None:
+            shutil.copy2(src, tmp_path)
+            method = 'copied'
+        os.rename(tmp_path, dest)
+    except:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return method
+
+def stage_files(pairs, hardlink=True, threads=0):
+    """Stage each (source, destination) pair in `pairs` with :func:`stage`,
+    concurrently.
+
+    Args:
+        pairs (:obj:`list`): (source, destination) paths of files to stage.
+        hardlink (:obj:`bool`, optional): Passed to :func:`stage`.
+        threads (:obj:`int`, optional): Max number of files to stage at once.
+            Default 0 means one per CPU.
+
+    Returns:
+        :obj:`list` of the result of :func:`stage` for each pair, or of the
+        exception raised if staging failed.
+    """
+    if not pairs:
+        return []
+    if threads <= 0:
+        threads = multiprocessing.cpu_count()
+
+    def _stage(pair):
+        try:
+            return stage(pair[0], pair[1], hardlink)
+        except Exception as exc:
+            return exc
+
+    pool = ThreadPool(max(min(len(pairs), threads), 1))
+    results = pool.map(_stage, pairs)
+    pool.close()
+    pool.join()
+    return results
@@ -0,0 +1,254 @@
+"""Index of the model data files available for a case.
+
+Looking up data files one at a time with :func:`os.path.isfile` or
+:func:`glob.glob` costs a filesystem call per lookup, which is slow on
+parallel filesystems. :class:`DataCatalog` lists the case's data directory
+once, saves the listing, and answers lookups from memory. The saved listing is
+reused by later runs (and by PODs) as long as the modification times of the
+directories in it haven't changed.
+
+This module is also imported by POD scripts, so it only depends on the standard
+library::
+
+    import os, sys
+    sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+    from data_catalog import DataCatalog
+    catalog = DataCatalog(os.environ["DATADIR"],
+        os.path.join(os.environ["WORKING_DIR"], "data_catalog"))
+"""
+import os
+import re
+import glob
+import json
+import fnmatch
+import hashlib
+import tempfile
+
+_date_range_regex = re.compile(r'^\d{4,8}-\d{4,8}$')
+
+class DataCatalog(object):
+    """Catalog of the files under one case's model data directory.
+
+    Files named following the convention of :func:`util.makefilepath`,
+    ``<CASENAME>.<variable>.<freq>.nc``, optionally with a date range
+    ``<CASENAME>.<variable>.<freq>.<YYYYMMDD>-<YYYYMMDD>.nc``, are also indexed by
+    variable and frequency.
+    """
+    def __init__(self, root_dir, index_dir='', verbose=0):
+        """
+        Args:
+            root_dir (:obj:`str`): Directory to catalog, eg. MODEL_DATA_DIR.
+            index_dir (:obj:`str`, optional): Directory to save the index in,
+                so it can be reused. Default '' doesn't save it.
+            verbose (:obj:`int`, optional): Logging verbosity level. Default 0.
+        """
+        self.root_dir = os.path.realpath(root_dir)
+        # lookups are matched against these without touching the filesystem
+        self._roots = set([self.root_dir, os.path.normpath(os.path.abspath(root_dir))])
+        if index_dir:
+            digest = hashlib.sha1(self.root_dir.encode('utf-8')).hexdigest()
+            self.index_file = os.path.join(index_dir, digest + '.json')
+        else:
+            self.index_file = ''
+        self.dir_mtimes = {}
+        self.files = {}
+        self.entries = {}
+        # True if files were added since the index was saved
+        self.modified = False
+        if not self._load():
+            if verbose > 0: print("Indexing files in " + self.root_dir)
+            self._build()
+            self.save()
+        self._parse_entries()
+
+    def _load(self):
+        """Private method: read the saved index if it's still current.
+
+        Returns:
+            :obj:`bool`: True if the saved index was used.
+        """
+        if not self.index_file or not os.path.isfile(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'r') as f:
+                d = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if d.get('root_dir', '') != self.root_dir:
+            return False
+        # adding, removing or renaming a file changes its directory's mtime
+        for dir_path, mtime in d['dir_mtimes'].items():
+            try:
+                if os.path.getmtime(os.path.join(self.root_dir, dir_path)) != mtime:
+                    return False
+            except OSError:
+                return False
+        self.dir_mtimes = d['dir_mtimes']
+        self.files = dict((k, set(v)) for k, v in d['files'].items())
+        return True
+
+    def _build(self):
+        """Private method: list every directory under :attr:`root_dir` once."""
+        self.dir_mtimes = {}
+        self.files = {}
+        for root, dirs, files in os.walk(self.root_dir, followlinks=True):
+            rel_dir = os.path.relpath(root, self.root_dir)
+            self.dir_mtimes[rel_dir] = os.path.getmtime(root)
+            self.files[rel_dir] = set(files)
+
+    def save(self):
+        """Save the index to :attr:`index_file`, if one was given."""
+        self.modified = False
+        if not self.index_file:
+            return
+        index_dir = os.path.dirname(self.index_file)
+        try:
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+            # write to a temporary file and rename, so concurrent readers
+            # never see a partial index
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'root_dir': self.root_dir,
+                    'dir_mtimes': self.dir_mtimes,
+                    'files': dict((k, sorted(v)) for k, v in self.files.items())
+                }, f)
+            os.rename(tmp_path, self.index_file)
+        except (IOError, OSError):
+            print("WARNING: couldn't save data catalog to " + self.index_file)
+
+    def _parse_entries(self):
+        """Private method: index files by (variable, frequency)."""
+        self.entries = {}
+        for rel_dir, files in self.files.items():
+            for file_name in files:
+                key, entry = self._parse_entry(rel_dir, file_name)
+                if key is not None:
+                    self.entries.setdefault(key, []).append(entry)
+        for val in self.entries.values():
+            val.sort(key=lambda e: e['path'])
+
+    def _parse_entry(self, rel_dir, file_name):
+        """Private method: return the (variable, frequency) key and entry for
+        a file, or (None, None) if it's not named following the convention.
+        """
+        tokens = file_name.split('.')
+        if len(tokens) < 4 or tokens[-1] != 'nc':
+            return (None, None)
+        if _date_range_regex.match(tokens[-2]) and len(tokens) >= 5:
+            date_range = tuple(tokens[-2].split('-'))
+            tokens = tokens[:-2]
+        else:
+            date_range = None
+            tokens = tokens[:-1]
+        entry = {
+            'path': self._abspath(rel_dir, file_name),
+            'CASENAME': '.'.join(tokens[:-2]),
+            'date_range': date_range
+        }
+        return ((tokens[-2], tokens[-1]), entry)
+
+    def add(self, path):
+        """Add a file created under :attr:`root_dir` since it was indexed, eg.
+        by a data fetch, without listing any directories again. The mtimes of
+        its directory (and of any directories created for it) are updated, so
+        call :meth:`save` once all files have been added.
+
+        Dicts are replaced rather than modified, so lookups from other threads
+        don't need a lock; concurrent calls to :meth:`add` do.
+
+        Returns:
+            :obj:`bool`: True if `path` is a file in the catalog.
+        """
+        rel_path = self._relpath(path)
+        if rel_path is None:
+            return False
+        rel_dir, file_name = os.path.split(rel_path)
+        rel_dir = rel_dir or '.'
+        if file_name in self.files.get(rel_dir, ()):
+            return True
+        if not os.path.isfile(path):
+            return False
+        files = dict(self.files)
+        dir_mtimes = dict(self.dir_mtimes)
+        files[rel_dir] = files.get(rel_dir, set()) | set([file_name])
+        # creating the file changed its directory's mtime; a new directory 
+        # also changed its parent's
+        d = rel_dir
+        while True:
+            is_new = d not in self.files
+            files.setdefault(d, set())
+            dir_mtimes[d] = os.path.getmtime(os.path.join(self.root_dir, d))
+            if not is_new or d == '.':
+                break
+            d = os.path.dirname(d) or '.'
+        key, entry = self._parse_entry(rel_dir, file_name)
+        if key is not None:
+            entries = dict(self.entries)
+            entries[key] = sorted(entries.get(key, []) + [entry], 
+                key=lambda e: e['path'])
+            self.entries = entries
+        self.dir_mtimes = dir_mtimes
+        self.files = files
+        self.modified = True
+        return True
+
+    def _abspath(self, rel_dir, file_name):
+        return os.path.normpath(os.path.join(self.root_dir, rel_dir, file_name))
+
+    def _relpath(self, path):
+        """Private method: return `path` relative to :attr:`root_dir`, or None
+        if it's not under it. Paths are compared as strings first, so most
+        lookups make no filesystem calls; symlinks are only resolved (which
+        stats each component of the path) if that fails.
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        for root in self._roots:
+            if path == root:
+                return os.curdir
+            prefix = os.path.join(root, '')
+            if path.startswith(prefix):
+                return path[len(prefix):]
+        rel_path = os.path.relpath(os.path.realpath(path), self.root_dir)
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+            return None
+        return rel_path
+
+    def isfile(self, path):
+        """Equivalent of :func:`os.path.isfile` for paths under
+        :attr:`root_dir`.
+        """
+        rel_path = self._relpath(path)
+        if rel_path is None:
+            return os.path.isfile(path) # not in catalog
+        rel_dir, file_name = os.path.split(rel_path)
+        return file_name in self.files.get(rel_dir or '.', ())
+
+    def find(self, varname, freq, casename=None):
+        """Return sorted :obj:`list` of paths to files for a variable (as named
+        in the model's convention) at a given frequency, optionally only for
+        one case.
+        """
+        return [e['path'] for e in self.entries.get((varname, freq), []) \
+            if casename is None or e['CASENAME'] == casename]
+
+    def glob(self, pattern):
+        """Equivalent of :func:`glob.glob` for patterns under
+        :attr:`root_dir`. Returns a sorted :obj:`list`.
+        """
+        rel_pattern = self._relpath(pattern)
+        if rel_pattern is None:
+            return sorted(glob.glob(pattern)) # not in catalog
+        dir_pattern, file_pattern = os.path.split(rel_pattern)
+        dir_pattern = dir_pattern or '.'
+        depth = dir_pattern.count(os.sep)
+        found = []
+        for rel_dir, files in self.files.items():
+            # unlike glob, fnmatch lets '*' match across directories
+            if rel_dir.count(os.sep) != depth \
+                or not fnmatch.fnmatchcase(rel_dir, dir_pattern):
+                continue
+            found.extend([self._abspath(rel_dir, f) for f in files \
+                if fnmatch.fnmatchcase(f, file_pattern)])
+        return sorted(found)
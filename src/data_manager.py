@@ -2,9 +2,69 @@ import os
 import sys
 import glob
 import shutil
+import json
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from abc import ABCMeta, abstractmethod
 import util
 from util import setenv # fix
+from data_catalog import DataCatalog
+import time_subset
+import html_report
+from output_archive import OutputArchive
+
+class FetchPlan(object):
+    """Datasets needed by a case's PODs, with each dataset listed once no
+    matter how many PODs request it. Datasets are identified by their name in
+    the model's convention and their frequency.
+
+    Each dataset has a :class:`threading.Event` that's set once it's been 
+    fetched (or fetching it failed), so PODs can be started as soon as all 
+    their datasets are done.
+    """
+    def __init__(self):
+        self._datasets = OrderedDict()
+        self._consumers = {}
+        self._done = {}
+
+    @staticmethod
+    def key(dataspec_dict):
+        return (dataspec_dict['name_in_model'], dataspec_dict['freq'])
+
+    def add(self, dataspec_dict, pod_name):
+        """Add a dataset needed by POD `pod_name`, if it's not already in the 
+        plan.
+        """
+        key = self.key(dataspec_dict)
+        if key not in self._datasets:
+            self._datasets[key] = dataspec_dict
+            self._consumers[key] = []
+            self._done[key] = threading.Event()
+        if pod_name not in self._consumers[key]:
+            self._consumers[key].append(pod_name)
+
+    def consumers(self, dataspec_dict):
+        """Return :obj:`list` of names of PODs that need a dataset."""
+        return self._consumers.get(self.key(dataspec_dict), [])
+
+    def mark_done(self, dataspec_dict):
+        self._done[self.key(dataspec_dict)].set()
+
+    def is_done(self, dataspec_dict):
+        return self._done[self.key(dataspec_dict)].is_set()
+
+    def pod_ready(self, pod_name):
+        """True if all datasets needed by POD `pod_name` are done."""
+        return all(self._done[k].is_set() for k, pods in self._consumers.items() \
+            if pod_name in pods)
+
+    def __iter__(self):
+        return iter(self._datasets.values())
+
+    def __len__(self):
+        return len(self._datasets)
+
 
 class DataManager(object):
     # analogue of TestFixture in xUnit
@@ -26,67 +86,108 @@ class DataManager(object):
         else:
             self.pod_list = config['pod_list'] # use global list of PODs      
         self.pods = []
+        # Environment variables for this case only; passed explicitly to 
+        # the PODs' subprocesses instead of being set in os.environ
+        self.envvars = {}
+        self.catalog = None
+        self.data_to_fetch = FetchPlan()
+        # max number of datasets to fetch at once
+        self.max_fetch_workers = config.get('settings', {}).get('max_concurrent_fetches', 4)
+        # write copies of data restricted to FIRSTYR-LASTYR for the PODs
+        self.subset_time_range = config.get('settings', {}).get('subset_time_range', False)
+        # compression and number of compression threads for the .tar output
+        self.tar_compression = config.get('settings', {}).get('tar_compression', '')
+        self.tar_threads = config.get('settings', {}).get('tar_threads', 1)
+        self._archive = None
+        self._fetch_pool = None
+        self._fetch_errors = []
+        self._catalog_lock = threading.Lock()
 
         paths = util.PathManager()
         self.__dict__.update(paths.modelPaths(self))
+        self.MODEL_SUBSET_DIR = os.path.join(self.MODEL_WK_DIR, 'model_data')
 
     # -------------------------------------
 
     def setUp(self, config):
         self._setup_model_paths()
+        self._setup_catalog()
         self._set_model_env_vars(config)
         self._setup_html()
         for pod in self.pods:
             self._setup_pod(pod)
 
     def _setup_model_paths(self, verbose=0):
+        create_dirs = [self.MODEL_WK_DIR]
+        if self.subset_time_range:
+            create_dirs.append(self.MODEL_SUBSET_DIR)
         util.check_required_dirs(
             already_exist =[self.MODEL_DATA_DIR], 
-            create_if_nec = [self.MODEL_WK_DIR], 
+            create_if_nec = create_dirs, 
             verbose=verbose)
 
+    @property
+    def pod_data_dir(self):
+        """Directory the PODs read model data from (DATADIR): MODEL_DATA_DIR,
+        or the time-subset copies in MODEL_WK_DIR/model_data if 
+        ``subset_time_range`` is set.
+        """
+        if self.subset_time_range:
+            return self.MODEL_SUBSET_DIR
+        return self.MODEL_DATA_DIR
+
+    def _setup_catalog(self, verbose=0):
+        """Index the files in MODEL_DATA_DIR, so that data can be looked up 
+        without a filesystem call per file. The index is kept in 
+        WORKING_DIR/data_catalog and reused while MODEL_DATA_DIR is unchanged.
+        """
+        paths = util.PathManager()
+        self.catalog = DataCatalog(self.MODEL_DATA_DIR, 
+            os.path.join(paths.WORKING_DIR, 'data_catalog'), verbose=verbose)
+        for pod in self.pods:
+            pod.catalog = self.catalog
+
     def _set_model_env_vars(self, config, verbose=0):
-        setenv("DATADIR", self.MODEL_DATA_DIR, config['envvars'],
+        # start from a copy of the global settings so that cases don't see
+        # each other's variables
+        self.envvars = config['envvars'].copy()
+        setenv("DATADIR", self.pod_data_dir, self.envvars,
             verbose=verbose)
-        setenv("variab_dir", self.MODEL_WK_DIR, config['envvars'],
+        setenv("variab_dir", self.MODEL_WK_DIR, self.envvars,
             verbose=verbose)
 
-        setenv("CASENAME", self.case_name, config['envvars'],
+        setenv("CASENAME", self.case_name, self.envvars,
             verbose=verbose)
-        setenv("model", self.model_name, config['envvars'],
+        setenv("model", self.model_name, self.envvars,
             verbose=verbose)
-        setenv("FIRSTYR", self.firstyr, config['envvars'],
+        setenv("FIRSTYR", self.firstyr, self.envvars,
             verbose=verbose)
-        setenv("LASTYR", self.lastyr, config['envvars'],
+        setenv("LASTYR", self.lastyr, self.envvars,
             verbose=verbose)
 
         translate = util.VariableTranslator()
-        # todo: set/unset for multiple models
         # verify all vars requested by PODs have been set
         assert self.convention in translate.field_dict, \
             "Variable name translation doesn't recognize {}.".format(self.convention)
         for key, val in translate.field_dict[self.convention].items():
-            setenv(key, val, config['envvars'], verbose=verbose)
+            setenv(key, val, self.envvars, verbose=verbose)
 
     def _setup_html(self):
-        if os.path.isfile(os.path.join(self.MODEL_WK_DIR, 'index.html')):
-            print("WARNING: index.html exists, not re-creating.")
-        else: 
-            paths = util.PathManager()
-            html_dir = os.path.join(paths.CODE_ROOT, 'src', 'html')
-            shutil.copy2(
-                os.path.join(html_dir, 'mdtf_diag_banner.png'), self.MODEL_WK_DIR
-            )
-            shutil.copy2(
-                os.path.join(html_dir, 'mdtf1.html'), 
-                os.path.join(self.MODEL_WK_DIR, 'index.html')
-            )
+        # index.html itself is written by _makeRunReport once PODs have run
+        paths = util.PathManager()
+        html_dir = os.path.join(paths.CODE_ROOT, 'src', 'html')
+        shutil.copy2(
+            os.path.join(html_dir, 'mdtf_diag_banner.png'), self.MODEL_WK_DIR
+        )
 
     def _setup_pod(self, pod):
         paths = util.PathManager()
         translate = util.VariableTranslator()
         pod.__dict__.update(paths.modelPaths(self))
         pod.__dict__.update(paths.podPaths(pod))
+        # POD-specific variables are added to this by Diagnostic.setUp()
+        pod.envvars = self.envvars.copy()
+        pod.catalog = self.catalog
         for idx, var in enumerate(pod.varlist):
             cf_name = translate.toCF(pod.convention, var['var_name'])
             pod.varlist[idx]['CF_name'] = cf_name
@@ -100,28 +201,121 @@ class DataManager(object):
 
     # -------------------------------------
 
-    def fetchData(self):
+    def fetchData(self, wait=True):
+        """Fetch all datasets in the plan made by :meth:`planData`, with up to
+        ``max_concurrent_fetches`` fetches running at once.
+
+        Args:
+            wait (:obj:`bool`, optional): If False, return immediately and 
+                fetch in the background; use :meth:`podDataReady` to see when
+                a POD's data is available and :meth:`waitForData` to wait for 
+                all fetches to finish. Default True.
+        """
         self.planData()
+        self._fetch_errors = []
+        n_workers = self.max_fetch_workers or len(self.data_to_fetch)
+        self._fetch_pool = ThreadPool(max(n_workers, 1))
         for var in self.data_to_fetch:
-            self.fetchDataset(var)
+            self._fetch_pool.apply_async(self._fetchAndMark, (var,))
+        self._fetch_pool.close()
+        if wait:
+            self.waitForData()
+
+    def _fetchAndMark(self, dataspec_dict):
+        try:
+            self.fetchDataset(dataspec_dict)
+            if self.subset_time_range:
+                self._subsetDataset(dataspec_dict)
+        except (Exception, SystemExit) as exc:
+            # exit() in a pool thread would hang the pool; re-raise it in
+            # waitForData instead
+            print "ERROR: couldn't fetch {} at {} frequency: {}".format(
+                dataspec_dict['name_in_model'], dataspec_dict['freq'], exc)
+            self._fetch_errors.append(exc)
+        finally:
+            # add the fetched file to the catalog; the index is saved once all
+            # fetches are done, in waitForData
+            with self._catalog_lock:
+                self.catalog.add(util.makefilepath(
+                    dataspec_dict['name_in_model'], dataspec_dict['freq'],
+                    self.case_name, self.MODEL_DATA_DIR))
+            self.data_to_fetch.mark_done(dataspec_dict)
+
+    def _subsetDataset(self, dataspec_dict):
+        """Write the years FIRSTYR to LASTYR of a fetched dataset to 
+        MODEL_SUBSET_DIR, using the same file name, so PODs don't read data 
+        outside the case's date range. See :func:`time_subset.subset_time_range`.
+        """
+        in_path = util.makefilepath(
+            dataspec_dict['name_in_model'], dataspec_dict['freq'],
+            self.case_name, self.MODEL_DATA_DIR)
+        out_path = util.makefilepath(
+            dataspec_dict['name_in_model'], dataspec_dict['freq'],
+            self.case_name, self.MODEL_SUBSET_DIR)
+        if not os.path.exists(in_path):
+            return # let the POD report the missing file
+        if time_subset.subset_time_range(in_path, out_path, 
+            self.firstyr, self.lastyr, time_coord=self._time_coord()):
+            print "Wrote {}-{} subset of {}".format(self.firstyr, self.lastyr, in_path)
+
+    def _time_coord(self):
+        """Private method: name of the time coordinate in the model's 
+        variable convention.
+        """
+        if self.convention == 'CF':
+            return 'time'
+        translate = util.VariableTranslator()
+        try:
+            return translate.fromCF(self.convention, 'time_coord')
+        except KeyError:
+            return 'time'
+
+    def podDataReady(self, pod):
+        """True once all datasets needed by `pod` have been fetched (or failed
+        to fetch).
+        """
+        return self.data_to_fetch.pod_ready(pod.name)
+
+    def waitForData(self, raise_errors=True):
+        """Wait for fetches started by :meth:`fetchData` to finish, and re-raise
+        the first error from any of them.
+
+        Args:
+            raise_errors (:obj:`bool`, optional): If False, only print a 
+                warning if any fetches failed. Used once PODs have been run,
+                since PODs whose files are missing are skipped. Default True.
+        """
+        if self._fetch_pool is not None:
+            self._fetch_pool.join()
+            self._fetch_pool = None
+        if self.catalog is not None and self.catalog.modified:
+            self.catalog.save()
         # do translation/ transformation of data too
+        if self._fetch_errors:
+            if raise_errors:
+                raise self._fetch_errors[0]
+            print "WARNING: {} dataset(s) for {} couldn't be fetched; PODs using them were skipped.".format(
+                len(self._fetch_errors), self.case_name)
 
     def planData(self):
-        # definitely a cleaner way to write this
-        self.data_to_fetch = []
+        """Build the :class:`FetchPlan` of datasets needed by this case's PODs,
+        using a variable's alternates if the variable itself isn't available.
+        """
+        self.data_to_fetch = FetchPlan()
         for pod in self.pods:
             for var in pod.varlist:
                 if self.queryDataset(var):
-                    self.data_to_fetch.append(var)
+                    self.data_to_fetch.add(var, pod.name)
                 else:
                     alt_vars = []
-                    for v in var['alternates']:
+                    for v in var.get('alternates', []):
                         temp = var.copy()
-                        temp['var_name'] = v
+                        temp['name_in_model'] = v # translated in _setup_pod
+                        del temp['alternates']
                         alt_vars.append(temp)
-                    if all([self.queryDataset(v) for v in alt_vars]):
+                    if alt_vars and all([self.queryDataset(v) for v in alt_vars]):
                         for v in alt_vars:
-                            self.data_to_fetch.append(v)             
+                            self.data_to_fetch.add(v, pod.name)
 
     # following are specific details that must be implemented in child class 
     @abstractmethod
@@ -136,6 +330,7 @@ class DataManager(object):
 
     def tearDown(self, config):
         self._backupConfigFile(config)
+        self._makeRunReport()
         self._makeTarFile()
 
     def _backupConfigFile(self, config, verbose=0):
@@ -148,22 +343,61 @@ class DataManager(object):
             shutil.move(out_file, out_fileold)
         util.write_yaml(config, out_file)
 
+    def _makeRunReport(self):
+        """Write each POD's exit status and resource usage to run_report.json
+        in MODEL_WK_DIR, and write index.html with links to the webpages of 
+        PODs that made them, followed by a summary table.
+        """
+        report = {'CASENAME': self.case_name, 'pods': {}}
+        links = []
+        for pod in self.pods:
+            d = {'status': pod.status or 'not run', 'returncode': pod.returncode}
+            d.update(pod.resource_usage)
+            report['pods'][pod.name] = d
+            # Diagnostic.tearDown doesn't make pages for failed PODs, so don't
+            # link to ones left over from previous runs
+            if pod.status not in ['failed', 'timed out'] and os.path.isfile(
+                os.path.join(self.MODEL_WK_DIR, pod.name, pod.name+'.html')):
+                links.append((pod.name, pod.description))
+        html_report.write_atomic(
+            os.path.join(self.MODEL_WK_DIR, 'run_report.json'),
+            json.dumps(report, indent=2, sort_keys=True)
+        )
+        html_report.write_index(
+            os.path.join(self.MODEL_WK_DIR, 'index.html'), links, report['pods']
+        )
+
+    def _startArchive(self):
+        if self._archive is None:
+            self._archive = OutputArchive(self.MODEL_WK_DIR, 
+                compression=self.tar_compression, threads=self.tar_threads)
+            self._archive.start()
+
+    def archivePod(self, pod):
+        """Start adding `pod`'s output to the case's tar file in the background,
+        if ``make_variab_tar`` is set. Called by 
+        :meth:`environment_manager.EnvironmentManager.tearDown` once the POD 
+        has been torn down, so later PODs can be torn down meanwhile.
+        """
+        if self.envvars.get("make_variab_tar", "0") == "0":
+            return
+        self._startArchive()
+        self._archive.add(pod.POD_WK_DIR)
+
     def _makeTarFile(self):
         # Make tar file
-        if os.environ["make_variab_tar"] == "0":
+        if self.envvars["make_variab_tar"] == "0":
             print "Not making tar file because make_variab_tar = 0"
             return
 
-        print "Making tar file because make_variab_tar = ",os.environ["make_variab_tar"]
-        if os.path.isfile(self.MODEL_WK_DIR+'.tar'):
-            print "Moving existing {0}.tar to {0}.tar.old".format(self.MODEL_WK_DIR)
-            shutil.move(self.MODEL_WK_DIR+'.tar', self.MODEL_WK_DIR+'.tar.old')
-
-        print "Creating {}.tar".format(self.MODEL_WK_DIR)
-        tar_flags = "--exclude='*netCDF' --exclude='*nc' --exclude='*ps' --exclude='*PS'"
-        status = os.system("tar {0} -cf {1}.tar {1}".format(tar_flags, self.MODEL_WK_DIR))
-        if not status == 0:
+        print "Making tar file because make_variab_tar = ",self.envvars["make_variab_tar"]
+        self._startArchive()
+        print "Creating {}".format(self._archive.tar_path)
+        if not self._archive.close():
             print("ERROR in assembling tar file for {}".format(self.case_name))
+            for error in self._archive.errors:
+                print("   " + error)
+        self._archive = None
 
 
 class LocalfileDataManager(DataManager):
@@ -171,8 +405,8 @@ class LocalfileDataManager(DataManager):
     def queryDataset(self, dataspec_dict):
         filepath = util.makefilepath(
             dataspec_dict['name_in_model'], dataspec_dict['freq'],
-            os.environ['CASENAME'], os.environ['DATADIR'])
-        return os.path.isfile(filepath)
+            self.case_name, self.MODEL_DATA_DIR)
+        return self.catalog.isfile(filepath)
             
     def fetchDataset(self, dataspec_dict):
         pass
\ No newline at end of file
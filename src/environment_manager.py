@@ -2,7 +2,11 @@ import os
 import sys
 import glob
 import shutil
+import time
 import timeit
+import signal
+import threading
+import multiprocessing
 from abc import ABCMeta, abstractmethod
 if os.name == 'posix' and sys.version_info[0] < 3:
     try:
@@ -12,15 +16,243 @@ if os.name == 'posix' and sys.version_info[0] < 3:
 else:
     import subprocess
 import util
+from pod_cache import ResultCache
+
+# Start each POD in its own process group so that the POD and everything it 
+# spawns (eg. NCL) can be killed together. start_new_session is thread-safe,
+# but is only available in python 3 and subprocess32.
+if subprocess.__name__ == 'subprocess32' or sys.version_info[0] >= 3:
+    _new_session_kwargs = {'start_new_session': True}
+else:
+    _new_session_kwargs = {'preexec_fn': os.setsid}
+
+class NodeResources(util.Singleton):
+    """:class:`~util.Singleton` keeping track of the memory and cores committed
+    to PODs that are currently running. It's shared by the 
+    :class:`~environment_manager.EnvironmentManager` of every case being run 
+    from this process, so that concurrently running cases don't oversubscribe
+    the node.
+    """
+    def __init__(self, max_pods=0):
+        """
+        Args:
+            max_pods (:obj:`int`, optional): Maximum number of PODs to run at
+                once. Default 0 (no limit other than memory and cores).
+        """
+        self.max_pods = max_pods
+        self.cores = multiprocessing.cpu_count()
+        try:
+            self.memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (ValueError, OSError, AttributeError):
+            self.memory = 0 # unknown; don't limit by memory
+        self.running = 0
+        self.used_memory = 0
+        self.used_cores = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, pod):
+        """Reserve resources for `pod` if the node has capacity for it.
+
+        A POD is always admitted if nothing else is running, even if its 
+        resource hints exceed the node's capacity, so that it isn't starved.
+
+        Returns:
+            :obj:`bool`: True if the POD can be started.
+        """
+        with self._lock:
+            if self.running > 0:
+                if self.max_pods > 0 and self.running >= self.max_pods:
+                    return False
+                if self.memory > 0 and \
+                    self.used_memory + pod.max_memory > self.memory:
+                    return False
+                if self.used_cores + pod.cores > self.cores:
+                    return False
+            self.running += 1
+            self.used_memory += pod.max_memory
+            self.used_cores += pod.cores
+            return True
+
+    def release(self, pod):
+        """Return resources reserved by :meth:`acquire` once `pod` finishes.
+        """
+        with self._lock:
+            self.running -= 1
+            self.used_memory -= pod.max_memory
+            self.used_cores -= pod.cores
+
+
+class RuntimeHistory(object):
+    """Wall-clock run times of PODs from previous runs, used to start the
+    longest-running PODs first. Stored in ``pod_runtimes.yml`` in the working 
+    directory and shared by all cases.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, file_path=''):
+        if not file_path:
+            paths = util.PathManager()
+            file_path = os.path.join(paths.WORKING_DIR, 'pod_runtimes.yml')
+        self.file_path = file_path
+        self.runtimes = self._read()
+        self._updates = {}
+
+    def _read(self):
+        if not os.path.isfile(self.file_path):
+            return {}
+        return util.read_yaml(self.file_path) or {}
+
+    def get(self, pod_name):
+        """Return last recorded run time (in seconds) of a POD, or None."""
+        return self.runtimes.get(pod_name, None)
+
+    def record(self, pod_name, elapsed):
+        self.runtimes[pod_name] = elapsed
+        self._updates[pod_name] = elapsed
+
+    def save(self):
+        if not self._updates:
+            return
+        # re-read so we don't clobber times recorded by other cases
+        with self._lock:
+            runtimes = self._read()
+            runtimes.update(self._updates)
+            util.write_yaml(runtimes, self.file_path)
+        self._updates = {}
+
+    def order(self, pods):
+        """Sort PODs so that the ones with the longest recorded run time come
+        first. PODs without a recorded time are put at the front, in their 
+        original order, since they may be long.
+        """
+        def _key(pod):
+            t = self.get(pod.name)
+            if t is None:
+                return float('-inf')
+            return -t
+        return sorted(pods, key=_key)
+
+
+class ResourceUsage(object):
+    """Resource usage of a POD's process tree (all processes in its process 
+    group), accumulated from samples of ``/proc`` taken while the POD runs.
+
+    CPU time and I/O of child processes that have exited are included via 
+    their parent's cumulative counters, so these are only undercounted for 
+    processes that start and exit between two samples without being waited 
+    for. Peak RSS is the largest total RSS of the process tree seen in any
+    sample. On systems without ``/proc`` only wall time is reported.
+    """
+    try:
+        _clock_ticks = float(os.sysconf('SC_CLK_TCK'))
+        _page_size = os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        _clock_ticks = 100.
+        _page_size = 4096
+
+    def __init__(self):
+        self.cpu_user = 0.
+        self.cpu_sys = 0.
+        self.peak_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.samples = 0
+
+    @classmethod
+    def sample_process_groups(cls, pgids):
+        """Read stats for all processes in the given process groups with one 
+        pass over ``/proc``.
+
+        Returns:
+            :obj:`dict` mapping each process group ID to a :obj:`list` of 
+            dicts, one per process, with keys ``utime``, ``stime``
+            (seconds, including children that have been waited for), ``rss``,
+            ``read_bytes`` and ``write_bytes`` (bytes).
+        """
+        procs = dict((pgid, []) for pgid in pgids)
+        try:
+            pids = [d for d in os.listdir('/proc') if d.isdigit()]
+        except OSError:
+            return procs
+        for pid in pids:
+            try:
+                with open(os.path.join('/proc', pid, 'stat'), 'r') as f:
+                    stat = f.read()
+            except (IOError, OSError):
+                continue # process exited
+            # comm field may contain spaces, so split after its closing paren
+            fields = stat[stat.rfind(')')+2:].split()
+            pgid = int(fields[2])
+            if pgid not in procs:
+                continue
+            d = {
+                'utime': (int(fields[11]) + int(fields[13])) / cls._clock_ticks,
+                'stime': (int(fields[12]) + int(fields[14])) / cls._clock_ticks,
+                'rss': int(fields[21]) * cls._page_size,
+                'read_bytes': 0, 'write_bytes': 0
+            }
+            try:
+                with open(os.path.join('/proc', pid, 'io'), 'r') as f:
+                    for line in f:
+                        key, val = line.split(':')
+                        if key in d:
+                            d[key] = int(val)
+            except (IOError, OSError, ValueError):
+                pass # not permitted or not available
+            procs[pgid].append(d)
+        return procs
+
+    def update(self, procs):
+        """Update totals from one sample of the POD's process tree, as returned
+        by :meth:`sample_process_groups`.
+        """
+        if not procs:
+            return
+        self.samples += 1
+        # cumulative counters only decrease if a child exits without being 
+        # waited for, so keep the largest total seen
+        self.cpu_user = max(self.cpu_user, sum(p['utime'] for p in procs))
+        self.cpu_sys = max(self.cpu_sys, sum(p['stime'] for p in procs))
+        self.peak_rss = max(self.peak_rss, sum(p['rss'] for p in procs))
+        self.read_bytes = max(self.read_bytes, sum(p['read_bytes'] for p in procs))
+        self.write_bytes = max(self.write_bytes, sum(p['write_bytes'] for p in procs))
+
+    def to_dict(self):
+        if self.samples == 0:
+            return {}
+        return {
+            'cpu_user': self.cpu_user, 'cpu_sys': self.cpu_sys,
+            'peak_rss': self.peak_rss, 
+            'read_bytes': self.read_bytes, 'write_bytes': self.write_bytes
+        }
+
 
 class EnvironmentManager(object):
     # analogue of TestSuite in xUnit - abstract base class
     __metaclass__ = ABCMeta
 
     def __init__(self, config, verbose=0):
-        self.test_mode = config['envvars']['test_mode']
+        self.test_mode = config['settings']['test_mode']
         self.pods = []
         self.envs = set()
+        # seconds between checks on running PODs
+        self.poll_interval = 1
+        # default wall-clock limit (seconds) for PODs that don't set one; 0 = none
+        self.pod_timeout = config['settings'].get('pod_timeout', 0)
+        # seconds to wait after SIGTERM before sending SIGKILL
+        self.kill_grace_period = 10
+        self.node = NodeResources(
+            max_pods = config['settings'].get('max_concurrent_pods', 0)
+        )
+        self.cache = ResultCache(max_size = util.parse_memory_size(
+            config['settings'].get('pod_cache_size', 0)
+        ))
+        # callable returning True when a POD's input data has been fetched;
+        # see DataManager.podDataReady
+        self.data_ready = lambda pod: True
+        # callable run on each POD once it's been torn down; see 
+        # DataManager.archivePod
+        self.pod_done = lambda pod: None
 
     # -------------------------------------
     # following are specific details that must be implemented in child class 
@@ -57,52 +289,219 @@ class EnvironmentManager(object):
     # -------------------------------------
 
     def run(self, verbose=0):
-        for pod in self.pods:
-            # Find and confirm POD driver script , program (Default = {pod_name,driver}.{program} options)
-            # Each pod could have a settings files giving the name of its driver script and long name
-            if verbose > 0: print("--- MDTF.py Starting POD "+pod.name+"\n")
-
-            pod.setUp()
-            # skip this pod if missing data
-            if pod.missing_files != []:
-                continue
-
-            pod.logfile_obj = open(os.path.join(pod.POD_WK_DIR, pod.name+".log"), 'w')
-
-            run_command = pod.run_command()          
-            if self.test_mode:
-                run_command = 'echo "TEST MODE: would call {}"'.format(run_command)
-            commands = [
-                self.activate_env_command(pod), pod.validate_command(), 
-                run_command, self.deactivate_env_command(pod)
-                ]
-            # '&&' so we abort if any command in the sequence fails.
-            commands = ' && '.join([s for s in commands if s])
- 
-            print("Calling :  "+run_command) # This is where the POD is called #
-            print('Will run in env: '+pod.env)
-            start_time = timeit.default_timer()
-            try:
-                # Need to run bash explicitly because 'conda activate' sources 
-                # env vars (can't do that in posix sh). tcsh could also work.
-                pod.process_obj = subprocess.Popen(
-                    ['bash', '-c', commands],
-                    env = os.environ, 
-                    cwd = pod.POD_WK_DIR,
-                    stdout = pod.logfile_obj, stderr = subprocess.STDOUT)
-            except OSError as e:
-                print('ERROR :',e.errno,e.strerror)
-                print(" occured with call: " +run_command)
-
-        # if this were python3 we'd have asyncio, instead wait for each process
-        # to terminate and close all log files
-        for pod in self.pods:
-            if pod.process_obj is not None:
-                pod.process_obj.wait()
-                pod.process_obj = None
-            if pod.logfile_obj is not None:
-                pod.logfile_obj.close()
-                pod.logfile_obj = None
+        """Run all PODs, subject to the resources available on the node.
+
+        PODs are started longest-first, according to run times recorded by
+        :class:`~environment_manager.RuntimeHistory`, and each POD is only 
+        started when :class:`~environment_manager.NodeResources` has room for
+        the ``max_memory`` and ``cores`` given in its settings.yml. If a POD
+        doesn't fit, smaller PODs further down the queue may be started first.
+
+        All running PODs are supervised at once: a POD that runs longer than
+        its ``timeout`` (or ``pod_timeout`` in config.yml) is killed along with
+        all its child processes, and each POD's exit status and elapsed time
+        are recorded in its ``returncode``, ``status`` and ``elapsed`` 
+        attributes. CPU time, peak memory and I/O of each POD's process tree
+        are sampled by :class:`~environment_manager.ResourceUsage` and recorded
+        in its ``resource_usage`` attribute.
+
+        Results of PODs that succeed are saved in the 
+        :class:`~pod_cache.ResultCache`, if enabled, and PODs whose 
+        fingerprint matches a cached result aren't run again.
+
+        Each POD is only set up once :attr:`data_ready` says its input data is
+        available, so PODs can be started while data for other PODs is still
+        being fetched.
+
+        If an error stops the loop, PODs still running are killed and their
+        resources released before it's re-raised.
+        """
+        history = RuntimeHistory()
+        waiting = list(self.pods)
+        queue = []
+        running = []
+        try:
+            while waiting or queue or running:
+                for pod in list(waiting):
+                    if not self.data_ready(pod):
+                        continue
+                    waiting.remove(pod)
+                    if self._setup_pod(pod, verbose):
+                        queue.append(pod)
+                queue = history.order(queue)
+
+                # sample before polling, since polling reaps exited PODs
+                samples = ResourceUsage.sample_process_groups(
+                    [pod.process_obj.pid for pod in running]
+                )
+                for pod in list(running):
+                    pod.usage.update(samples[pod.process_obj.pid])
+                    if pod.process_obj.poll() is None:
+                        self._check_timeout(pod)
+                        continue
+                    running.remove(pod)
+                    self._finish_pod(pod, history)
+                for pod in list(queue):
+                    if self.node.acquire(pod):
+                        queue.remove(pod)
+                        if self._start_pod(pod, verbose):
+                            running.append(pod)
+                        else:
+                            self.node.release(pod)
+                # also wait if queued PODs were refused because other cases are
+                # using the node, instead of spinning until they finish
+                if running or waiting or queue:
+                    time.sleep(self.poll_interval)
+        finally:
+            # if the loop was abandoned by an error, don't leave PODs running
+            # unsupervised or holding resources other cases are waiting for
+            for pod in running:
+                self._abort_pod(pod)
+        history.save()
+
+    def _setup_pod(self, pod, verbose=0):
+        """Private method called by :meth:`~environment_manager.EnvironmentManager.run`
+        once the POD's input data is available.
+
+        Returns:
+            :obj:`bool`: True if the POD needs to be run.
+        """
+        # Find and confirm POD driver script , program (Default = {pod_name,driver}.{program} options)
+        # Each pod could have a settings files giving the name of its driver script and long name
+        if verbose > 0: print("--- MDTF.py Setting up POD "+pod.name+"\n")
+
+        pod.setUp()
+        # skip this pod if missing data
+        if pod.missing_files != []:
+            return False
+        if not self.test_mode and self.cache.restore(pod):
+            pod.status = 'cached'
+            return False
+        return True
+
+    def _start_pod(self, pod, verbose=0):
+        """Private method called by :meth:`~environment_manager.EnvironmentManager.run`.
+
+        Returns:
+            :obj:`bool`: True if the POD's subprocess was started.
+        """
+        if verbose > 0: print("--- MDTF.py Starting POD "+pod.name+"\n")
+        pod.logfile_obj = open(os.path.join(pod.POD_WK_DIR, pod.name+".log"), 'w')
+
+        run_command = pod.run_command()          
+        if self.test_mode:
+            run_command = 'echo "TEST MODE: would call {}"'.format(run_command)
+        commands = [
+            self.activate_env_command(pod), pod.validate_command(), 
+            run_command, self.deactivate_env_command(pod)
+            ]
+        # '&&' so we abort if any command in the sequence fails.
+        commands = ' && '.join([s for s in commands if s])
+
+        print("Calling :  "+run_command) # This is where the POD is called #
+        print('Will run in env: '+pod.env)
+        pod.start_time = timeit.default_timer()
+        # time to send SIGKILL, once it's been sent SIGTERM for timing out
+        pod.kill_time = None
+        pod.status = 'running'
+        pod.usage = ResourceUsage()
+        try:
+            # Need to run bash explicitly because 'conda activate' sources 
+            # env vars (can't do that in posix sh). tcsh could also work.
+            pod.process_obj = subprocess.Popen(
+                ['bash', '-c', commands],
+                env = util.get_subprocess_env(pod.envvars), 
+                cwd = pod.POD_WK_DIR,
+                stdout = pod.logfile_obj, stderr = subprocess.STDOUT,
+                **_new_session_kwargs)
+        except OSError as e:
+            pod.status = 'failed'
+            print('ERROR :',e.errno,e.strerror)
+            print(" occured with call: " +run_command)
+            pod.process_obj = None
+            pod.logfile_obj.close()
+            pod.logfile_obj = None
+            return False
+        return True
+
+    def _check_timeout(self, pod):
+        """Private method called by :meth:`~environment_manager.EnvironmentManager.run`
+        on each poll of a running POD. If it has run longer than its timeout,
+        send SIGTERM to its process group, followed by SIGKILL on a later poll
+        if it hasn't exited after :attr:`kill_grace_period` seconds. This
+        doesn't wait, so other PODs are still supervised meanwhile.
+
+        Returns:
+            :obj:`bool`: True if the POD has timed out.
+        """
+        now = timeit.default_timer()
+        if pod.status == 'timed out':
+            if pod.kill_time is not None and now >= pod.kill_time:
+                print("ERROR: POD {} didn't exit after SIGTERM; sending SIGKILL.".format(
+                    pod.name))
+                self._signal_process_group(pod.process_obj, signal.SIGKILL)
+                pod.kill_time = None
+            return True
+        timeout = pod.timeout or self.pod_timeout
+        if not timeout or now - pod.start_time < timeout:
+            return False
+        print("ERROR: POD {} exceeded time limit of {}s; killing it.".format(
+            pod.name, timeout))
+        pod.status = 'timed out'
+        self._signal_process_group(pod.process_obj, signal.SIGTERM)
+        pod.kill_time = now + self.kill_grace_period
+        return True
+
+    def _signal_process_group(self, process_obj, sig):
+        try:
+            os.killpg(process_obj.pid, sig)
+        except OSError:
+            pass # already exited
+
+    def _abort_pod(self, pod):
+        """Private method called by :meth:`~environment_manager.EnvironmentManager.run`
+        if it's stopped by an error: kill a running POD's process group and
+        release its resources.
+        """
+        self._signal_process_group(pod.process_obj, signal.SIGKILL)
+        pod.process_obj.wait()
+        pod.returncode = pod.process_obj.returncode
+        pod.status = 'failed'
+        pod.process_obj = None
+        if pod.logfile_obj is not None:
+            pod.logfile_obj.close()
+            pod.logfile_obj = None
+        self.node.release(pod)
+
+    def _finish_pod(self, pod, history):
+        """Private method called by :meth:`~environment_manager.EnvironmentManager.run`
+        when the POD's subprocess has exited. Records the POD's exit status and
+        elapsed time.
+        """
+        pod.elapsed = timeit.default_timer() - pod.start_time
+        pod.returncode = pod.process_obj.returncode
+        pod.resource_usage = pod.usage.to_dict()
+        pod.resource_usage['wall_time'] = pod.elapsed
+        pod.usage = None
+        self.node.release(pod)
+        if pod.status != 'timed out':
+            if pod.returncode == 0:
+                pod.status = 'succeeded'
+            else:
+                pod.status = 'failed'
+        if pod.logfile_obj is not None:
+            pod.logfile_obj.close()
+            pod.logfile_obj = None
+        if not self.test_mode and pod.status == 'succeeded':
+            # run times of failed PODs aren't representative
+            history.record(pod.name, pod.elapsed)
+            self.cache.store(pod)
+        print("POD {} {} (exit code {}); elapsed time {:.1f}s".format(
+            pod.name, pod.status, pod.returncode, pod.elapsed))
+        if pod.status != 'succeeded':
+            print("ERROR: see {} for details.".format(
+                os.path.join(pod.POD_WK_DIR, pod.name+".log")))
+        pod.process_obj = None
 
     # -------------------------------------
 
@@ -110,6 +509,7 @@ class EnvironmentManager(object):
         # call diag's tearDown to clean up
         for pod in self.pods:
             pod.tearDown()
+            self.pod_done(pod)
         for env in self.envs:
             self.destroy_environment(env)
 
@@ -140,12 +540,12 @@ class CondaEnvironmentManager(EnvironmentManager):
 
         if ('conda_env_root' in config['settings']) and \
             (os.path.isdir(config['settings']['conda_env_root'])):
-            # need to resolve relative path
-            cwd = os.getcwd()
+            # need to resolve relative path; don't chdir, since other cases
+            # may be running in other threads
             paths = util.PathManager()
-            os.chdir(os.path.join(paths.CODE_ROOT, 'src'))
-            self.conda_env_root = os.path.realpath(config['settings']['conda_env_root'])
-            os.chdir(cwd)
+            self.conda_env_root = os.path.realpath(os.path.join(
+                paths.CODE_ROOT, 'src', config['settings']['conda_env_root']
+            ))
         else:
             self.conda_env_root = os.path.join(
                 subprocess.check_output('conda info --root', shell=True),
@@ -0,0 +1,63 @@
+"""Save a Python POD's matplotlib figures directly in the bitmap format used on
+its webpage.
+
+PODs normally write figures as PS/EPS files in ``model/PS`` or ``obs/PS``,
+which :meth:`~shared_diagnostic.Diagnostic._convert_pod_figures` rasterizes
+with ImageMagick's ``convert`` after the POD has finished. :func:`savefig`
+instead renders the bitmap (in the format set by ``convert_output_fmt``) with
+matplotlib, and only writes the PS/EPS copy if ``save_ps`` is set. The bitmap
+is written last, so ``_convert_pod_figures`` sees it as already converted.
+
+This module is imported by POD scripts, so it only depends on the standard
+library::
+
+    import os, sys
+    sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+    import figure_sink
+    figure_sink.savefig(fig, os.path.join(os.environ["WK_DIR"], "model/PS/fig.eps"))
+"""
+import os
+
+def bitmap_path(ps_path, fmt=None):
+    """Return the path of the bitmap made from `ps_path` by
+    :meth:`~shared_diagnostic.Diagnostic._convert_pod_figures`: the file of the
+    same name, with extension `fmt`, in the parent directory of ``PS``.
+
+    Args:
+        ps_path (:obj:`str`): Path to a PS/EPS figure.
+        fmt (:obj:`str`, optional): Bitmap format. Default is the value of
+            ``convert_output_fmt`` in the environment, or 'png'.
+    """
+    if fmt is None:
+        fmt = os.environ.get('convert_output_fmt', 'png')
+    (dd, ff) = os.path.split(os.path.splitext(ps_path)[0])
+    return os.path.join(os.path.dirname(dd), ff + '.' + fmt)
+
+def savefig(fig, ps_path, **kwargs):
+    """Save a matplotlib figure that would otherwise be saved to `ps_path`.
+
+    If matplotlib can't write the ``convert_output_fmt`` format, the figure is
+    saved to `ps_path` to be converted by the framework as usual.
+
+    Args:
+        fig: :class:`matplotlib.figure.Figure` to save.
+        ps_path (:obj:`str`): Path to the PS/EPS file the POD would write.
+        **kwargs: Passed on to :meth:`matplotlib.figure.Figure.savefig`.
+
+    Returns:
+        :obj:`list` of paths written.
+    """
+    fmt = os.environ.get('convert_output_fmt', 'png')
+    if fmt not in fig.canvas.get_supported_filetypes():
+        fig.savefig(ps_path, **kwargs)
+        return [ps_path]
+    paths = []
+    if os.environ.get('save_ps', '0') != '0':
+        fig.savefig(ps_path, **kwargs)
+        paths.append(ps_path)
+    out_path = bitmap_path(ps_path, fmt)
+    if not os.path.isdir(os.path.dirname(out_path)):
+        os.makedirs(os.path.dirname(out_path))
+    fig.savefig(out_path, format=fmt, **kwargs)
+    paths.append(out_path)
+    return paths
@@ -0,0 +1,128 @@
+"""Webpages for a case's output: each POD's page, made from the html template
+in its code directory, and the top-level index.html that links to them.
+
+Templates are filled in by :func:`render` in a single pass over the text, so
+making a POD's page doesn't spawn a ``sed`` process per substitution. The
+case's index.html is made once, by :func:`write_index` when the case is torn
+down, from the PODs whose pages were made, followed by a table of their run
+times and resource usage. Pages are written atomically (to a temporary file
+that's then renamed), so a partly written page is never seen.
+"""
+import os
+import re
+import tempfile
+
+# header & footer of index.html
+_html_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html')
+_index_header = os.path.join(_html_dir, 'mdtf1.html')
+_index_footer = os.path.join(_html_dir, 'mdtf2.html')
+
+# placeholder for the value of an environment variable, eg. {{CASENAME}}
+_envvar_regex = r'\{\{(\w+)\}\}'
+
+def render(text, replacements=None, envvars=None):
+    """Return `text` with every occurrence of each key of `replacements`
+    replaced by its value, and every ``{{NAME}}`` replaced by the value of
+    ``NAME`` in `envvars` (placeholders for undefined names are left as-is).
+
+    All substitutions are made in one pass: replaced text isn't searched again,
+    and where keys overlap the longest one is used.
+
+    Args:
+        text (:obj:`str`): Template text.
+        replacements (:obj:`dict`, optional): Literal strings to replace.
+        envvars (:obj:`dict`, optional): Values for ``{{NAME}}`` placeholders,
+            eg. the POD's envvars.
+    """
+    replacements = replacements or {}
+    envvars = envvars or {}
+    keys = sorted(replacements, key=len, reverse=True)
+    regex = re.compile('|'.join([re.escape(k) for k in keys] + [_envvar_regex]))
+
+    def _sub(match):
+        if match.group(1) is None:
+            return replacements[match.group(0)]
+        return str(envvars.get(match.group(1), match.group(0)))
+
+    return regex.sub(_sub, text)
+
+def write_atomic(path, text):
+    """Write `text` to `path` through a temporary file in the same directory,
+    which is renamed to `path` once complete.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o644) # mkstemp's default of 0600 is too strict
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+def render_file(template_path, out_path, replacements=None, envvars=None):
+    """Fill in the template at `template_path` with :func:`render` and write
+    the result to `out_path`.
+    """
+    with open(template_path, 'r') as f:
+        text = f.read()
+    write_atomic(out_path, render(text, replacements, envvars))
+
+def pod_link(name, description):
+    """Return the line of index.html linking to POD `name`'s page."""
+    return '<H3><font color=navy>{} <A HREF="{}/{}.html">plots</A></H3>'.format(
+        description, name, name)
+
+def _fmt(d, key, scale, fmt):
+    if d.get(key, None) is None:
+        return '-'
+    return fmt.format(d[key] / scale)
+
+def usage_table(pods):
+    """Return an html table of the PODs' status and resource usage.
+
+    Args:
+        pods (:obj:`dict`): Entries of the run report (run_report.json) for
+            each POD, keyed by POD name.
+    """
+    header = ['POD', 'Status', 'Wall time (s)', 'User CPU (s)',
+        'System CPU (s)', 'Peak RSS (MB)', 'Read (MB)', 'Written (MB)']
+    rows = []
+    for name in sorted(pods):
+        d = pods[name]
+        rows.append('<TR>' + ''.join(['<TD>{}</TD>'.format(x) for x in [
+            name, d['status'],
+            _fmt(d, 'wall_time', 1., '{:.1f}'),
+            _fmt(d, 'cpu_user', 1., '{:.1f}'),
+            _fmt(d, 'cpu_sys', 1., '{:.1f}'),
+            _fmt(d, 'peak_rss', 1024.**2, '{:.0f}'),
+            _fmt(d, 'read_bytes', 1024.**2, '{:.0f}'),
+            _fmt(d, 'write_bytes', 1024.**2, '{:.0f}')
+        ]]) + '</TR>')
+    return '<H3><font color=navy>Resource usage</font></H3>\n' \
+        + '<TABLE border=1 cellpadding=3>\n' \
+        + '<TR>' + ''.join(['<TH>{}</TH>'.format(x) for x in header]) + '</TR>\n' \
+        + '\n'.join(rows) + '\n</TABLE>\n'
+
+def write_index(out_path, links, pods, header_path=None, footer_path=None):
+    """Write a case's index.html.
+
+    Args:
+        out_path (:obj:`str`): Path to write to, eg. MODEL_WK_DIR/index.html.
+        links (:obj:`list`): (name, description) of each POD to link to, in
+            order.
+        pods (:obj:`dict`): Run report entries for each POD, passed to
+            :func:`usage_table`.
+        header_path (:obj:`str`, optional): html file to start the page with.
+            Default is src/html/mdtf1.html.
+        footer_path (:obj:`str`, optional): html file to end the page with.
+            Default is src/html/mdtf2.html.
+    """
+    parts = []
+    with open(header_path or _index_header, 'r') as f:
+        parts.append(f.read())
+    parts.extend([pod_link(name, desc) + '\n' for name, desc in links])
+    parts.append(usage_table(pods))
+    with open(footer_path or _index_footer, 'r') as f:
+        parts.append(f.read())
+    write_atomic(out_path, ''.join(parts))
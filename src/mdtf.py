@@ -54,6 +54,8 @@
 import os
 import sys
 import argparse
+import traceback
+from multiprocessing.pool import ThreadPool
 import util
 import data_manager
 import environment_manager
@@ -99,6 +101,40 @@ def argparse_wrapper():
     config.verbose = verbose
     return config
 
+def run_case(case, config, EnvironmentMgr):
+    """Set up, fetch data for, and run all PODs for a single case. Called 
+    concurrently for each case in ``case_list``.
+    """
+    try:
+        case.setUp(config)
+        # if overlapping, start PODs as soon as their own data is fetched
+        overlap = config['settings'].get('overlap_fetch_and_run', False)
+        case.fetchData(wait = not overlap)
+
+        env = EnvironmentMgr(config)
+        env.pods = case.pods # best way to do this?
+        if overlap:
+            env.data_ready = case.podDataReady
+        # archive each POD's output while the others are torn down
+        env.pod_done = case.archivePod
+        env.setUp()
+        env.run()
+        try:
+            # With overlap, fetch errors haven't been raised yet, but PODs 
+            # missing data were already skipped, so only report them.
+            case.waitForData(raise_errors = not overlap)
+        finally:
+            # make webpages, run report & tar file for PODs that did run
+            env.tearDown()
+            case.tearDown(config)
+    except SystemExit:
+        # util functions call exit() on fatal errors; only abort this case
+        print "ERROR: aborting case {}".format(case.case_name)
+    except Exception:
+        # don't let one case's error abort the cases still running in the pool
+        print "ERROR: aborting case {}:\n{}".format(
+            case.case_name, traceback.format_exc())
+
 
 if __name__ == '__main__':
     print "==== Starting "+__file__
@@ -118,30 +154,40 @@ if __name__ == '__main__':
     except:
         print "No class named {}.".format(class_name)
 
+    # initialize read-only translation table before any cases are started
+    util.VariableTranslator()
+    # Create the node's resource bookkeeping and the result cache, which are
+    # shared by all cases, before any cases are started: Singleton creation
+    # isn't thread-safe, and two instances would each book the whole node.
+    environment_manager.NodeResources(
+        max_pods = config['settings'].get('max_concurrent_pods', 0)
+    )
+    environment_manager.ResultCache(max_size = util.parse_memory_size(
+        config['settings'].get('pod_cache_size', 0)
+    ))
+
     caselist = []
-    # only run first case in list until dependence on env vars cleaned up
-    for case_dict in config['case_list'][0:1]: 
+    for case_dict in config['case_list']: 
         case = DataMgr(case_dict, config)
         for pod_name in case.pod_list:
             try:
                 pod = Diagnostic(pod_name)
             except AssertionError as error:  
                 print str(error)
+                continue
             if verbose > 0: print "POD long name: ", pod.long_name
             case.pods.append(pod)
-        case.setUp(config)
-        case.fetchData()
         caselist.append(case)
 
-    for case in caselist:
-        env = EnvironmentMgr(config)
-        env.pods = case.pods # best way to do this?
-        env.setUp()
-        env.run()
-        env.tearDown()
-
-    for case in caselist:
-        case.tearDown(config)
+    # Each case carries its own environment variables, so cases can be
+    # set up, fetched and run concurrently.
+    max_cases = config['settings'].get('max_concurrent_cases', 0)
+    if max_cases < 1:
+        max_cases = len(caselist)
+    pool = ThreadPool(max(min(max_cases, len(caselist)), 1))
+    pool.map(lambda case: run_case(case, config, EnvironmentMgr), caselist)
+    pool.close()
+    pool.join()
 
     print "Exiting normally from ",__file__
-    exit()
\ No newline at end of file
+    exit()
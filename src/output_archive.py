@@ -0,0 +1,270 @@
+"""Tar archive of a case's output directory (MODEL_WK_DIR), made if
+``make_variab_tar`` is set.
+
+Files are written to the archive by a background thread as directories are
+passed to :meth:`OutputArchive.add`, so each POD's output can be archived as
+soon as the POD is torn down, while the remaining PODs are still being
+processed. A manifest with the size, modification time and SHA-1 hash of
+every member is saved next to the archive. When an uncompressed archive is
+made again, only files whose contents changed are appended to it (tar
+extracts the last copy of a member). The archive is only rewritten from
+scratch if files were removed, or if superseded copies of members take up more
+space than the current ones. Compressed archives are always rewritten, through
+``pigz`` for parallel compression if it's installed.
+"""
+import os
+import sys
+import stat
+import json
+import fnmatch
+import hashlib
+import tarfile
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from distutils.spawn import find_executable
+if sys.version_info[0] < 3:
+    import Queue as queue
+else:
+    import queue
+
+# same as the --exclude flags previously passed to tar
+_default_exclude = ['*netCDF', '*nc', '*ps', '*PS']
+
+class _HashingReader(object):
+    """Private class: file object wrapper that hashes data as it's read, so
+    that files can be hashed and written to the archive in one pass.
+    """
+    def __init__(self, file_obj, hash_obj):
+        self._file = file_obj
+        self._hash = hash_obj
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._hash.update(data)
+        return data
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class OutputArchive(object):
+    """Incrementally updated tar archive of the contents of one directory,
+    saved as ``<root_dir>.tar`` (or ``<root_dir>.tar.gz``, etc.).
+
+    Member names are the same as those written by ``tar -cf <root_dir>.tar
+    <root_dir>``: the absolute path without the leading slash.
+    """
+    def __init__(self, root_dir, compression='', threads=1, exclude=None):
+        """
+        Args:
+            root_dir (:obj:`str`): Directory to archive, eg. MODEL_WK_DIR.
+            compression (:obj:`str`, optional): '' (default) for an
+                uncompressed archive, or a compression supported by
+                :mod:`tarfile` ('gz' or 'bz2').
+            threads (:obj:`int`, optional): Number of threads to use for 'gz'
+                compression if ``pigz`` is available. 0 means one per CPU.
+                Default 1.
+            exclude (:obj:`list`, optional): Shell-style patterns; files and
+                directories whose names match any of them aren't archived.
+                Default is the patterns previously passed to ``tar``.
+        """
+        self.root_dir = os.path.normpath(root_dir)
+        self.compression = compression
+        if threads <= 0:
+            threads = multiprocessing.cpu_count()
+        self.threads = threads
+        if exclude is None:
+            exclude = _default_exclude
+        self.exclude = exclude
+        self.tar_path = self.root_dir + '.tar'
+        if compression:
+            self.tar_path += '.' + compression
+        self.manifest_path = self.tar_path + '.manifest.json'
+        self.errors = []
+        self._prefix = self.root_dir.lstrip(os.sep)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._tar = None
+        self._tmp_path = None
+        self._pigz = None
+        self._old_members = {}
+        self._members = {}
+        self._stale_size = 0
+        self._append = False
+
+    def start(self):
+        """Open the archive and start the background thread."""
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            manifest = {}
+        self._old_members = manifest.get('members', {})
+        self._stale_size = manifest.get('stale_size', 0)
+        # only append if the archive is the one described by the manifest
+        append = not self.compression and os.path.isfile(self.tar_path) \
+            and manifest.get('tar_size', None) == os.path.getsize(self.tar_path)
+        self._open(append)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _open(self, append):
+        """Private method: open the existing archive for appending, or a
+        temporary file for a new archive.
+        """
+        self._append = append
+        self._members = {}
+        if append:
+            self._tar = tarfile.open(self.tar_path, 'a')
+            return
+        self._stale_size = 0
+        fd, self._tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.tar_path), suffix='.tmp')
+        os.close(fd)
+        if self.compression == 'gz' and self.threads > 1 \
+            and find_executable('pigz'):
+            with open(self._tmp_path, 'wb') as out_file:
+                self._pigz = subprocess.Popen(
+                    ['pigz', '-p', str(self.threads), '-c'],
+                    stdin=subprocess.PIPE, stdout=out_file)
+            self._tar = tarfile.open(fileobj=self._pigz.stdin, mode='w|')
+        elif self.compression:
+            self._tar = tarfile.open(self._tmp_path, 'w:' + self.compression)
+        else:
+            self._tar = tarfile.open(self._tmp_path, 'w')
+
+    def add(self, path):
+        """Queue a file or directory (and everything in it) under
+        :attr:`root_dir` to be added to the archive. Can be called from any
+        thread.
+        """
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                self._add_tree(path)
+            except Exception as exc:
+                self.errors.append("{}: {}".format(path, exc))
+
+    def _excluded(self, rel_path):
+        for name in rel_path.split(os.sep):
+            for pattern in self.exclude:
+                if fnmatch.fnmatchcase(name, pattern):
+                    return True
+        return False
+
+    def _add_tree(self, path):
+        if not os.path.isdir(path) or os.path.islink(path):
+            self._add_member(path)
+            return
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted([d for d in dirs if not self._excluded(d)])
+            self._add_member(root)
+            for f in sorted(files):
+                if not self._excluded(f):
+                    self._add_member(os.path.join(root, f))
+
+    def _add_member(self, path):
+        """Private method: write `path` to the archive, unless it's already
+        there with the same contents.
+        """
+        rel_path = os.path.relpath(path, self.root_dir)
+        if rel_path == os.curdir:
+            arcname = self._prefix
+        elif rel_path.startswith(os.pardir) or self._excluded(rel_path):
+            return
+        else:
+            arcname = os.path.join(self._prefix, rel_path)
+        if arcname in self._members:
+            return # added earlier in this run
+        st = os.lstat(path)
+        old = self._old_members.get(arcname, None)
+        if stat.S_ISDIR(st.st_mode):
+            entry = [0, 0, 'dir']
+        elif stat.S_ISLNK(st.st_mode):
+            entry = [0, 0, 'link:' + os.readlink(path)]
+        elif not stat.S_ISREG(st.st_mode):
+            return
+        elif old is not None and old[0] == st.st_size and old[1] == st.st_mtime:
+            entry = [st.st_size, st.st_mtime, old[2]]
+        elif self._append:
+            entry = [st.st_size, st.st_mtime, _file_hash(path)]
+        else:
+            entry = [st.st_size, st.st_mtime, None] # hashed while writing
+        self._members[arcname] = entry
+        if self._append and old is not None:
+            if old[2] == entry[2]:
+                return # unchanged
+            self._stale_size += old[0]
+        tarinfo = self._tar.gettarinfo(path, arcname)
+        if tarinfo.isreg():
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                self._tar.addfile(tarinfo, _HashingReader(f, h))
+            entry[2] = h.hexdigest()
+        else:
+            self._tar.addfile(tarinfo)
+
+    def close(self):
+        """Add everything under :attr:`root_dir` not added yet, wait for the
+        background thread to finish, and close the archive.
+
+        Returns:
+            :obj:`bool`: True if the archive was written without errors.
+        """
+        self.add(self.root_dir)
+        self._queue.put(None)
+        self._thread.join()
+        removed = set(self._old_members) - set(self._members)
+        live_size = sum([e[0] for e in self._members.values()])
+        if self._append and not self.errors \
+            and (removed or self._stale_size > live_size):
+            # drop removed & superseded members by writing a new archive
+            self._tar.close()
+            self._old_members = self._members
+            self._open(False)
+            try:
+                self._add_tree(self.root_dir)
+            except Exception as exc:
+                self.errors.append("{}: {}".format(self.root_dir, exc))
+        try:
+            self._tar.close()
+            if self._pigz is not None:
+                self._pigz.stdin.close()
+                if self._pigz.wait() != 0:
+                    self.errors.append("pigz exited with status {}".format(
+                        self._pigz.returncode))
+        except Exception as exc:
+            self.errors.append("{}: {}".format(self.tar_path, exc))
+        if self.errors:
+            if self._tmp_path is not None:
+                os.remove(self._tmp_path)
+            elif os.path.exists(self.manifest_path):
+                # archive may have been partly appended to; rewrite it next time
+                os.remove(self.manifest_path)
+            return False
+        if self._tmp_path is not None:
+            os.rename(self._tmp_path, self.tar_path)
+        self._write_manifest()
+        return True
+
+    def _write_manifest(self):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.manifest_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'tar_size': os.path.getsize(self.tar_path),
+                'stale_size': self._stale_size,
+                'members': self._members
+            }, f)
+        os.rename(tmp_path, self.manifest_path)
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import threading
+import util
+
+class ResultCache(util.Singleton):
+    """:class:`~util.Singleton` storing the contents of the working directories
+    of PODs that ran successfully, keyed by the POD's
+    :attr:`~shared_diagnostic.Diagnostic.fingerprint`. When a POD's inputs,
+    code and settings haven't changed since it was cached,
+    :meth:`environment_manager.EnvironmentManager.run` restores its output
+    from here instead of running it again.
+
+    The cache lives in ``pod_cache`` in the working directory. Its total size
+    is kept under a quota by deleting the least recently used entries.
+    """
+    def __init__(self, max_size=0, cache_dir=''):
+        """
+        Args:
+            max_size (:obj:`int`, optional): Maximum total size of the cache, in
+                bytes. Default 0 disables the cache.
+            cache_dir (:obj:`str`, optional): Directory to store the cache in.
+                Default is ``pod_cache`` in WORKING_DIR.
+        """
+        if not cache_dir and max_size > 0:
+            paths = util.PathManager()
+            cache_dir = os.path.join(paths.WORKING_DIR, 'pod_cache')
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _entry_dir(self, pod):
+        return os.path.join(self.cache_dir, pod.name + '-' + pod.fingerprint)
+
+    def restore(self, pod):
+        """Copy cached results for `pod` into its POD_WK_DIR, if there are any.
+
+        Returns:
+            :obj:`bool`: True if results were restored.
+        """
+        if not self.enabled or not pod.fingerprint:
+            return False
+        entry = self._entry_dir(pod)
+        with self._lock:
+            if not os.path.isdir(entry):
+                return False
+            os.utime(entry, None) # mark as recently used
+            for item in os.listdir(entry):
+                src = os.path.join(entry, item)
+                dest = os.path.join(pod.POD_WK_DIR, item)
+                if os.path.isdir(src):
+                    if os.path.exists(dest):
+                        shutil.rmtree(dest)
+                    shutil.copytree(src, dest)
+                else:
+                    shutil.copy2(src, dest)
+        print("POD {} unchanged since last run; restored results from {}".format(
+            pod.name, entry))
+        return True
+
+    def store(self, pod):
+        """Save the contents of `pod`'s POD_WK_DIR, then evict least recently
+        used entries if the cache is over quota.
+        """
+        if not self.enabled or not pod.fingerprint:
+            return
+        size = _dir_size(pod.POD_WK_DIR)
+        if size > self.max_size:
+            print("WARNING: output of POD {} is larger than pod_cache_size; not caching.".format(
+                pod.name))
+            return
+        entry = self._entry_dir(pod)
+        with self._lock:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # copy to a temporary name first so an interrupted copy is never
+            # mistaken for a complete entry
+            tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+            shutil.rmtree(tmp_dir)
+            shutil.copytree(pod.POD_WK_DIR, tmp_dir)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp_dir, entry)
+            os.utime(entry, None)
+            self._evict(keep=entry)
+
+    def _evict(self, keep=''):
+        """Private method: delete least recently used entries until the cache
+        is within :attr:`max_size`. Must be called with the lock held.
+        """
+        entries = []
+        for item in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, item)
+            if os.path.isdir(path) and not item.startswith('.'):
+                entries.append((os.path.getmtime(path), _dir_size(path), path))
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path)
+            total -= size
+
+
+def _dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            fp = os.path.join(root, f)
+            if not os.path.islink(fp):
+                total += os.path.getsize(fp)
+    return total
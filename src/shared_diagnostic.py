@@ -2,8 +2,24 @@ import os
 import sys
 import glob
 import shutil
+import hashlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import util
 from util import setenv # TODO: fix
+import html_report
+import asset_stage
+
+# Env vars that control the framework but can't change a POD's results, so are
+# left out of its fingerprint.
+_fingerprint_ignore_envvars = set([
+    'verbose', 'test_mode', 'save_ps', 'save_nc', 'save_non_nc', 
+    'make_variab_tar', 'convert_flags', 'convert_output_fmt', 
+    'max_concurrent_cases', 'max_concurrent_pods', 'pod_timeout', 
+    'pod_cache_size', 'WORKING_DIR', 'OUTPUT_DIR', 'variab_dir', 'WK_DIR',
+    'POD_CORES', 'link_pod_assets', 'max_concurrent_fetches', 
+    'overlap_fetch_and_run', 'tar_compression', 'tar_threads'
+])
 
 class Diagnostic(object):
     """Class holding configuration for a diagnostic script.
@@ -26,6 +42,29 @@ class Diagnostic(object):
             scripts required by the POD, if any.  
             validate_environment.sh will make sure these are on the environment's
             $PATH before the POD is run.
+        max_memory (:obj:`int`, optional): Peak memory the POD is expected to 
+            use, in bytes (given in settings.yml in MB or with a K/M/G/T 
+            suffix). Used by :meth:`environment_manager.EnvironmentManager.run`
+            to decide how many PODs can run at once. Default 0 (unknown).
+        cores (:obj:`int`, optional): Number of cores the POD uses. Default 1.
+        timeout (:obj:`int`, optional): Wall-clock time limit for the POD, in
+            seconds, after which it's killed. Default 0 (use ``pod_timeout``
+            from config.yml).
+        status (:obj:`str`): Outcome of running the POD, set by 
+            :meth:`environment_manager.EnvironmentManager.run`: one of 
+            'running', 'succeeded', 'failed', 'timed out' or 'cached' (results
+            restored from :class:`pod_cache.ResultCache`); '' if not run.
+        returncode (:obj:`int`): Exit code of the POD's subprocess.
+        elapsed (:obj:`float`): Wall-clock run time of the POD, in seconds.
+        catalog (:class:`~data_catalog.DataCatalog`): Index of the case's
+            model data files, set by :class:`~data_manager.DataManager`.
+        fingerprint (:obj:`str`): Hash of everything that determines the POD's 
+            output, set by :meth:`~shared_diagnostic.Diagnostic.setUp`. Used 
+            to look up results of previous runs in the 
+            :class:`pod_cache.ResultCache`.
+        resource_usage (:obj:`dict`): Wall time, CPU time, peak RSS and I/O 
+            of the POD's process tree, recorded by 
+            :class:`environment_manager.ResourceUsage`.
     """
 
     def __init__(self, pod_name, verbose=0):
@@ -70,10 +109,22 @@ class Diagnostic(object):
             'required_programs', 'required_python_modules', 
             'required_ncl_scripts', 'required_r_packages']:
             d[list_attr] = []
-        for dict_attr in ['pod_env_vars']:
+        for dict_attr in ['pod_env_vars', 'envvars']:
             d[dict_attr] = {}
         for obj_attr in ['process_obj', 'logfile_obj']:
             d[obj_attr] = None
+        # resource hints for scheduling
+        d['max_memory'] = 0
+        d['cores'] = 1
+        d['timeout'] = 0
+        # set when POD is run
+        d['status'] = ''
+        d['returncode'] = None
+        d['elapsed'] = 0.
+        d['resource_usage'] = {}
+        d['fingerprint'] = ''
+        # set by DataManager
+        d['catalog'] = None
 
         # overwrite with contents of settings.yaml file
         d.update(settings)
@@ -87,6 +138,9 @@ class Diagnostic(object):
             'required_ncl_scripts', 'required_r_packages']:
             if type(d[list_attr]) != list:
                 d[list_attr] = [d[list_attr]]
+        d['max_memory'] = util.parse_memory_size(d['max_memory'])
+        d['cores'] = int(d['cores'])
+        d['timeout'] = float(d['timeout'])
         if (verbose > 0): 
             print self.name + " settings: "
             print d
@@ -127,8 +181,9 @@ class Diagnostic(object):
         """Perform filesystem operations and checks prior to running the POD. 
 
         In order, this 1) sets environment variables specific to the POD, 2)
-        creates POD-specific working directories, and 3) checks for the existence
-        of the POD's driver script and requested data files.
+        creates POD-specific working directories, 3) checks for the existence
+        of the POD's driver script and requested data files, and 4) computes 
+        the POD's :attr:`fingerprint`.
 
         Note:
             The existence of data files is checked here, with 
@@ -151,28 +206,70 @@ class Diagnostic(object):
             print self.missing_files
         else:
             if (verbose > 0): print "No known missing required input files"
+            self.fingerprint = self._fingerprint()
+
+    def _fingerprint(self):
+        """Private method called by :meth:`~shared_diagnostic.Diagnostic.setUp`.
+
+        Hashes the contents of the POD's code directory (including settings.yml
+        and its driver) and of the framework's modules in ``src``, which PODs
+        can import (eg. :mod:`stage_graph`, :mod:`data_catalog`, 
+        :mod:`figure_sink`), the paths, sizes and modification times of its 
+        model and observational data files, and its environment variables 
+        (except those in ``_fingerprint_ignore_envvars``).
+
+        Returns:
+            :obj:`str` hex digest.
+        """
+        paths = util.PathManager()
+        h = hashlib.sha1()
+        h.update('{}\n{}\n'.format(self.name, self.env))
+        code_files = glob.glob(os.path.join(paths.CODE_ROOT, 'src', '*.py'))
+        for root, dirs, files in os.walk(self.POD_CODE_DIR):
+            code_files.extend([os.path.join(root, f) for f in files])
+        for path in sorted(code_files):
+            if not os.path.isfile(path):
+                continue
+            h.update(os.path.relpath(path, paths.CODE_ROOT) + '\n')
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        data_files = list(self.found_files)
+        for root, dirs, files in os.walk(self.POD_OBS_DATA):
+            data_files.extend([os.path.join(root, f) for f in files])
+        for path in sorted(data_files):
+            st = os.stat(path)
+            h.update('{} {} {}\n'.format(path, st.st_size, st.st_mtime))
+        for key in sorted(self.envvars):
+            if key not in _fingerprint_ignore_envvars:
+                h.update('{}={}\n'.format(key, self.envvars[key]))
+        return h.hexdigest()
 
     def _set_pod_env_vars(self, verbose=0):
         """Private method called by :meth:`~shared_diagnostic.Diagnostic.setUp`.
 
+        Variables are added to the POD's own ``envvars`` dict (initialized from
+        its case's variables by :meth:`data_manager.DataManager._setup_pod`), 
+        which is passed to the POD's subprocess.
+
         Args:
             verbose (:obj:`int`, optional): Logging verbosity level. Default 0.
 
         Returns:
-            Dict of POD-specific environment variables that were set.
+            Dict of environment variables for the POD's subprocess.
         """
-        pod_envvars = {}
         # location of POD's code
-        setenv("POD_HOME", self.POD_CODE_DIR, pod_envvars, verbose=verbose)
+        setenv("POD_HOME", self.POD_CODE_DIR, self.envvars, verbose=verbose)
         # POD's observational data
-        setenv("OBS_DATA", self.POD_OBS_DATA, pod_envvars, verbose=verbose)
+        setenv("OBS_DATA", self.POD_OBS_DATA, self.envvars, verbose=verbose)
         # POD's subdir within working directory
-        setenv("WK_DIR", self.POD_WK_DIR, pod_envvars, verbose=verbose)
+        setenv("WK_DIR", self.POD_WK_DIR, self.envvars, verbose=verbose)
+        # number of cores reserved for the POD by the scheduler
+        setenv("POD_CORES", self.cores, self.envvars, verbose=verbose)
 
         # optional POD-specific env vars defined in settings.yml
         for key, val in self.pod_env_vars.items():
-            setenv(key, val, pod_envvars, verbose=verbose) 
-        return pod_envvars
+            setenv(key, val, self.envvars, verbose=verbose) 
+        return self.envvars
 
     def _setup_pod_directories(self, verbose =0):
         """Private method called by :meth:`~shared_diagnostic.Diagnostic.setUp`.
@@ -237,6 +334,16 @@ class Diagnostic(object):
             if ( verbose > 1): print func_name +": Found program "+programs[driver_ext]
         errstr = "ERROR: "+func_name+" can't find "+ self.program+" to run "+self.name    
 
+    def _isfile(self, path):
+        """Private method: look up a data file in the case's 
+        :class:`~data_catalog.DataCatalog` if there is one, instead of making
+        a filesystem call.
+        """
+        catalog = getattr(self, 'catalog', None)
+        if catalog is not None:
+            return catalog.isfile(path)
+        return os.path.isfile(path)
+
     def _check_for_varlist_files(self, varlist, verbose=0):
         """Private method called by :meth:`~shared_diagnostic.Diagnostic.setUp`.
 
@@ -256,9 +363,9 @@ class Diagnostic(object):
         missing_list = []
         for item in varlist:
             if (verbose > 2 ): print func_name +" "+item
-            filepath = util.makefilepath(item['name_in_model'],item['freq'],os.environ['CASENAME'],os.environ['DATADIR'])
+            filepath = util.makefilepath(item['name_in_model'],item['freq'],self.envvars['CASENAME'],self.envvars['DATADIR'])
 
-            if (os.path.isfile(filepath)):
+            if self._isfile(filepath):
                 print "found ",filepath
                 found_list.append(filepath)
                 continue
@@ -336,6 +443,9 @@ class Diagnostic(object):
         to a bitmap format for webpage display; 3) Copies all requested files to
         the output directory and deletes temporary files.
 
+        Steps 1) and 2) depend on the POD's output, so they're skipped if the
+        POD failed or timed out.
+
         Args:
             verbose (:obj:`int`, optional): Logging verbosity level. Default 0.
         """
@@ -343,8 +453,12 @@ class Diagnostic(object):
         # convective_transition_diag to set filename info 
         self._set_pod_env_vars(verbose=verbose)
 
-        self._make_pod_html()
-        self._convert_pod_figures()
+        if self.status in ['failed', 'timed out']:
+            print("WARNING: POD {} {}; not generating its webpage.".format(
+                self.name, self.status))
+        else:
+            self._make_pod_html()
+            self._convert_pod_figures()
         self._cleanup_pod_files()
 
         if verbose > 0: 
@@ -353,44 +467,36 @@ class Diagnostic(object):
             # print(pod+" Elapsed time ",elapsed)
 
     def _make_pod_html(self):
-        """Private method called by :meth:`~shared_diagnostic.Diagnostic.tearDown`.  
+        """Private method called by :meth:`~shared_diagnostic.Diagnostic.tearDown`.
+
+        Fills in the POD's html template with :func:`html_report.render_file`:
+        "casename" is replaced by CASENAME, and ``{{NAME}}`` by the value of
+        the POD's environment variable NAME. The link to the page is added to
+        the case's index.html by
+        :meth:`~data_manager.DataManager._makeRunReport`.
         """
-        html_file = os.path.join(self.POD_WK_DIR, self.name+'.html')
-        temp_file = os.path.join(self.POD_WK_DIR, 'tmp.html')
-
-        if os.path.exists(html_file):
-            os.remove(html_file)
-        shutil.copy2(os.path.join(self.POD_CODE_DIR, self.name+'.html'), self.POD_WK_DIR)
-        os.system("cat "+ html_file \
-            + " | sed -e s/casename/" + os.environ["CASENAME"] + "/g > " \
-            + temp_file)
+        replacements = {'casename': self.envvars["CASENAME"]}
         # following two substitutions are specific to convective_transition_diag
         # need to find a more elegant way to handle this
         if self.name == 'convective_transition_diag':
-            temp_file2 = os.path.join(self.POD_WK_DIR, 'tmp2.html')
-            if ("BULK_TROPOSPHERIC_TEMPERATURE_MEASURE" in os.environ) \
-                and os.environ["BULK_TROPOSPHERIC_TEMPERATURE_MEASURE"] == "2":
-                os.system("cat " + temp_file \
-                    + " | sed -e s/_tave\./_qsat_int\./g > " + temp_file2)
-                shutil.move(temp_file2, temp_file)
-            if ("RES" in os.environ) and os.environ["RES"] != "1.00":
-                os.system("cat " + temp_file \
-                    + " | sed -e s/_res\=1\.00_/_res\=" + os.environ["RES"] + "_/g > " \
-                    + temp_file2)
-                shutil.move(temp_file2, temp_file)
-        shutil.copy2(temp_file, html_file) 
-        os.remove(temp_file)
-
-        # add link and description to main html page
-        html_file = os.path.join(self.MODEL_WK_DIR, 'index.html')
-        a = os.system("cat " + html_file + " | grep " + self.name)
-        if a != 0:
-            os.system("echo '<H3><font color=navy>" + self.description \
-                + " <A HREF=\""+ self.name+"/"+self.name+".html\">plots</A></H3>' >> " \
-                + html_file)
+            if ("BULK_TROPOSPHERIC_TEMPERATURE_MEASURE" in self.envvars) \
+                and self.envvars["BULK_TROPOSPHERIC_TEMPERATURE_MEASURE"] == "2":
+                replacements['_tave.'] = '_qsat_int.'
+            if ("RES" in self.envvars) and self.envvars["RES"] != "1.00":
+                replacements['_res=1.00_'] = '_res=' + self.envvars["RES"] + '_'
+        html_report.render_file(
+            os.path.join(self.POD_CODE_DIR, self.name+'.html'),
+            os.path.join(self.POD_WK_DIR, self.name+'.html'),
+            replacements, self.envvars
+        )
 
     def _convert_pod_figures(self):
         """Private method called by :meth:`~shared_diagnostic.Diagnostic.tearDown`.
+
+        Figures are converted in parallel, one ``convert`` process per CPU at
+        most. Figures whose bitmap is newer than the PS/EPS file (eg. obs
+        figures unchanged since a previous run) are skipped; this includes
+        figures saved by Python PODs with :func:`figure_sink.savefig`.
         """
         dirs = ['model/PS', 'obs/PS']
         exts = ['ps', 'eps']
@@ -399,20 +505,47 @@ class Diagnostic(object):
             for ext in exts:
                 pattern = os.path.join(self.POD_WK_DIR, d, '*.'+ext)
                 files.extend(glob.glob(pattern))
+        jobs = []
         for f in files:
             (dd, ff) = os.path.split(os.path.splitext(f)[0])
             ff = os.path.join(os.path.dirname(dd), ff) # parent directory/filename
-            command_str = 'convert '+ os.environ['convert_flags'] + ' ' \
-                + f + ' ' + ff + '.' + os.environ['convert_output_fmt']
-            os.system(command_str)
+            out_file = ff + '.' + self.envvars['convert_output_fmt']
+            if os.path.exists(out_file) \
+                and os.path.getmtime(out_file) >= os.path.getmtime(f):
+                continue
+            try:
+                # don't write through a premade figure hardlinked by asset_stage
+                if os.stat(out_file).st_nlink > 1:
+                    os.remove(out_file)
+            except OSError:
+                pass
+            command_str = 'convert '+ self.envvars['convert_flags'] + ' ' \
+                + f + ' ' + out_file
+            jobs.append((f, command_str))
+        if not jobs:
+            return
+        pool = ThreadPool(max(min(len(jobs), multiprocessing.cpu_count()), 1))
+        exit_codes = pool.map(os.system, [command_str for f, command_str in jobs])
+        pool.close()
+        pool.join()
+        for (f, command_str), exit_code in zip(jobs, exit_codes):
+            if exit_code != 0:
+                print("WARNING: couldn't convert {} (exit status {}).".format(
+                    f, exit_code))
 
     def _cleanup_pod_files(self):
         """Private method called by :meth:`~shared_diagnostic.Diagnostic.tearDown`.
+
+        PDF documentation and premade obs figures are staged concurrently with
+        :func:`asset_stage.stage_files`, which links them instead of copying
+        where possible and skips files unchanged since a previous run.
         """
+        jobs = []
         # copy PDF documentation (if any) to output
         files = glob.glob(os.path.join(self.POD_CODE_DIR, '*.pdf'))
         for file in files:
-            shutil.copy2(file, self.POD_WK_DIR)
+            jobs.append((file, 
+                os.path.join(self.POD_WK_DIR, os.path.basename(file))))
 
         # copy premade figures (if any) to output 
         exts = ['gif', 'png', 'jpg', 'jpeg']
@@ -421,17 +554,24 @@ class Diagnostic(object):
         for pattern in globs:
             files.extend(glob.glob(pattern))
         for file in files:
-            shutil.copy2(file, os.path.join(self.POD_WK_DIR, 'obs'))
+            jobs.append((file, 
+                os.path.join(self.POD_WK_DIR, 'obs', os.path.basename(file))))
+        results = asset_stage.stage_files(jobs, 
+            hardlink=(self.envvars.get("link_pod_assets", "1") != "0"))
+        for (file, dest), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                print("WARNING: couldn't copy {} to {}: {}".format(
+                    file, dest, result))
 
         # remove .eps files if requested
-        if os.environ["save_ps"] == "0":
+        if self.envvars["save_ps"] == "0":
             dirs = ['model/PS', 'obs/PS']
             for d in dirs:
                 if os.path.exists(os.path.join(self.POD_WK_DIR, d)):
                     shutil.rmtree(os.path.join(self.POD_WK_DIR, d))
 
         # delete netCDF files if requested
-        if os.environ["save_nc"] == "0":    
+        if self.envvars["save_nc"] == "0":    
             dirs = ['model/netCDF', 'obs/netCDF']
             for d in dirs:
                 if os.path.exists(os.path.join(self.POD_WK_DIR, d)):
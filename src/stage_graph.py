@@ -0,0 +1,219 @@
+"""Run the steps of a POD as a graph of stages.
+
+POD driver scripts that call a sequence of external scripts (eg. NCL) can
+declare each step as a stage, with the files it reads and writes. Stages whose
+inputs don't depend on each other are run concurrently, and a stage is skipped
+if all its outputs already exist and are newer than its inputs, as in make.
+
+This module is imported by POD driver scripts, which may be run in any of the
+framework's conda environments, so it only depends on the standard library::
+
+    import os, sys
+    sys.path.append(os.path.join(os.environ["CODE_ROOT"], "src"))
+    from stage_graph import StageGraph
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+if os.name == 'posix' and sys.version_info[0] < 3:
+    try:
+        import subprocess32 as subprocess
+    except ImportError:
+        import subprocess
+else:
+    import subprocess
+
+class Stage(object):
+    """One step of a POD, run as a shell command.
+
+    Attributes:
+        name (:obj:`str`): Name of the stage, unique within its graph.
+        command (:obj:`str`): Shell command to run.
+        inputs (:obj:`list` of :obj:`str`): Paths to files read by the stage.
+        outputs (:obj:`list` of :obj:`str`): Paths to files written by the
+            stage. Only needed for files that other stages read, or to let the
+            stage be skipped when they're up to date.
+        after (:obj:`list` of :obj:`str`): Names of stages that must finish
+            before this one starts, in addition to those producing its inputs.
+        status (:obj:`str`): '' before the graph is run, then one of
+            'running', 'succeeded', 'failed', 'up to date' or 'not run' (if a
+            stage it depends on failed).
+    """
+    def __init__(self, name, command, inputs=None, outputs=None, after=None):
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+        self.after = list(after or [])
+        self.status = ''
+        self.process_obj = None
+        self.log = None
+
+    def is_up_to_date(self):
+        """True if the stage declares outputs, they all exist, and none are
+        older than any of its inputs that exist.
+        """
+        if not self.outputs or not all(os.path.exists(f) for f in self.outputs):
+            return False
+        input_times = [os.path.getmtime(f) for f in self.inputs if os.path.exists(f)]
+        if not input_times:
+            return True
+        return max(input_times) <= min(os.path.getmtime(f) for f in self.outputs)
+
+
+class StageGraph(object):
+    """Stages of a POD and the dependencies between them.
+
+    A stage depends on the stages named in its ``after`` list, and on all
+    stages that list one of its inputs as an output.
+    """
+    def __init__(self, max_workers=0, poll_interval=0.5):
+        """
+        Args:
+            max_workers (:obj:`int`, optional): Maximum number of stages to run
+                at once. Default 0 means the number of cores the framework
+                reserved for the POD (``cores`` in its settings.yml), or the
+                number of cores on the node if run outside the framework.
+            poll_interval (:obj:`float`, optional): Seconds between checks on
+                running stages.
+        """
+        if max_workers <= 0:
+            if 'POD_CORES' in os.environ:
+                max_workers = int(os.environ['POD_CORES'])
+            else:
+                max_workers = multiprocessing.cpu_count()
+        self.max_workers = max(max_workers, 1)
+        self.poll_interval = poll_interval
+        self.stages = []
+
+    def add_stage(self, name, command, inputs=None, outputs=None, after=None):
+        """Add a stage running a shell `command`. See :class:`Stage` for the
+        arguments.
+
+        Returns:
+            The new :class:`Stage`.
+        """
+        if name in [s.name for s in self.stages]:
+            raise ValueError("Stage {} defined twice.".format(name))
+        stage = Stage(name, command, inputs, outputs, after)
+        self.stages.append(stage)
+        return stage
+
+    def add_ncl_stage(self, script, inputs=None, outputs=None, after=None):
+        """Add a stage running an NCL script. The stage is named after the
+        script, and the script itself counts as an input, so that the stage is
+        rerun if it's been edited.
+        """
+        name = os.path.splitext(os.path.basename(script))[0]
+        inputs = [script] + list(inputs or [])
+        return self.add_stage(name, 'ncl {0}'.format(script), inputs, outputs, after)
+
+    def dependencies(self):
+        """Return :obj:`dict` mapping each stage's name to the :obj:`set` of
+        names of stages it depends on.
+
+        Raises:
+            ValueError: if a stage depends on one that isn't defined, or the
+            dependencies contain a cycle.
+        """
+        producers = {}
+        for stage in self.stages:
+            for f in stage.outputs:
+                producers[os.path.abspath(f)] = stage.name
+        names = set(s.name for s in self.stages)
+        deps = {}
+        for stage in self.stages:
+            d = set(stage.after)
+            for f in stage.inputs:
+                if os.path.abspath(f) in producers:
+                    d.add(producers[os.path.abspath(f)])
+            d.discard(stage.name)
+            if not d.issubset(names):
+                raise ValueError("Stage {} depends on undefined stage(s) {}.".format(
+                    stage.name, ', '.join(sorted(d - names))))
+            deps[stage.name] = d
+        # check for cycles by repeatedly removing stages with no dependencies
+        remaining = dict((k, set(v)) for k, v in deps.items())
+        while remaining:
+            ready = [k for k, v in remaining.items() if not v]
+            if not ready:
+                raise ValueError("Cycle in dependencies of stages {}.".format(
+                    ', '.join(sorted(remaining))))
+            for k in ready:
+                del remaining[k]
+            for v in remaining.values():
+                v.difference_update(ready)
+        return deps
+
+    def run(self):
+        """Run all stages, in the order they were added subject to their
+        dependencies, with up to ``max_workers`` running at once. Output of
+        each stage is printed when it finishes.
+
+        Returns:
+            :obj:`list` of names of stages that failed or weren't run.
+        """
+        deps = self.dependencies()
+        by_name = dict((s.name, s) for s in self.stages)
+        done = set(['succeeded', 'up to date'])
+        pending = list(self.stages)
+        running = []
+        while pending or running:
+            for stage in list(running):
+                if stage.process_obj.poll() is None:
+                    continue
+                running.remove(stage)
+                self._finish_stage(stage)
+            for stage in list(pending):
+                dep_status = [by_name[d].status for d in deps[stage.name]]
+                if any(s in ['failed', 'not run'] for s in dep_status):
+                    pending.remove(stage)
+                    stage.status = 'not run'
+                    print("WARNING: not running {0} because a stage it depends on failed.".format(stage.name))
+                    continue
+                if not all(s in done for s in dep_status):
+                    continue
+                if stage.is_up_to_date():
+                    pending.remove(stage)
+                    stage.status = 'up to date'
+                    print("Skipping {0}: outputs are up to date.".format(stage.name))
+                    continue
+                if len(running) >= self.max_workers:
+                    continue
+                pending.remove(stage)
+                if self._start_stage(stage):
+                    running.append(stage)
+            if running:
+                time.sleep(self.poll_interval)
+        return [s.name for s in self.stages if s.status not in done]
+
+    def _start_stage(self, stage):
+        print("Calling {0}".format(stage.command))
+        stage.log = tempfile.TemporaryFile()
+        try:
+            stage.process_obj = subprocess.Popen(
+                stage.command, shell=True,
+                stdout=stage.log, stderr=subprocess.STDOUT
+            )
+        except OSError as e:
+            print("WARNING: {0} {1}".format(e.errno, e.strerror))
+            stage.status = 'failed'
+            stage.log.close()
+            return False
+        stage.status = 'running'
+        return True
+
+    def _finish_stage(self, stage):
+        stage.log.seek(0)
+        output = stage.log.read().decode('utf-8', 'replace')
+        stage.log.close()
+        print('Stage {0} \n {1}'.format(stage.name, output))
+        if stage.process_obj.returncode == 0:
+            stage.status = 'succeeded'
+        else:
+            stage.status = 'failed'
+            print("WARNING: {0} exited with code {1}.".format(
+                stage.name, stage.process_obj.returncode))
+        stage.process_obj = None
@@ -0,0 +1,149 @@
+"""Write copies of netCDF files restricted to a range of years, so that PODs
+only read the years requested for a case (FIRSTYR to LASTYR).
+
+Uses the netCDF4 module if it's available. If it isn't, or a file doesn't need
+to be subset, the copy is a symlink to the original file.
+"""
+import os
+import tempfile
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+# approximate size (bytes) of the blocks of time steps copied at once
+_block_size = 2**26
+
+def _time_index_range(years, firstyr, lastyr):
+    """Private function: return (start, end) slice indices of the entries of
+    (sorted) `years` that fall between `firstyr` and `lastyr`, inclusive.
+    """
+    start = 0
+    while start < len(years) and years[start] < firstyr:
+        start += 1
+    end = start
+    while end < len(years) and years[end] <= lastyr:
+        end += 1
+    return (start, end)
+
+def _find_time_var(dataset, time_coord):
+    """Private function: return the time coordinate variable, looking for
+    `time_coord` and then the coordinate variable of the unlimited dimension.
+    """
+    if time_coord in dataset.variables:
+        return dataset.variables[time_coord]
+    for name, dim in dataset.dimensions.items():
+        if dim.isunlimited() and name in dataset.variables:
+            return dataset.variables[name]
+    return None
+
+def _link(in_path, out_path):
+    if os.path.lexists(out_path):
+        os.remove(out_path)
+    os.symlink(os.path.realpath(in_path), out_path)
+
+def subset_time_range(in_path, out_path, firstyr, lastyr, time_coord='time'):
+    """Write the time steps of `in_path` in years `firstyr` to `lastyr` to
+    `out_path`.
+
+    If all time steps are in range, netCDF4 isn't available, or the file has no
+    recognizable time coordinate, `out_path` is a symlink to `in_path` instead.
+    The copy is given the modification time of the original, so that it
+    doesn't look like new input data.
+
+    Args:
+        in_path (:obj:`str`): Path to the netCDF file to subset.
+        out_path (:obj:`str`): Path to write the subset file to.
+        firstyr (:obj:`int`): First year to keep.
+        lastyr (:obj:`int`): Last year to keep.
+        time_coord (:obj:`str`, optional): Name of the time coordinate.
+
+    Returns:
+        :obj:`bool`: True if a subset copy was written, False if linked.
+    """
+    if not os.path.isdir(os.path.dirname(out_path)):
+        os.makedirs(os.path.dirname(out_path))
+    if netCDF4 is None:
+        _link(in_path, out_path)
+        return False
+    src = netCDF4.Dataset(in_path, 'r')
+    try:
+        tvar = _find_time_var(src, time_coord)
+        if tvar is None or tvar.ndim != 1 or not hasattr(tvar, 'units'):
+            print("WARNING: no time coordinate found in {}; not subsetting.".format(in_path))
+            _link(in_path, out_path)
+            return False
+        dates = netCDF4.num2date(tvar[:], tvar.units,
+            getattr(tvar, 'calendar', 'standard'))
+        start, end = _time_index_range([d.year for d in dates],
+            int(firstyr), int(lastyr))
+        if (start, end) == (0, len(dates)):
+            _link(in_path, out_path)
+            return False
+        if start == end:
+            print("WARNING: {} has no data for {}-{}; not subsetting.".format(
+                in_path, firstyr, lastyr))
+            _link(in_path, out_path)
+            return False
+        # write to a temporary file and rename, so PODs never see a partial copy
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path), suffix='.nc')
+        os.close(fd)
+        try:
+            _copy_subset(src, tmp_path, tvar.dimensions[0], start, end)
+            if os.path.lexists(out_path):
+                os.remove(out_path)
+            os.rename(tmp_path, out_path)
+        except:
+            os.remove(tmp_path)
+            raise
+    finally:
+        src.close()
+    mtime = os.path.getmtime(in_path)
+    os.utime(out_path, (mtime, mtime))
+    return True
+
+def _copy_subset(src, out_path, time_dim, start, end):
+    """Private function: copy `src` to `out_path`, keeping only indices
+    `start` to `end` along dimension `time_dim`. Data is copied unchanged
+    (without applying scale factors or masks) in blocks of time steps, to
+    limit memory use.
+    """
+    dst = netCDF4.Dataset(out_path, 'w', format=src.data_model)
+    try:
+        dst.setncatts(dict((a, src.getncattr(a)) for a in src.ncattrs()))
+        for name, dim in src.dimensions.items():
+            if dim.isunlimited():
+                dst.createDimension(name, None)
+            elif name == time_dim:
+                dst.createDimension(name, end - start)
+            else:
+                dst.createDimension(name, len(dim))
+        for name, var in src.variables.items():
+            attrs = dict((a, var.getncattr(a)) for a in var.ncattrs())
+            out = dst.createVariable(name, var.datatype, var.dimensions,
+                fill_value = attrs.pop('_FillValue', None))
+            out.setncatts(attrs)
+            # variables created after set_auto_maskandscale() on the dataset
+            # don't inherit it, so set it per variable
+            var.set_auto_maskandscale(False)
+            out.set_auto_maskandscale(False)
+            if var.ndim == 0:
+                out.assignValue(var.getValue())
+            elif time_dim not in var.dimensions:
+                out[:] = var[:]
+            else:
+                axis = var.dimensions.index(time_dim)
+                step_size = var.dtype.itemsize
+                for i, d in enumerate(var.shape):
+                    if i != axis:
+                        step_size *= d
+                block = max(1, _block_size // max(step_size, 1))
+                for i in range(start, end, block):
+                    j = min(i + block, end)
+                    in_slice = [slice(None)] * var.ndim
+                    out_slice = [slice(None)] * var.ndim
+                    in_slice[axis] = slice(i, j)
+                    out_slice[axis] = slice(i - start, j - start)
+                    out[tuple(out_slice)] = var[tuple(in_slice)]
+    finally:
+        dst.close()
@@ -23,9 +23,16 @@ class Singleton(_Singleton('SingletonMeta', (object,), {})):
     use this as safer way to pass around global state.
 
     Note:
-        All child classes, :class:`~util.PathManager` and :class:`~util.VariableTranslator`,
-        are read-only, although this is not enforced. This eliminates most of the
+        :class:`~util.PathManager` and :class:`~util.VariableTranslator` are
+        read-only, although this is not enforced. This eliminates most of the
         danger in using Singletons or global state in general.
+        :class:`~environment_manager.NodeResources` and
+        :class:`~pod_cache.ResultCache` hold mutable state shared by all
+        cases, guarded by their own locks.
+
+        Creating an instance isn't thread-safe, so Singletons used by
+        concurrently running cases must be created before the cases are
+        started (see ``mdtf.py``); later calls return that instance.
     """
     @classmethod
     def _reset(cls):
@@ -188,6 +195,28 @@ def get_available_programs(verbose=0):
     return {'py': 'python', 'ncl': 'ncl', 'R': 'Rscript'}
     #return {'py': sys.executable, 'ncl': 'ncl'}  
 
+def parse_memory_size(mem_str):
+    """Convert a memory or disk size, as given in the ``max_memory`` POD 
+    setting or ``pod_cache_size`` config setting, to bytes.
+
+    Args:
+        mem_str: Either a number, interpreted as megabytes, or a string with
+            one of the suffixes K, M, G or T (optionally followed by B),
+            eg. ``'500M'`` or ``'16GB'``.
+
+    Returns:
+        :obj:`int` number of bytes.
+    """
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    if isinstance(mem_str, (int, long, float)):
+        return int(mem_str * units['M'])
+    s = str(mem_str).strip().upper()
+    if s.endswith('B'):
+        s = s[:-1]
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(float(s) * units['M'])
+
 def makefilepath(varname,timefreq,casename,datadir):
     """ 
     USAGE (varname, timefreq, casename, datadir )
@@ -201,10 +230,17 @@ def makefilepath(varname,timefreq,casename,datadir):
 def setenv(varname,varvalue,env_dict,verbose=0,overwrite=True):
     """Wrapper to set environment variables.
 
+    Variables are only recorded in `env_dict`, not in the environment of the
+    current process (:obj:`os.environ`), so that several cases (each with its 
+    own `env_dict`) can be set up and run concurrently from the same driver 
+    process. The dict is passed to the POD's subprocess by 
+    :meth:`environment_manager.EnvironmentManager.run`; see 
+    :func:`~util.get_subprocess_env`.
+
     Args:
         varname (:obj:`str`): Variable name to define
         varvalue: Value to assign. Coerced to type :obj:`str` before being set.
-        env_dict (:obj:`dict`): Copy of 
+        env_dict (:obj:`dict`): Environment variables for a case or POD.
         verbose (:obj:`int`, optional): Logging verbosity level. Default 0.
         overwrite (:obj:`bool`): If set to `False`, do not overwrite the values
             of previously-set variables. 
@@ -212,10 +248,6 @@ def setenv(varname,varvalue,env_dict,verbose=0,overwrite=True):
     if (not overwrite) and (varname in env_dict): 
         if (verbose > 0): print "Not overwriting ENV ",varname," = ",env_dict[varname]
     else:
-        if ('varname' in env_dict) and (env_dict[varname] != varvalue) and (verbose > 0): 
-            print "WARNING: setenv ",varname," = ",varvalue," overriding previous setting ",env_dict[varname]
-        env_dict[varname] = varvalue
-
         # environment variables must be strings
         if type(varvalue) is bool:
             if varvalue == True:
@@ -224,11 +256,29 @@ def setenv(varname,varvalue,env_dict,verbose=0,overwrite=True):
                 varvalue = '0'
         elif type(varvalue) is not str:
             varvalue = str(varvalue)
-        os.environ[varname] = varvalue
+
+        if (varname in env_dict) and (env_dict[varname] != varvalue) and (verbose > 0): 
+            print "WARNING: setenv ",varname," = ",varvalue," overriding previous setting ",env_dict[varname]
+        env_dict[varname] = varvalue
 
         if (verbose > 0): print "ENV ",varname," = ",env_dict[varname]
     if ( verbose > 2) : print "Check ",varname," ",env_dict[varname]
 
+def get_subprocess_env(env_dict):
+    """Return the environment to pass to a subprocess: a copy of the current
+    process's environment (for $PATH, $HOME etc.) updated with the contents of
+    `env_dict`. :obj:`os.environ` itself is never modified.
+
+    Args:
+        env_dict (:obj:`dict`): Environment variables set with :func:`~util.setenv`.
+
+    Returns:
+        :obj:`dict` suitable for the `env` argument of :class:`subprocess.Popen`.
+    """
+    env = os.environ.copy()
+    env.update(env_dict)
+    return env
+
 def check_required_envvar(*varlist):
     verbose=0
     varlist = varlist[0]   #unpack tuple
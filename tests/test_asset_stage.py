@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import src.asset_stage as asset_stage
+
+class TestAssetStage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = self.write('src/fig.png', 'png1')
+        self.dest = os.path.join(self.tmp_dir, 'out', 'obs', 'fig.png')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, rel_path, contents, mtime=1000):
+        path = os.path.join(self.tmp_dir, rel_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    # ---------------------------------------------------
+
+    def test_stage_link(self):
+        self.assertIn(asset_stage.stage(self.src, self.dest), 
+            ['reflinked', 'linked'])
+        self.assertEqual(self.read(self.dest), 'png1')
+        self.assertEqual(asset_stage.stage(self.src, self.dest), 'unchanged')
+        # replacing the destination doesn't write through a hardlink
+        src2 = self.write('src2/fig.png', 'png2', mtime=2000)
+        asset_stage.stage(src2, self.dest, hardlink=False)
+        self.assertEqual(self.read(self.src), 'png1')
+        self.assertEqual(self.read(self.dest), 'png2')
+
+    @mock.patch('src.asset_stage._reflink', side_effect = OSError('EOPNOTSUPP'))
+    def test_stage_copy(self, mock_reflink):
+        self.assertEqual(asset_stage.stage(self.src, self.dest, hardlink=False), 
+            'copied')
+        self.assertEqual(os.stat(self.dest).st_nlink, 1)
+        self.assertEqual(os.path.getmtime(self.dest), 1000)
+        self.assertEqual(os.listdir(os.path.dirname(self.dest)), ['fig.png'])
+
+    def test_same_contents_hash(self):
+        # same contents but different mtime: compared by hash, then mtime synced
+        self.write('out/obs/fig.png', 'png1', mtime=2000)
+        self.assertTrue(asset_stage.same_contents(self.src, self.dest))
+        self.assertEqual(os.path.getmtime(self.dest), 1000)
+        self.write('out/obs/fig.png', 'png9', mtime=2000)
+        self.assertFalse(asset_stage.same_contents(self.src, self.dest))
+        self.write('out/obs/fig.png', 'png10', mtime=1000)
+        self.assertFalse(asset_stage.same_contents(self.src, self.dest))
+
+    def test_stage_files(self):
+        src2 = self.write('src/doc.pdf', 'pdf')
+        dest2 = os.path.join(self.tmp_dir, 'out', 'doc.pdf')
+        missing = os.path.join(self.tmp_dir, 'src', 'missing.png')
+        results = asset_stage.stage_files([(self.src, self.dest), 
+            (src2, dest2), (missing, self.dest + '2')], hardlink=False)
+        self.assertEqual(self.read(dest2), 'pdf')
+        self.assertNotIsInstance(results[0], Exception)
+        self.assertIsInstance(results[2], Exception)
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from src.data_catalog import DataCatalog
+
+class TestDataCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, 'A.B')
+        self.index_dir = os.path.join(self.tmp_dir, 'index')
+        for f in ['day/A.B.pr.day.nc', 'day/A.B.ua.day.nc', 
+            '1hr/A.B.pr.1hr.19900101-19901231.nc', 
+            '1hr/A.B.pr.1hr.19910101-19911231.nc', '1hr/notes.txt']:
+            self.touch(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def touch(self, rel_path):
+        path = os.path.join(self.data_dir, rel_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        return path
+
+    # ---------------------------------------------------
+
+    def test_isfile(self):
+        cat = DataCatalog(self.data_dir)
+        self.assertTrue(cat.isfile(os.path.join(self.data_dir, 'day/A.B.pr.day.nc')))
+        self.assertFalse(cat.isfile(os.path.join(self.data_dir, 'day/A.B.va.day.nc')))
+        self.assertFalse(cat.isfile(os.path.join(self.data_dir, 'mon/A.B.pr.mon.nc')))
+
+    def test_isfile_no_filesystem_calls(self):
+        cat = DataCatalog(self.data_dir)
+        link = os.path.join(self.tmp_dir, 'link')
+        os.symlink(self.data_dir, link)
+        with mock.patch('os.path.realpath') as mock_realpath:
+            with mock.patch('os.path.isfile') as mock_isfile:
+                self.assertTrue(cat.isfile(os.path.join(self.data_dir, 'day/A.B.pr.day.nc')))
+                self.assertTrue(cat.isfile(os.path.join(self.data_dir, 'day/../day/A.B.ua.day.nc')))
+        mock_realpath.assert_not_called()
+        mock_isfile.assert_not_called()
+        # paths through symlinks are resolved as a fallback
+        self.assertTrue(cat.isfile(os.path.join(link, 'day/A.B.pr.day.nc')))
+
+    def test_find(self):
+        cat = DataCatalog(self.data_dir)
+        self.assertEqual(cat.find('pr', 'day'), 
+            [os.path.join(os.path.realpath(self.data_dir), 'day/A.B.pr.day.nc')])
+        self.assertEqual(len(cat.find('pr', '1hr', 'A.B')), 2)
+        self.assertEqual(cat.find('pr', '1hr', 'C'), [])
+        self.assertEqual(cat.entries[('pr','1hr')][0]['date_range'], 
+            ('19900101', '19901231'))
+
+    def test_glob(self):
+        cat = DataCatalog(self.data_dir)
+        self.assertEqual(
+            [os.path.basename(f) for f in cat.glob(self.data_dir+'/1hr/*.pr.1hr.*.nc')],
+            ['A.B.pr.1hr.19900101-19901231.nc', 'A.B.pr.1hr.19910101-19911231.nc'])
+        self.assertEqual(len(cat.glob(self.data_dir+'/*/*.nc')), 4)
+        # '*' doesn't match across directories
+        self.assertEqual(cat.glob(self.data_dir+'/*.nc'), [])
+
+    def test_add(self):
+        cat = DataCatalog(self.data_dir, self.index_dir)
+        path = self.touch('mon/A.B.pr.mon.nc')
+        self.assertTrue(cat.add(path))
+        self.assertTrue(cat.isfile(path))
+        self.assertEqual(cat.find('pr', 'mon'), [os.path.realpath(path)])
+        self.assertFalse(cat.add(os.path.join(self.data_dir, 'mon/A.B.ua.mon.nc')))
+        self.assertTrue(cat.modified)
+        # saved index is current, so it's reused without listing directories
+        cat.save()
+        with mock.patch('os.walk') as mock_walk:
+            cat = DataCatalog(self.data_dir, self.index_dir)
+        mock_walk.assert_not_called()
+        self.assertTrue(cat.isfile(path))
+
+    def test_saved_index(self):
+        cat = DataCatalog(self.data_dir, self.index_dir)
+        self.assertTrue(os.path.isfile(cat.index_file))
+        # reused while unchanged
+        cat = DataCatalog(self.data_dir, self.index_dir)
+        self.assertTrue(cat._load())
+        # invalidated when a file is added
+        new_file = self.touch('day/A.B.va.day.nc')
+        os.utime(os.path.dirname(new_file), (1, 1))
+        cat = DataCatalog(self.data_dir, self.index_dir)
+        self.assertTrue(cat.isfile(new_file))
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
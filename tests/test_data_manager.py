@@ -1,9 +1,14 @@
 import os
+import json
+import time
+import threading
+import shutil
+import tempfile
 import unittest
 import mock # define mock os.environ so we don't mess up real env vars
 import src.util as util
 from src.shared_diagnostic import Diagnostic
-from src.data_manager import DataManager
+from src.data_manager import DataManager, FetchPlan
 
 class TestDataManagerSetup(unittest.TestCase):
     
@@ -51,8 +56,22 @@ class TestDataManagerSetup(unittest.TestCase):
         case.convention = 'not_CF'
         dummy = {'envvars':{}}
         case._set_model_env_vars(dummy)
-        self.assertEqual(os.environ['pr_var'], 'PRECT')
-        self.assertEqual(os.environ['prc_var'], 'PRECC')
+        self.assertEqual(case.envvars['pr_var'], 'PRECT')
+        self.assertEqual(case.envvars['prc_var'], 'PRECC')
+        self.assertEqual(case.envvars['CASENAME'], 'A')
+        self.assertEqual(dummy['envvars'], {})
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_set_model_env_vars_multiple_cases(self):
+        # cases don't share env vars
+        case1 = DataManager(self.default_case)
+        case2 = DataManager(dict(self.default_case, CASENAME='C'))
+        dummy = {'envvars':{'D':'E'}}
+        case1._set_model_env_vars(dummy)
+        case2._set_model_env_vars(dummy)
+        self.assertEqual(case1.envvars['CASENAME'], 'A')
+        self.assertEqual(case2.envvars['CASENAME'], 'C')
+        self.assertEqual(case2.envvars['D'], 'E')
 
     @mock.patch.multiple(DataManager, __abstractmethods__=set())
     def test_set_model_env_vars_no_model(self):
@@ -70,10 +89,13 @@ class TestDataManagerSetup(unittest.TestCase):
     @mock.patch('os.path.exists', return_value = True)
     def test_setup_pod_cf_cf(self, mock_exists, mock_read_yaml):
         case = DataManager(self.default_case)
+        case.envvars = {'CASENAME': 'A'}
         pod = Diagnostic('C')
         case._setup_pod(pod)
         self.assertEqual(pod.varlist[0]['CF_name'], 'pr_var')
         self.assertEqual(pod.varlist[0]['name_in_model'], 'pr_var')
+        self.assertEqual(pod.envvars, case.envvars)
+        self.assertIsNot(pod.envvars, case.envvars)
 
     @mock.patch.multiple(DataManager, __abstractmethods__=set())
     @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = default_pod_CF)
@@ -108,6 +130,38 @@ class TestDataManagerSetup(unittest.TestCase):
         self.assertEqual(pod.varlist[0]['CF_name'], 'pr_var')
         self.assertEqual(pod.varlist[0]['name_in_model'], 'PRECT')
 
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = default_pod_CF)
+    @mock.patch('os.path.exists', return_value = True)
+    def test_make_run_report(self, mock_exists, mock_read_yaml):
+        case = DataManager(self.default_case)
+        case.MODEL_WK_DIR = tempfile.mkdtemp()
+        try:
+            pod1 = Diagnostic('C')
+            pod1.status = 'succeeded'
+            pod1.returncode = 0
+            pod1.resource_usage = {'wall_time': 2., 'peak_rss': 1024**2}
+            pod1.description = 'POD C'
+            os.mkdir(os.path.join(case.MODEL_WK_DIR, 'C'))
+            open(os.path.join(case.MODEL_WK_DIR, 'C', 'C.html'), 'w').close()
+            pod2 = Diagnostic('D')
+            case.pods = [pod1, pod2]
+            case._makeRunReport()
+            with open(os.path.join(case.MODEL_WK_DIR, 'run_report.json')) as f:
+                report = json.load(f)
+            self.assertEqual(report['pods']['C'], 
+                {'status':'succeeded', 'returncode':0, 
+                'wall_time':2., 'peak_rss':1024**2})
+            self.assertEqual(report['pods']['D']['status'], 'not run')
+            with open(os.path.join(case.MODEL_WK_DIR, 'index.html')) as f:
+                html = f.read()
+            self.assertIn('<TD>C</TD><TD>succeeded</TD><TD>2.0</TD><TD>-</TD>', html)
+            # only PODs whose webpage was made are linked
+            self.assertIn('POD C <A HREF="C/C.html">plots</A>', html)
+            self.assertNotIn('D/D.html', html)
+        finally:
+            shutil.rmtree(case.MODEL_WK_DIR)
+
     # @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
     #     'settings':{'conda_env':'B'},'varlist':[]})
     # def test_parse_pod_settings_conda_env(self, mock_read_yaml):
@@ -116,5 +170,135 @@ class TestDataManagerSetup(unittest.TestCase):
     #     self.assertEqual(pod.conda_env, '_MDTF-diagnostics-B')
 
 
+class TestDataManagerFetch(unittest.TestCase):
+
+    def setUp(self):
+        temp = util.PathManager(unittest_flag = True)
+
+    def tearDown(self):
+        temp = util.PathManager(unittest_flag = True)
+        temp._reset()
+
+    default_case = {
+        'CASENAME': 'A', 'model': 'B', 'FIRSTYR': 1900, 'LASTYR': 2100,
+        'pod_list': []
+    }
+
+    class Pod(object):
+        def __init__(self, name, varlist):
+            self.name = name
+            self.varlist = varlist
+
+    def var(self, name, freq='day', alternates=[]):
+        return {'var_name': name+'_var', 'name_in_model': name, 'freq': freq,
+            'alternates': alternates}
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_plan_data_dedup(self):
+        case = DataManager(self.default_case)
+        case.queryDataset = lambda v: v['name_in_model'] != 'ua'
+        case.pods = [
+            self.Pod('P1', [self.var('pr'), self.var('ua', alternates=['u', 'ps'])]),
+            self.Pod('P2', [self.var('pr'), self.var('pr', freq='mon'), self.var('ps')])
+        ]
+        case.planData()
+        plan = case.data_to_fetch
+        self.assertEqual([FetchPlan.key(v) for v in plan], 
+            [('pr','day'), ('u','day'), ('ps','day'), ('pr','mon')])
+        self.assertEqual(plan.consumers(self.var('pr')), ['P1', 'P2'])
+        self.assertEqual(plan.consumers(self.var('ps')), ['P1', 'P2'])
+        self.assertEqual(plan.consumers(self.var('pr', freq='mon')), ['P2'])
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_plan_data_missing_alternates(self):
+        case = DataManager(self.default_case)
+        case.queryDataset = lambda v: v['name_in_model'] == 'u'
+        case.pods = [self.Pod('P1', [self.var('ua', alternates=['u', 'ps'])])]
+        case.planData()
+        self.assertEqual(len(case.data_to_fetch), 0)
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_fetch_data(self):
+        case = DataManager(self.default_case, 
+            {'settings': {'max_concurrent_fetches': 2}})
+        case.catalog = mock.Mock()
+        case.queryDataset = lambda v: True
+        case.fetchDataset = mock.Mock()
+        case.pods = [self.Pod('P1', [self.var('pr'), self.var('ua')]),
+            self.Pod('P2', [self.var('pr')])]
+        case.fetchData()
+        self.assertEqual(case.fetchDataset.call_count, 2)
+        # fetched files are added to the catalog, which is saved once
+        self.assertEqual(sorted([c[0][0] for c in case.catalog.add.call_args_list]),
+            ['TEST_MODEL_DATA_ROOT/A/day/A.pr.day.nc', 
+            'TEST_MODEL_DATA_ROOT/A/day/A.ua.day.nc'])
+        case.catalog.save.assert_called_once_with()
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_fetch_data_exit(self):
+        # exit() in a fetch thread is re-raised, not hung
+        case = DataManager(self.default_case)
+        case.catalog = mock.Mock()
+        case.queryDataset = lambda v: True
+        case.fetchDataset = mock.Mock(side_effect = SystemExit)
+        case.pods = [self.Pod('P1', [self.var('pr'), self.var('ua')])]
+        self.assertRaises(SystemExit, case.fetchData)
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_wait_for_data_no_raise(self):
+        # once PODs have run (with overlap), fetch errors are only reported
+        case = DataManager(self.default_case)
+        case.catalog = mock.Mock()
+        case.queryDataset = lambda v: True
+        case.fetchDataset = mock.Mock(side_effect = SystemExit)
+        case.pods = [self.Pod('P1', [self.var('pr')])]
+        case.fetchData(wait=False)
+        case.waitForData(raise_errors=False)
+        self.assertRaises(SystemExit, case.waitForData)
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    def test_fetch_data_overlap(self):
+        # POD is ready as soon as its own data is fetched
+        case = DataManager(self.default_case)
+        case.catalog = mock.Mock()
+        case.queryDataset = lambda v: True
+        slow_fetch = threading.Event()
+        def _fetch(var):
+            if var['name_in_model'] == 'ua':
+                slow_fetch.wait(5)
+        case.fetchDataset = _fetch
+        pod1 = self.Pod('P1', [self.var('pr')])
+        pod2 = self.Pod('P2', [self.var('pr'), self.var('ua')])
+        case.pods = [pod1, pod2]
+        case.fetchData(wait=False)
+        for i in range(50):
+            if case.podDataReady(pod1):
+                break
+            time.sleep(0.02)
+        self.assertTrue(case.podDataReady(pod1))
+        self.assertFalse(case.podDataReady(pod2))
+        slow_fetch.set()
+        case.waitForData()
+        self.assertTrue(case.podDataReady(pod2))
+
+    @mock.patch.multiple(DataManager, __abstractmethods__=set())
+    @mock.patch('src.time_subset.subset_time_range', return_value=False)
+    def test_fetch_data_subset(self, mock_subset):
+        # fetched data is subset to FIRSTYR-LASTYR in MODEL_WK_DIR
+        case = DataManager(self.default_case, 
+            {'settings': {'subset_time_range': True}})
+        case.catalog = mock.Mock()
+        self.assertEqual(case.pod_data_dir, 'TEST_WORKING_DIR/MDTF_A_1900_2100/model_data')
+        case.queryDataset = lambda v: True
+        case.fetchDataset = mock.Mock()
+        case.pods = [self.Pod('P1', [self.var('pr')])]
+        with mock.patch('os.path.exists', return_value=True):
+            case.fetchData()
+        mock_subset.assert_called_once_with(
+            'TEST_MODEL_DATA_ROOT/A/day/A.pr.day.nc', 
+            'TEST_WORKING_DIR/MDTF_A_1900_2100/model_data/day/A.pr.day.nc',
+            1900, 2100, time_coord='time')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,9 +1,12 @@
 import os
 import sys
+import signal
 import unittest
 import mock # define mock os.environ so we don't mess up real env vars
 import src.util as util
-from src.environment_manager import EnvironmentManager
+from src.environment_manager import EnvironmentManager, NodeResources, \
+    RuntimeHistory, ResourceUsage, NoneEnvironmentManager
+from src.pod_cache import ResultCache
 
 class TestEnvironmentManager(unittest.TestCase):
     test_config = {'case_list':[{}], 'pod_list':['X']}
@@ -30,6 +33,226 @@ class TestEnvironmentManager(unittest.TestCase):
     def test_run(self):
         pass #TODO
 
+class TestNodeResources(unittest.TestCase):
+
+    def tearDown(self):
+        NodeResources._reset()
+
+    class Pod(object):
+        def __init__(self, name, max_memory=0, cores=1):
+            self.name = name
+            self.max_memory = max_memory
+            self.cores = cores
+
+    def test_acquire_max_pods(self):
+        node = NodeResources(max_pods=2)
+        node.cores = 8
+        self.assertTrue(node.acquire(self.Pod('A', cores=0)))
+        self.assertTrue(node.acquire(self.Pod('B', cores=0)))
+        self.assertFalse(node.acquire(self.Pod('C', cores=0)))
+
+    def test_acquire_memory(self):
+        node = NodeResources()
+        node.memory = 10
+        node.cores = 8
+        a = self.Pod('A', max_memory=6)
+        self.assertTrue(node.acquire(a))
+        self.assertFalse(node.acquire(self.Pod('B', max_memory=6)))
+        self.assertTrue(node.acquire(self.Pod('C', max_memory=4)))
+        node.release(a)
+        self.assertTrue(node.acquire(self.Pod('B', max_memory=6)))
+
+    def test_acquire_cores(self):
+        node = NodeResources()
+        node.cores = 4
+        self.assertTrue(node.acquire(self.Pod('A', cores=3)))
+        self.assertFalse(node.acquire(self.Pod('B', cores=2)))
+
+    def test_acquire_oversized(self):
+        # always admit a POD if nothing else is running
+        node = NodeResources()
+        node.memory = 10
+        self.assertTrue(node.acquire(self.Pod('A', max_memory=20)))
+        self.assertFalse(node.acquire(self.Pod('B', max_memory=1)))
+
+class TestRuntimeHistory(unittest.TestCase):
+
+    class Pod(object):
+        def __init__(self, name):
+            self.name = name
+
+    @mock.patch('os.path.isfile', return_value = True)
+    @mock.patch('src.util.read_yaml', return_value = {'A': 10., 'B': 100.})
+    def test_order(self, mock_read_yaml, mock_isfile):
+        # longest first; unknown run times at the front
+        history = RuntimeHistory('dummy.yml')
+        pods = [self.Pod(s) for s in ['A', 'B', 'C', 'D']]
+        self.assertEqual(
+            [p.name for p in history.order(pods)], ['C', 'D', 'B', 'A']
+        )
+
+    @mock.patch('os.path.isfile', return_value = True)
+    @mock.patch('src.util.write_yaml')
+    @mock.patch('src.util.read_yaml', return_value = {'A': 10., 'B': 100.})
+    def test_save(self, mock_read_yaml, mock_write_yaml, mock_isfile):
+        history = RuntimeHistory('dummy.yml')
+        history.record('A', 20.)
+        history.save()
+        mock_write_yaml.assert_called_once_with({'A': 20., 'B': 100.}, 'dummy.yml')
+
+class TestResourceUsage(unittest.TestCase):
+
+    def test_update(self):
+        usage = ResourceUsage()
+        self.assertEqual(usage.to_dict(), {})
+        proc = {'utime':1., 'stime':0.5, 'rss':100, 'read_bytes':10, 'write_bytes':20}
+        usage.update([proc, proc])
+        usage.update([dict(proc, rss=50)])
+        self.assertEqual(usage.to_dict(), {
+            'cpu_user':2., 'cpu_sys':1., 'peak_rss':200, 
+            'read_bytes':20, 'write_bytes':40
+        })
+
+    @unittest.skipUnless(os.path.isdir('/proc'), "requires /proc")
+    def test_sample_process_groups(self):
+        pgid = os.getpgrp()
+        samples = ResourceUsage.sample_process_groups([pgid])
+        self.assertGreaterEqual(len(samples[pgid]), 1)
+        self.assertGreater(sum(p['rss'] for p in samples[pgid]), 0)
+
+class TestPodSupervision(unittest.TestCase):
+    test_config = {'settings':{'test_mode':False, 'pod_timeout':60}}
+
+    def tearDown(self):
+        NodeResources._reset()
+        ResultCache._reset()
+
+    class Pod(object):
+        def __init__(self, name, timeout=0, returncode=None):
+            self.name = name
+            self.timeout = timeout
+            self.max_memory = 0
+            self.cores = 1
+            self.status = 'running'
+            self.start_time = 0.
+            self.kill_time = None
+            self.POD_WK_DIR = '/WK'
+            self.logfile_obj = None
+            self.process_obj = mock.Mock(pid=1234, returncode=returncode)
+            self.process_obj.poll.return_value = returncode
+            self.usage = ResourceUsage()
+
+    @mock.patch('src.environment_manager.timeit.default_timer', return_value = 30.)
+    def test_check_timeout_running(self, mock_timer):
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        pod = self.Pod('A')
+        self.assertFalse(env_mgr._check_timeout(pod))
+        self.assertEqual(pod.status, 'running')
+
+    @mock.patch('os.killpg')
+    @mock.patch('src.environment_manager.timeit.default_timer', return_value = 30.)
+    def test_check_timeout_pod_setting(self, mock_timer, mock_killpg):
+        # POD's own timeout overrides config default
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        pod = self.Pod('A', timeout=10, returncode=-15)
+        self.assertTrue(env_mgr._check_timeout(pod))
+        self.assertEqual(pod.status, 'timed out')
+        mock_killpg.assert_called_once_with(1234, signal.SIGTERM)
+
+    @mock.patch('os.killpg')
+    @mock.patch('src.environment_manager.timeit.default_timer', 
+        side_effect = [30., 35., 41.])
+    def test_check_timeout_escalate(self, mock_timer, mock_killpg):
+        # SIGKILL is sent on a later poll, without waiting in between
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        env_mgr.kill_grace_period = 10
+        pod = self.Pod('A', timeout=10)
+        self.assertTrue(env_mgr._check_timeout(pod))
+        self.assertEqual(mock_killpg.call_args_list, [mock.call(1234, signal.SIGTERM)])
+        self.assertTrue(env_mgr._check_timeout(pod))
+        self.assertEqual(mock_killpg.call_count, 1)
+        self.assertTrue(env_mgr._check_timeout(pod))
+        self.assertEqual(mock_killpg.call_args_list[-1], mock.call(1234, signal.SIGKILL))
+
+    def test_finish_pod_succeeded(self):
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        env_mgr.node.acquire(self.Pod('A'))
+        pod = self.Pod('A', returncode=0)
+        history = mock.Mock()
+        env_mgr._finish_pod(pod, history)
+        self.assertEqual(pod.status, 'succeeded')
+        self.assertEqual(pod.returncode, 0)
+        self.assertIsNone(pod.process_obj)
+        history.record.assert_called_once_with('A', pod.elapsed)
+        self.assertEqual(pod.resource_usage, {'wall_time': pod.elapsed})
+
+    def test_finish_pod_failed(self):
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        env_mgr.node.acquire(self.Pod('A'))
+        pod = self.Pod('A', returncode=1)
+        history = mock.Mock()
+        env_mgr._finish_pod(pod, history)
+        self.assertEqual(pod.status, 'failed')
+        self.assertEqual(pod.returncode, 1)
+        history.record.assert_not_called()
+
+    @mock.patch('src.environment_manager.RuntimeHistory')
+    def test_run_waits_for_data(self, mock_history):
+        # PODs are only set up once their data is ready
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        env_mgr.poll_interval = 0
+        mock_history.return_value.order.side_effect = lambda pods: pods
+        ready = {'A': [False, False, True], 'B': [True]}
+        env_mgr.data_ready = lambda pod: ready[pod.name].pop(0)
+        env_mgr.pods = [self.Pod('A'), self.Pod('B')]
+        with mock.patch.object(env_mgr, '_setup_pod', return_value=False) as mock_setup:
+            env_mgr.run()
+        self.assertEqual([c[0][0].name for c in mock_setup.call_args_list], 
+            ['B', 'A'])
+
+    @mock.patch('src.environment_manager.time.sleep')
+    @mock.patch('src.environment_manager.RuntimeHistory')
+    def test_run_waits_for_node(self, mock_history, mock_sleep):
+        # sleep while the node is busy with other cases' PODs, even though
+        # none of this case's PODs are running
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        mock_history.return_value.order.side_effect = lambda pods: pods
+        env_mgr.node = mock.Mock()
+        env_mgr.node.acquire.side_effect = [False, False, True]
+        env_mgr.pods = [self.Pod('A')]
+        with mock.patch.object(env_mgr, '_setup_pod', return_value=True):
+            with mock.patch.object(env_mgr, '_start_pod', return_value=False):
+                env_mgr.run()
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @mock.patch('os.killpg')
+    @mock.patch('src.environment_manager.time.sleep')
+    @mock.patch('src.environment_manager.RuntimeHistory')
+    def test_run_error_kills_running(self, mock_history, mock_sleep, mock_killpg):
+        # POD A is killed and its resources released if setting up B fails
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        mock_history.return_value.order.side_effect = lambda pods: pods
+        ready = {'A': [True], 'B': [False, True]}
+        env_mgr.data_ready = lambda pod: ready[pod.name].pop(0)
+        pod_a = self.Pod('A')
+        env_mgr.pods = [pod_a, self.Pod('B')]
+        with mock.patch.object(env_mgr, '_setup_pod',
+            side_effect = [True, SystemExit]):
+            with mock.patch.object(env_mgr, '_start_pod', return_value=True):
+                self.assertRaises(SystemExit, env_mgr.run)
+        mock_killpg.assert_called_once_with(1234, signal.SIGKILL)
+        self.assertEqual(pod_a.status, 'failed')
+        self.assertIsNone(pod_a.process_obj)
+        self.assertEqual(env_mgr.node.running, 0)
+
+    def test_finish_pod_timed_out(self):
+        env_mgr = NoneEnvironmentManager(self.test_config)
+        env_mgr.node.acquire(self.Pod('A'))
+        pod = self.Pod('A', returncode=-15)
+        pod.status = 'timed out'
+        env_mgr._finish_pod(pod, mock.Mock())
+        self.assertEqual(pod.status, 'timed out')
+
 # ---------------------------------------------------
 
 if __name__ == '__main__':
@@ -0,0 +1,49 @@
+import unittest
+import mock # define mock os.environ so we don't mess up real env vars
+import src.figure_sink as figure_sink
+
+class TestFigureSink(unittest.TestCase):
+
+    def make_fig(self):
+        fig = mock.Mock()
+        fig.canvas.get_supported_filetypes.return_value = \
+            {'png':'Portable Network Graphics', 'eps':'Encapsulated Postscript'}
+        return fig
+
+    @mock.patch.dict('os.environ', {'convert_output_fmt':'png'})
+    def test_bitmap_path(self):
+        # same mapping as Diagnostic._convert_pod_figures
+        self.assertEqual(figure_sink.bitmap_path('A/model/PS/B.eps'), 'A/model/B.png')
+        self.assertEqual(figure_sink.bitmap_path('A/obs/PS/B.ps', 'jpg'), 'A/obs/B.jpg')
+
+    @mock.patch.dict('os.environ', {'convert_output_fmt':'png', 'save_ps':'0'})
+    @mock.patch('os.path.isdir', return_value = True)
+    def test_savefig_bitmap_only(self, mock_isdir):
+        fig = self.make_fig()
+        self.assertEqual(figure_sink.savefig(fig, 'A/model/PS/B.eps', dpi=72),
+            ['A/model/B.png'])
+        fig.savefig.assert_called_once_with('A/model/B.png', format='png', dpi=72)
+
+    @mock.patch.dict('os.environ', {'convert_output_fmt':'png', 'save_ps':'1'})
+    @mock.patch('os.path.isdir', return_value = True)
+    def test_savefig_save_ps(self, mock_isdir):
+        # vector copy is written first, so the bitmap is newer
+        fig = self.make_fig()
+        figure_sink.savefig(fig, 'A/model/PS/B.eps')
+        self.assertEqual(fig.savefig.call_args_list, [
+            mock.call('A/model/PS/B.eps'),
+            mock.call('A/model/B.png', format='png')
+        ])
+
+    @mock.patch.dict('os.environ', {'convert_output_fmt':'gif', 'save_ps':'0'})
+    def test_savefig_unsupported_fmt(self):
+        # fall back to the PS file, converted by the framework
+        fig = self.make_fig()
+        self.assertEqual(figure_sink.savefig(fig, 'A/model/PS/B.eps'),
+            ['A/model/PS/B.eps'])
+        fig.savefig.assert_called_once_with('A/model/PS/B.eps')
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
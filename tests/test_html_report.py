@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+import src.html_report as html_report
+
+class TestHtmlReport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self, name):
+        with open(os.path.join(self.tmp_dir, name)) as f:
+            return f.read()
+
+    # ---------------------------------------------------
+
+    def test_render(self):
+        self.assertEqual(html_report.render(
+            'model/casename.fig_tave.png {{FIRSTYR}}-{{LASTYR}} {{B}}',
+            {'casename':'CASE', '_tave.':'_qsat_int.'},
+            {'FIRSTYR':1980, 'LASTYR':'1990'}),
+            'model/CASE.fig_qsat_int.png 1980-1990 {{B}}')
+
+    def test_render_one_pass(self):
+        # replaced text isn't substituted again; longest key wins
+        self.assertEqual(html_report.render('ab abc',
+            {'a':'b', 'b':'c', 'abc':'x'}), 'bc x')
+
+    def test_render_file(self):
+        template = os.path.join(self.tmp_dir, 'A.html')
+        with open(template, 'w') as f:
+            f.write('<A HREF=model/casename.png>{{CASENAME}}</A>')
+        out_path = os.path.join(self.tmp_dir, 'out.html')
+        html_report.render_file(template, out_path, {'casename':'C'}, 
+            {'CASENAME':'C'})
+        self.assertEqual(self.read('out.html'), '<A HREF=model/C.png>C</A>')
+        # no temporary files left behind
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['A.html', 'out.html'])
+
+    def test_write_index(self):
+        out_path = os.path.join(self.tmp_dir, 'index.html')
+        html_report.write_index(out_path, [('A', 'POD A')],
+            {'A': {'status':'succeeded', 'wall_time':3.}, 'B': {'status':'failed'}})
+        html = self.read('index.html')
+        self.assertTrue(html.startswith('<!--'))
+        self.assertIn('<H3><font color=navy>POD A <A HREF="A/A.html">plots</A></H3>', html)
+        self.assertNotIn('B/B.html', html)
+        self.assertIn('<TD>A</TD><TD>succeeded</TD><TD>3.0</TD><TD>-</TD>', html)
+        self.assertIn('<TD>B</TD><TD>failed</TD>', html)
+        self.assertTrue(html.rstrip().endswith('</HTML>'))
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+import unittest
+from src.output_archive import OutputArchive
+
+class TestOutputArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root_dir = os.path.join(self.tmp_dir, 'MDTF_A')
+        self.prefix = self.root_dir.lstrip(os.sep)
+        self.write('index.html', 'index')
+        self.write('POD1/POD1.html', 'pod1')
+        self.write('POD1/model/fig.png', 'png1')
+        self.write('POD1/model/PS/fig.eps', 'eps1')
+        self.write('POD1/model/netCDF/out.nc', 'nc1')
+        self.write('POD2/POD2.html', 'pod2')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, rel_path, contents, mtime=1000):
+        path = os.path.join(self.root_dir, rel_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+        os.utime(path, (mtime, mtime))
+
+    def archive(self, pods=(), **kwargs):
+        archive = OutputArchive(self.root_dir, **kwargs)
+        archive.start()
+        for pod in pods:
+            archive.add(os.path.join(self.root_dir, pod))
+        self.assertTrue(archive.close())
+        self.assertEqual(archive.errors, [])
+        return archive
+
+    def read_members(self, tar_path):
+        # contents of each file member; later copies replace earlier ones
+        members = {}
+        tar = tarfile.open(tar_path)
+        for tarinfo in tar.getmembers():
+            if tarinfo.isreg():
+                name = os.path.relpath(tarinfo.name, self.prefix)
+                members[name] = members.get(name, []) + \
+                    [tar.extractfile(tarinfo).read().decode('utf-8')]
+        tar.close()
+        return members
+
+    # ---------------------------------------------------
+
+    def test_archive(self):
+        # excludes PS & netCDF, like the previous tar flags
+        archive = self.archive(pods=['POD1'])
+        self.assertEqual(archive.tar_path, self.root_dir + '.tar')
+        self.assertEqual(self.read_members(archive.tar_path), {
+            'index.html': ['index'], 'POD1/POD1.html': ['pod1'],
+            'POD1/model/fig.png': ['png1'], 'POD2/POD2.html': ['pod2']
+        })
+        with open(archive.manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['tar_size'], os.path.getsize(archive.tar_path))
+
+    def test_archive_append_changed(self):
+        archive = self.archive()
+        self.write('POD1/model/fig.png', 'png2', mtime=2000)
+        # touched, but contents unchanged
+        self.write('POD2/POD2.html', 'pod2', mtime=2000)
+        self.write('POD3/POD3.html', 'pod3')
+        archive = self.archive(pods=['POD3', 'POD1'])
+        members = self.read_members(archive.tar_path)
+        self.assertEqual(members['POD1/model/fig.png'], ['png1', 'png2'])
+        self.assertEqual(members['POD2/POD2.html'], ['pod2'])
+        self.assertEqual(members['POD3/POD3.html'], ['pod3'])
+
+    def test_archive_rewrite_removed(self):
+        archive = self.archive()
+        os.remove(os.path.join(self.root_dir, 'POD2', 'POD2.html'))
+        archive = self.archive()
+        self.assertEqual(sorted(self.read_members(archive.tar_path)),
+            ['POD1/POD1.html', 'POD1/model/fig.png', 'index.html'])
+
+    def test_archive_compressed(self):
+        archive = self.archive(pods=['POD2'], compression='gz')
+        self.assertEqual(archive.tar_path, self.root_dir + '.tar.gz')
+        self.assertEqual(self.read_members(archive.tar_path)['POD2/POD2.html'],
+            ['pod2'])
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from src.pod_cache import ResultCache
+
+class TestResultCache(unittest.TestCase):
+
+    class Pod(object):
+        def __init__(self, name, fingerprint, wk_dir):
+            self.name = name
+            self.fingerprint = fingerprint
+            self.POD_WK_DIR = wk_dir
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        ResultCache._reset()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_pod(self, name, fingerprint, size=10):
+        wk_dir = os.path.join(self.tmp_dir, 'wk', name)
+        if not os.path.exists(os.path.join(wk_dir, 'model')):
+            os.makedirs(os.path.join(wk_dir, 'model'))
+        with open(os.path.join(wk_dir, 'model', 'out.nc'), 'w') as f:
+            f.write('x' * size)
+        return self.Pod(name, fingerprint, wk_dir)
+
+    # ---------------------------------------------------
+
+    def test_disabled(self):
+        cache = ResultCache(cache_dir = os.path.join(self.tmp_dir, 'cache'))
+        pod = self.make_pod('A', '123')
+        cache.store(pod)
+        self.assertFalse(os.path.exists(cache.cache_dir))
+        self.assertFalse(cache.restore(pod))
+
+    def test_store_restore(self):
+        cache = ResultCache(max_size = 100, 
+            cache_dir = os.path.join(self.tmp_dir, 'cache'))
+        pod = self.make_pod('A', '123')
+        cache.store(pod)
+        shutil.rmtree(pod.POD_WK_DIR)
+        os.makedirs(pod.POD_WK_DIR)
+        self.assertTrue(cache.restore(pod))
+        with open(os.path.join(pod.POD_WK_DIR, 'model', 'out.nc')) as f:
+            self.assertEqual(f.read(), 'x' * 10)
+        # different fingerprint is a miss
+        self.assertFalse(cache.restore(self.Pod('A', '456', pod.POD_WK_DIR)))
+
+    def test_evict_lru(self):
+        cache = ResultCache(max_size = 25, 
+            cache_dir = os.path.join(self.tmp_dir, 'cache'))
+        pod_a = self.make_pod('A', '1')
+        pod_b = self.make_pod('B', '2')
+        cache.store(pod_a)
+        cache.store(pod_b)
+        # make A least recently used, then use B
+        os.utime(cache._entry_dir(pod_a), (1000, 1000))
+        cache.restore(pod_b)
+        cache.store(self.make_pod('C', '3'))
+        self.assertFalse(os.path.exists(cache._entry_dir(pod_a)))
+        self.assertTrue(os.path.exists(cache._entry_dir(pod_b)))
+
+    def test_store_too_large(self):
+        cache = ResultCache(max_size = 5, 
+            cache_dir = os.path.join(self.tmp_dir, 'cache'))
+        pod = self.make_pod('A', '1')
+        cache.store(pod)
+        self.assertFalse(os.path.exists(cache._entry_dir(pod)))
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
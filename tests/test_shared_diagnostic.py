@@ -29,6 +29,13 @@ class TestDiagnosticInit(unittest.TestCase):
         self.assertEqual(pod.POD_CODE_DIR, 'TEST_CODE_ROOT/diagnostics/A')
         self.assertEqual(pod.required_programs, ['B'])
 
+    @mock.patch('src.shared_diagnostic.util.read_yaml', 
+        return_value = {'settings':{'max_memory':'2G', 'cores':4},'varlist':[]})
+    def test_parse_pod_settings_resources(self, mock_read_yaml):
+        pod = Diagnostic('A')
+        self.assertEqual(pod.max_memory, 2 * 2**30)
+        self.assertEqual(pod.cores, 4)
+
     @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
         'settings':{},'varlist':[{
                 'var_name': 'pr_var', 'freq':'mon', 'requirement':'required'
@@ -88,12 +95,10 @@ class TestDiagnosticSetUp(unittest.TestCase):
         pod = Diagnostic('C')
         pod.POD_WK_DIR = 'A'
         env = pod._set_pod_env_vars()
-        self.assertEqual(os.environ['POD_HOME'], 'TEST_CODE_ROOT/diagnostics/C')
         self.assertEqual(env['POD_HOME'], 'TEST_CODE_ROOT/diagnostics/C')
-        self.assertEqual(os.environ['OBS_DATA'], 'TEST_OBS_DATA_ROOT/C')
         self.assertEqual(env['OBS_DATA'], 'TEST_OBS_DATA_ROOT/C')
-        self.assertEqual(os.environ['WK_DIR'], 'A')
         self.assertEqual(env['WK_DIR'], 'A')
+        self.assertEqual(pod.envvars['WK_DIR'], 'A')
 
     @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
         'settings':{'pod_env_vars':{'D':'E'}}, 'varlist':[]
@@ -104,8 +109,8 @@ class TestDiagnosticSetUp(unittest.TestCase):
         pod = Diagnostic('C')
         pod.POD_WK_DIR = 'A'
         env = pod._set_pod_env_vars()
-        self.assertEqual(os.environ['D'], 'E')
         self.assertEqual(env['D'], 'E')
+        self.assertNotIn('D', os.environ)
 
     # ---------------------------------------------------      
 
@@ -184,11 +189,10 @@ class TestDiagnosticSetUp(unittest.TestCase):
 
     # ---------------------------------------------------
 
-    os_environ_check_for_varlist_files = {
+    envvars_check_for_varlist_files = {
         'DIAG_HOME':'/HOME',
         'DATADIR':'/A', 'CASENAME': 'B', 'prc_var':'PRECC'}
 
-    @mock.patch.dict('os.environ', os_environ_check_for_varlist_files)
     @mock.patch('os.path.isfile', return_value = True)
     def test_check_for_varlist_files_found(self, mock_isfile):
         # case file is found
@@ -196,11 +200,11 @@ class TestDiagnosticSetUp(unittest.TestCase):
             'freq':'mon'}]
         pod = Diagnostic.__new__(Diagnostic) # bypass __init__
         pod.model = 'A'
+        pod.envvars = self.envvars_check_for_varlist_files
         f = pod._check_for_varlist_files(test_vars)
         self.assertEqual(f['found_files'], ['/A/mon/B.PRECT.mon.nc'])
         self.assertEqual(f['missing_files'], [])
 
-    @mock.patch.dict('os.environ', os_environ_check_for_varlist_files)
     @mock.patch('os.path.isfile', return_value = False)
     def test_check_for_varlist_files_not_found(self, mock_isfile):
         # case file is required and not found
@@ -208,11 +212,11 @@ class TestDiagnosticSetUp(unittest.TestCase):
             'freq':'mon', 'required': True}]
         pod = Diagnostic.__new__(Diagnostic) # bypass __init__
         pod.model = 'A'
+        pod.envvars = self.envvars_check_for_varlist_files
         f = pod._check_for_varlist_files(test_vars)
         self.assertEqual(f['found_files'], [])
         self.assertEqual(f['missing_files'], ['/A/mon/B.PRECT.mon.nc'])
 
-    @mock.patch.dict('os.environ', os_environ_check_for_varlist_files)
     @mock.patch('os.path.isfile', side_effect = [False, True])
     def test_check_for_varlist_files_optional(self, mock_isfile):
         # case file is optional and not found
@@ -220,11 +224,11 @@ class TestDiagnosticSetUp(unittest.TestCase):
             'freq':'mon', 'required': False}]
         pod = Diagnostic.__new__(Diagnostic) # bypass __init__ 
         pod.model = 'A'
+        pod.envvars = self.envvars_check_for_varlist_files
         f = pod._check_for_varlist_files(test_vars)
         self.assertEqual(f['found_files'], [])
         self.assertEqual(f['missing_files'], [])
 
-    @mock.patch.dict('os.environ', os_environ_check_for_varlist_files)
     @mock.patch('os.path.isfile', side_effect = [False, True])
     def test_check_for_varlist_files_alternate(self, mock_isfile):
         # case alternate variable is specified and found
@@ -232,11 +236,48 @@ class TestDiagnosticSetUp(unittest.TestCase):
             'freq':'mon', 'required': True, 'alternates':['PRECC']}]
         pod = Diagnostic.__new__(Diagnostic) # bypass __init__ 
         pod.convention = 'not_CF'
+        pod.envvars = self.envvars_check_for_varlist_files
         f = pod._check_for_varlist_files(test_vars)
         # name_in_model translation now done in DataManager._setup_pod
         self.assertEqual(f['found_files'], ['/A/mon/B.PRECC.mon.nc'])
         self.assertEqual(f['missing_files'], [])
 
+    @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
+        'settings':{}, 'varlist':[]
+        })
+    @mock.patch('os.walk', return_value = [])
+    @mock.patch('os.path.isfile', return_value = False)
+    def test_fingerprint(self, mock_isfile, mock_walk, mock_read_yaml):
+        # changes with POD's env vars, except those that can't affect output
+        pod = Diagnostic('A')
+        pod.found_files = []
+        pod.envvars = {'CASENAME':'B', 'WK_DIR':'/C', 'save_ps':'0'}
+        fp1 = pod._fingerprint()
+        pod.envvars = {'CASENAME':'B', 'WK_DIR':'/D', 'save_ps':'1'}
+        self.assertEqual(pod._fingerprint(), fp1)
+        pod.envvars = {'CASENAME':'B', 'WK_DIR':'/C', 'save_ps':'0', 
+            'tar_threads':'4', 'overlap_fetch_and_run':'1'}
+        self.assertEqual(pod._fingerprint(), fp1)
+        pod.envvars = {'CASENAME':'E', 'WK_DIR':'/C', 'save_ps':'0'}
+        self.assertNotEqual(pod._fingerprint(), fp1)
+
+    @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
+        'settings':{}, 'varlist':[]
+        })
+    @mock.patch('os.walk', return_value = [])
+    @mock.patch('os.path.isfile', return_value = True)
+    @mock.patch('glob.glob', return_value = ['TEST_CODE_ROOT/src/figure_sink.py'])
+    def test_fingerprint_framework_code(self, mock_glob, mock_isfile, mock_walk, mock_read_yaml):
+        # changes with framework modules PODs can import
+        pod = Diagnostic('A')
+        pod.found_files = []
+        pod.envvars = {}
+        with mock.patch('src.shared_diagnostic.open', mock.mock_open(read_data='A'), create=True):
+            fp1 = pod._fingerprint()
+        with mock.patch('src.shared_diagnostic.open', mock.mock_open(read_data='B'), create=True):
+            self.assertNotEqual(pod._fingerprint(), fp1)
+        mock_glob.assert_called_with('TEST_CODE_ROOT/src/*.py')
+
 class TestDiagnosticTearDown(unittest.TestCase):
 
     def setUp(self):
@@ -250,50 +291,94 @@ class TestDiagnosticTearDown(unittest.TestCase):
         temp = util.PathManager(unittest_flag = True)
         temp._reset()
 
-    @mock.patch.dict('os.environ', {'CASENAME':'C'})
     @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
         'settings':{}, 'varlist':[]
         })
-    @mock.patch('os.path.exists', return_value = True)
-    @mock.patch('shutil.copy2')
-    @mock.patch('os.system')
-    @mock.patch('os.remove')
-    def test_make_pod_html(self, mock_remove, mock_system, mock_copy2, mock_exists, mock_read_yaml): 
+    @mock.patch('src.shared_diagnostic.html_report.render_file')
+    def test_make_pod_html(self, mock_render_file, mock_read_yaml): 
         pod = Diagnostic('A')
+        pod.envvars = {'CASENAME':'C'}
         pod.MODEL_WK_DIR = '/B'
         pod.POD_WK_DIR = '/B/A'
         pod._make_pod_html()
-        mock_copy2.assert_has_calls([
-            mock.call('TEST_CODE_ROOT/diagnostics/A/A.html', '/B/A'),
-            mock.call('/B/A/tmp.html', '/B/A/A.html')
-        ])
-        mock_system.assert_has_calls([
-            mock.call('cat /B/A/A.html | sed -e s/casename/C/g > /B/A/tmp.html')
-        ])
+        mock_render_file.assert_called_once_with(
+            'TEST_CODE_ROOT/diagnostics/A/A.html', '/B/A/A.html', 
+            {'casename':'C'}, pod.envvars
+        )
+
+    @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
+        'settings':{}, 'varlist':[]
+        })
+    @mock.patch('src.shared_diagnostic.html_report.render_file')
+    def test_make_pod_html_convective(self, mock_render_file, mock_read_yaml): 
+        pod = Diagnostic('convective_transition_diag')
+        pod.envvars = {'CASENAME':'C', 'RES':'0.25',
+            'BULK_TROPOSPHERIC_TEMPERATURE_MEASURE':'2'}
+        pod.MODEL_WK_DIR = '/B'
+        pod.POD_WK_DIR = '/B/A'
+        pod._make_pod_html()
+        self.assertEqual(mock_render_file.call_args[0][2], {'casename':'C', 
+            '_tave.':'_qsat_int.', '_res=1.00_':'_res=0.25_'})
 
     # ---------------------------------------------------
 
-    @mock.patch.dict('os.environ', {
-        'convert_flags':'-C', 'convert_output_fmt':'png'
-        })
     @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
         'settings':{}, 'varlist':[]
         })
     @mock.patch('glob.glob', return_value = ['A/model/PS/B.ps'])
-    @mock.patch('os.system')
+    @mock.patch('os.system', return_value = 0)
     def test_convert_pod_figures(self, mock_system, mock_glob, mock_read_yaml):
         # assert we munged filenames correctly
         pod = Diagnostic('B') 
+        pod.envvars = {'convert_flags':'-C', 'convert_output_fmt':'png'}
         pod.POD_WK_DIR = 'A'  
         pod._convert_pod_figures()
         mock_system.assert_has_calls([
             mock.call('convert -C A/model/PS/B.ps A/model/B.png')
         ])
 
+    @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
+        'settings':{}, 'varlist':[]
+        })
+    @mock.patch('glob.glob', side_effect = [
+        ['A/model/PS/B.ps'], [], ['A/obs/PS/C.ps'], []
+        ])
+    @mock.patch('os.path.exists', return_value = True)
+    @mock.patch('os.path.getmtime', side_effect = lambda f: {
+        'A/model/PS/B.ps': 2, 'A/model/B.png': 1,
+        'A/obs/PS/C.ps': 1, 'A/obs/C.png': 2
+        }[f])
+    @mock.patch('os.system', return_value = 0)
+    def test_convert_pod_figures_up_to_date(self, mock_system, mock_getmtime, 
+        mock_exists, mock_glob, mock_read_yaml):
+        # only convert figures whose bitmap is older than the PS file
+        pod = Diagnostic('B') 
+        pod.envvars = {'convert_flags':'-C', 'convert_output_fmt':'png'}
+        pod.POD_WK_DIR = 'A'  
+        pod._convert_pod_figures()
+        mock_system.assert_called_once_with('convert -C A/model/PS/B.ps A/model/B.png')
+
     # ---------------------------------------------------
 
-    def test_cleanup_pod_files(self):
-        pass
+    @mock.patch('src.shared_diagnostic.util.read_yaml', return_value = {
+        'settings':{}, 'varlist':[]
+        })
+    @mock.patch('glob.glob', side_effect = [
+        ['A/doc.pdf'], ['B/fig.gif'], [], [], []
+    ])
+    @mock.patch('src.shared_diagnostic.asset_stage.stage_files', 
+        return_value = ['linked', 'unchanged'])
+    def test_cleanup_pod_files(self, mock_stage_files, mock_glob, mock_read_yaml):
+        pod = Diagnostic('A')
+        pod.POD_CODE_DIR = 'A'
+        pod.POD_OBS_DATA = 'B'
+        pod.POD_WK_DIR = 'C'
+        pod.envvars = {'save_ps':'1', 'save_nc':'1', 'link_pod_assets':'0'}
+        pod._cleanup_pod_files()
+        mock_stage_files.assert_called_once_with(
+            [('A/doc.pdf', 'C/doc.pdf'), ('B/fig.gif', 'C/obs/fig.gif')],
+            hardlink=False
+        )
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
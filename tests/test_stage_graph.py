@@ -0,0 +1,114 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import mock # define mock os.environ so we don't mess up real env vars
+from src.stage_graph import Stage, StageGraph
+
+class TestStageGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def touch(self, name, mtime):
+        with open(self.path(name), 'w') as f:
+            f.write(name)
+        os.utime(self.path(name), (mtime, mtime))
+
+    # ---------------------------------------------------
+
+    @mock.patch.dict('os.environ', {'POD_CORES':'3'})
+    def test_max_workers_pod_cores(self):
+        self.assertEqual(StageGraph().max_workers, 3)
+        self.assertEqual(StageGraph(max_workers=2).max_workers, 2)
+
+    def test_dependencies(self):
+        # dependencies from inputs/outputs and explicit 'after'
+        graph = StageGraph()
+        graph.add_stage('A', 'true', outputs=['a.nc'])
+        graph.add_stage('B', 'true', inputs=['a.nc', 'x.nc'], outputs=['b.nc'])
+        graph.add_stage('C', 'true', inputs=['a.nc'], after=['B'])
+        graph.add_stage('D', 'true', inputs=['x.nc'])
+        self.assertEqual(graph.dependencies(),
+            {'A':set(), 'B':set(['A']), 'C':set(['A','B']), 'D':set()})
+
+    def test_dependencies_cycle(self):
+        graph = StageGraph()
+        graph.add_stage('A', 'true', inputs=['b.nc'], outputs=['a.nc'])
+        graph.add_stage('B', 'true', inputs=['a.nc'], outputs=['b.nc'])
+        self.assertRaises(ValueError, graph.dependencies)
+
+    def test_dependencies_undefined(self):
+        graph = StageGraph()
+        graph.add_stage('A', 'true', after=['B'])
+        self.assertRaises(ValueError, graph.dependencies)
+
+    def test_add_stage_duplicate(self):
+        graph = StageGraph()
+        graph.add_stage('A', 'true')
+        self.assertRaises(ValueError, graph.add_stage, 'A', 'false')
+
+    def test_is_up_to_date(self):
+        self.touch('in.nc', 1000)
+        self.touch('out.nc', 2000)
+        stage = Stage('A', 'true', [self.path('in.nc')], [self.path('out.nc')])
+        self.assertTrue(stage.is_up_to_date())
+        self.touch('in.nc', 3000)
+        self.assertFalse(stage.is_up_to_date())
+        # no declared outputs: always run
+        stage = Stage('A', 'true', [self.path('in.nc')])
+        self.assertFalse(stage.is_up_to_date())
+        # missing output
+        stage = Stage('A', 'true', [self.path('in.nc')], [self.path('x.nc')])
+        self.assertFalse(stage.is_up_to_date())
+
+    def test_run_concurrent(self):
+        # independent stages overlap
+        graph = StageGraph(max_workers=2, poll_interval=0.01)
+        graph.add_stage('A', 'sleep 0.3')
+        graph.add_stage('B', 'sleep 0.3')
+        start = time.time()
+        self.assertEqual(graph.run(), [])
+        self.assertLess(time.time() - start, 0.55)
+
+    def test_run_order(self):
+        out = self.path('out.txt')
+        graph = StageGraph(max_workers=4, poll_interval=0.01)
+        graph.add_stage('B', 'echo B >> '+out, after=['A'])
+        graph.add_stage('A', 'sleep 0.1; echo A >> '+out)
+        self.assertEqual(graph.run(), [])
+        with open(out) as f:
+            self.assertEqual(f.read().split(), ['A', 'B'])
+
+    def test_run_failure(self):
+        # dependents of a failed stage aren't run; others are
+        graph = StageGraph(max_workers=1, poll_interval=0.01)
+        graph.add_stage('A', 'exit 1')
+        graph.add_stage('B', 'true', after=['A'])
+        graph.add_stage('C', 'true')
+        self.assertEqual(graph.run(), ['A', 'B'])
+        self.assertEqual([s.status for s in graph.stages],
+            ['failed', 'not run', 'succeeded'])
+
+    def test_run_skip_up_to_date(self):
+        self.touch('in.nc', 1000)
+        self.touch('out.nc', 2000)
+        graph = StageGraph(poll_interval=0.01)
+        graph.add_stage('A', 'exit 1',
+            inputs=[self.path('in.nc')], outputs=[self.path('out.nc')])
+        graph.add_stage('B', 'true', inputs=[self.path('out.nc')])
+        self.assertEqual(graph.run(), [])
+        self.assertEqual([s.status for s in graph.stages],
+            ['up to date', 'succeeded'])
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import src.time_subset as time_subset
+
+class TestTimeSubset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_time_index_range(self):
+        years = [1998, 1999, 1999, 2000, 2001, 2002]
+        self.assertEqual(time_subset._time_index_range(years, 1999, 2001), (1, 5))
+        self.assertEqual(time_subset._time_index_range(years, 1900, 2100), (0, 6))
+        self.assertEqual(time_subset._time_index_range(years, 2001, 2001), (4, 5))
+        self.assertEqual(time_subset._time_index_range(years, 2010, 2020), (6, 6))
+        self.assertEqual(time_subset._time_index_range([], 2000, 2001), (0, 0))
+
+    @mock.patch('src.time_subset.netCDF4', None)
+    def test_subset_no_netcdf4(self):
+        # without netCDF4, link to the original file
+        in_path = os.path.join(self.tmp_dir, 'A.pr.day.nc')
+        out_path = os.path.join(self.tmp_dir, 'subset', 'day', 'A.pr.day.nc')
+        with open(in_path, 'w') as f:
+            f.write('data')
+        self.assertFalse(time_subset.subset_time_range(in_path, out_path, 2000, 2001))
+        self.assertTrue(os.path.islink(out_path))
+        self.assertEqual(os.path.realpath(out_path), os.path.realpath(in_path))
+        # calling again replaces the link
+        self.assertFalse(time_subset.subset_time_range(in_path, out_path, 2000, 2001))
+        self.assertTrue(os.path.islink(out_path))
+
+# ---------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
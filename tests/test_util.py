@@ -21,39 +21,50 @@ class TestUtil(unittest.TestCase):
     def test_makefilepath(self):
         pass
 
+    def test_parse_memory_size(self):
+        self.assertEqual(util.parse_memory_size(2), 2 * 2**20)
+        self.assertEqual(util.parse_memory_size('500M'), 500 * 2**20)
+        self.assertEqual(util.parse_memory_size('16GB'), 16 * 2**30)
+        self.assertEqual(util.parse_memory_size('1.5g'), int(1.5 * 2**30))
+
     # ---------------------------------------------------
     
-    @mock.patch.dict('os.environ', {'TEST_OVERWRITE': 'A'})
+    @mock.patch.dict('os.environ', {})
     def test_setenv_overwrite(self):
         test_d = {'TEST_OVERWRITE': 'A'}
         util.setenv('TEST_OVERWRITE','B', test_d, overwrite = False)
         self.assertEqual(test_d['TEST_OVERWRITE'], 'A')
-        self.assertEqual(os.environ['TEST_OVERWRITE'], 'A')
+        self.assertNotIn('TEST_OVERWRITE', os.environ)
 
     @mock.patch.dict('os.environ', {})
     def test_setenv_str(self):
         test_d = {}
         util.setenv('TEST_STR','B', test_d)
         self.assertEqual(test_d['TEST_STR'], 'B')
-        self.assertEqual(os.environ['TEST_STR'], 'B')
+        self.assertNotIn('TEST_STR', os.environ)
 
     @mock.patch.dict('os.environ', {})
     def test_setenv_int(self):
         test_d = {}        
         util.setenv('TEST_INT',2019, test_d)
-        self.assertEqual(test_d['TEST_INT'], 2019)
-        self.assertEqual(os.environ['TEST_INT'], '2019')
+        self.assertEqual(test_d['TEST_INT'], '2019')
+        self.assertNotIn('TEST_INT', os.environ)
 
     @mock.patch.dict('os.environ', {})
     def test_setenv_bool(self):
         test_d = {}
         util.setenv('TEST_TRUE',True, test_d)
-        self.assertEqual(test_d['TEST_TRUE'], True)
-        self.assertEqual(os.environ['TEST_TRUE'], '1')
+        self.assertEqual(test_d['TEST_TRUE'], '1')
 
         util.setenv('TEST_FALSE',False, test_d)
-        self.assertEqual(test_d['TEST_FALSE'], False)
-        self.assertEqual(os.environ['TEST_FALSE'], '0')
+        self.assertEqual(test_d['TEST_FALSE'], '0')
+        self.assertNotIn('TEST_TRUE', os.environ)
+
+    @mock.patch.dict('os.environ', {'A':'B', 'C':'D'}, clear=True)
+    def test_get_subprocess_env(self):
+        env = util.get_subprocess_env({'C':'E', 'F':'G'})
+        self.assertEqual(env, {'A':'B', 'C':'E', 'F':'G'})
+        self.assertEqual(os.environ['C'], 'D')
 
     # ---------------------------------------------------
 
@@ -322,14 +333,13 @@ class TestMDTFArgParsing(unittest.TestCase):
         config = self.config_test.copy()
         util.set_mdtf_env_vars(config)
         self.assertEqual(config['envvars']['E'], 'F')
-        self.assertEqual(os.environ['E'], 'F')        
+        self.assertNotIn('E', os.environ)
 
     def test_sparse_mdtf_args_config_rgb(self):
         # set path to /RGB from os.environ
         config = self.config_test.copy()
         util.set_mdtf_env_vars(config)
         self.assertEqual(config['envvars']['RGB'], 'TEST_CODE_ROOT/src/rgb')
-        self.assertEqual(os.environ['RGB'], 'TEST_CODE_ROOT/src/rgb')
 
 
 # ---------------------------------------------------